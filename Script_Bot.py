@@ -1,93 +1,37 @@
+import heapq
+import json
 import os
+import re
+import signal
+import socket
+import threading
 import time
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
-import gspread
-from google.oauth2.service_account import Credentials
-import pandas as pd
 import pytz
 import requests
 import config
-import re
-import tempfile
+import budget
+import dispatcher
+import fichiers
+import journal
+import lazy
+import metrics
+import transport
+import media
+import media_cache
+import planning_schema
+import rattrapage
+import sheets
+import store
+from media import extract_drive_file_id
+
+# pandas n'est importé qu'au premier usage : une heure sans envoi n'en a pas besoin
+pd = lazy.module("pandas")
 
 # ======================
 # Helpers / Parameters
 # ======================
-DRIVE_FILE_RE = re.compile(
-    r"(?:https?://)?(?:drive\.google\.com)/(?:file/d/([a-zA-Z0-9_-]+)|open\?id=([a-zA-Z0-9_-]+))"
-)
-
-def extract_drive_file_id(url: str) -> str:
-    """
-    Extrait l'ID Google Drive à partir de liens de type:
-    - https://drive.google.com/file/d/<FILE_ID>/view?...
-    - https://drive.google.com/open?id=<FILE_ID>
-    Retourne "" si non reconnu.
-    """
-    if not url:
-        return ""
-    m = DRIVE_FILE_RE.search(url)
-    if not m:
-        return ""
-    return m.group(1) or m.group(2) or ""
-
-def download_drive_file_to_temp(file_id: str) -> str:
-    """
-    Télécharge un fichier Google Drive public via 'uc?export=download&id=...' dans un fichier temporaire.
-    Gère le token de confirmation pour les redirections/scan antivirus de Drive.
-    Retourne le chemin local du fichier temporaire (à supprimer ensuite).
-    Lève une Exception en cas d'échec.
-    """
-    if not file_id:
-        raise ValueError("Missing Google Drive file id")
-
-    session = requests.Session()
-    base = "https://drive.google.com/uc?export=download"
-    params = {"id": file_id}
-    r = session.get(base, params=params, stream=True, allow_redirects=True, timeout=15)
-
-    # Si Drive renvoie une page HTML de confirmation, récupérer le token 'confirm'
-    def _find_confirm_token(content_text: str):
-        # cherche un paramètre confirm=XYZ dans la page
-        m = re.search(r"confirm=([0-9A-Za-z_]+)", content_text)
-        return m.group(1) if m else None
-
-    if ("text/html" in r.headers.get("content-type", "")) and r.text:
-        token = _find_confirm_token(r.text)
-        if token:
-            params["confirm"] = token
-            r = session.get(base, params=params, stream=True, allow_redirects=True, timeout=15)
-
-    r.raise_for_status()
-
-    # Déterminer une extension selon le content-type si possible
-    ctype = r.headers.get("content-type", "")
-    suffix = ""
-    if "jpeg" in ctype:
-        suffix = ".jpg"
-    elif "png" in ctype:
-        suffix = ".png"
-    elif "webp" in ctype:
-        suffix = ".webp"
-    elif "gif" in ctype:
-        suffix = ".gif"
-    else:
-        # inconnu : tente .bin (Telegram s’en fiche si c’est bien une image)
-        suffix = ".bin"
-
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    try:
-        for chunk in r.iter_content(1024 * 64):
-            if chunk:
-                tmp.write(chunk)
-        tmp.flush()
-        return tmp.name
-    except Exception:
-        tmp.close()
-        os.unlink(tmp.name)
-        raise
-
-
 def _tz():
     try:
         return pytz.timezone(config.FUSEAU_HORAIRE)
@@ -95,66 +39,140 @@ def _tz():
         return pytz.timezone("Europe/Paris")
 
 TELEGRAM_TOKEN = getattr(config, "TELEGRAM_TOKEN", os.getenv("TELEGRAM_TOKEN", ""))
-if not TELEGRAM_TOKEN:
-    raise RuntimeError("TELEGRAM_TOKEN manquant (config.py ou variable d'env).")
 
-TELEGRAM_TIMEOUT = getattr(config, "TELEGRAM_TIMEOUT", 10)  # seconds
+def _verifier_token():
+    # vérifié au lancement (et non à l'import : le module reste importable sans token, ex. bench)
+    if not TELEGRAM_TOKEN:
+        raise RuntimeError("TELEGRAM_TOKEN manquant (config.py ou variable d'env).")
+
 TELEGRAM_MAX_RETRIES = getattr(config, "TELEGRAM_MAX_RETRIES", 3)
 SEND_WINDOW_MINUTES = getattr(config, "SEND_WINDOW_MINUTES", None)  # None = pas de fenêtre
+TELEGRAM_WORKERS = getattr(config, "TELEGRAM_WORKERS", 8)
+TELEGRAM_RATE_GLOBAL = getattr(config, "TELEGRAM_RATE_GLOBAL", 30)  # msg/s
+TELEGRAM_RATE_CHAT = getattr(config, "TELEGRAM_RATE_CHAT", 1)       # msg/s par chat
+PLANNING_RANGE_GAP = getattr(config, "PLANNING_RANGE_GAP", 5)               # écart (lignes) fusionné en une plage
+PLANNING_RANGES_PAR_APPEL = getattr(config, "PLANNING_RANGES_PAR_APPEL", 100)
+PLANNING_STORE = getattr(config, "PLANNING_STORE", "")  # chemin SQLite ; vide = lecture directe de la feuille
+
+# Plusieurs workers : chats répartis par hash du chat_id, lignes réservées par bail avant envoi
+BOT_SHARD_COUNT = max(1, int(getattr(config, "BOT_SHARD_COUNT", 1) or 1))
+BOT_SHARD_INDEX = int(getattr(config, "BOT_SHARD_INDEX", 0) or 0) % BOT_SHARD_COUNT
+BOT_WORKER_ID = (getattr(config, "BOT_WORKER_ID", "") or f"{socket.gethostname()}-{os.getpid()}").replace(":", "-")
+BOT_LEASES = getattr(config, "BOT_LEASES", BOT_SHARD_COUNT > 1)   # worker unique : pas de bail
+LEASE_MINUTES = getattr(config, "LEASE_MINUTES", 10)    # durée du bail (+ durée estimée du lot)
+LEASE_SETTLE_S = getattr(config, "LEASE_SETTLE_S", 2)   # attente avant relecture des baux posés
+LEASE_MARGE_S = getattr(config, "LEASE_MARGE_S", 60)    # plus aucun envoi lancé moins de N s avant l'expiration du bail
 
-API_BASE = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}"
+def _dans_shard(chat_id):
+    return planning_schema.shard(chat_id, BOT_SHARD_COUNT) == BOT_SHARD_INDEX
 
-def col_idx_to_a1(idx1):
-    # idx1 is 1-based index -> column letters (A, B, ... AA, AB ...)
-    s = ""
-    while idx1 > 0:
-        idx1, rem = divmod(idx1 - 1, 26)
-        s = chr(65 + rem) + s
-    return s
+def _api(method):
+    return transport.get_transport().telegram_url(TELEGRAM_TOKEN, method)
 
-def localize_safe(series_dt_naive, tz):
-    return (series_dt_naive
-            .dt.tz_localize(tz, ambiguous="infer", nonexistent="shift_forward"))
+localize_safe = planning_schema.localize_safe
+
+def parse_planning_dt(df, tz):
+    """
+    Datetime localisée de chaque ligne encore à envoyer (envoye == "non" ou bail expiré, message et date
+    non vides, chat de ce shard), NaT pour les autres lignes, qui ne sont pas parsées.
+    Heure prévue reprise de la colonne scheduled_at (epoch, lignes lues depuis le store) quand elle est
+    renseignée ; sinon parse vectorisé au format connu, repli ligne à ligne (format libre) sur les valeurs hors format.
+    """
+    out = pd.Series(pd.NaT, index=df.index, dtype=pd.DatetimeTZDtype(tz=tz))
+    date_s = df["date"].astype(str).str.strip()
+    cand = (
+        planning_schema.disponibles(df["envoye"], time.time())
+        & (df["message"].astype(str).str.strip() != "")
+        & (date_s != "")
+    )
+    if BOT_SHARD_COUNT > 1:
+        cand &= df["chat_id"].map(_dans_shard).astype(bool)
+    if not cand.any():
+        return out
+
+    if "scheduled_at" in df.columns:
+        ep = df.loc[cand, "scheduled_at"].dropna()
+        if not ep.empty:
+            out[ep.index] = pd.to_datetime(ep.astype("int64"), unit="s", utc=True).dt.tz_convert(tz)
+            cand &= df["scheduled_at"].isna()
+            if not cand.any():
+                return out
+
+    dt = planning_schema.parse_dt_naive(date_s[cand], df.loc[cand, "heure"]).dropna()
+    if not dt.empty:
+        out[dt.index] = localize_safe(dt.astype("datetime64[ns]"), tz)
+    return out
 
 def send_telegram_message(chat_id, text):
-    url = f"{API_BASE}/sendMessage"
+    url = _api("sendMessage")
     payload = {"chat_id": chat_id, "text": text, "disable_web_page_preview": False}
     return _post_with_retry(url, payload)
 
 def send_telegram_photo(chat_id, photo, caption=None, is_file=False):
     """
-    photo: soit une URL (str), soit un fichier binaire (file-like) si is_file=True
+    photo: soit une URL (str) ou un file_id Telegram, soit un fichier binaire (file-like) si is_file=True,
+           soit une source media.BufferSource / media.DriveSource (envoyée en flux)
     """
-    api = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendPhoto"
+    success, err, _ = _send_photo(chat_id, photo, caption=caption, is_file=is_file)
+    return success, err
+
+def _send_photo(chat_id, photo, caption=None, is_file=False):
+    """Comme send_telegram_photo, mais retourne aussi le file_id Telegram de la photo envoyée."""
+    url = _api("sendPhoto")
     data = {"chat_id": chat_id}
     if caption:
         data["caption"] = caption
 
-    try:
-        if is_file:
-            files = {"photo": photo}  # file-like object
-            r = requests.post(api, data=data, files=files, timeout=20)
-        else:
-            data["photo"] = photo     # URL
-            r = requests.post(api, data=data, timeout=20)
+    if isinstance(photo, (media.BufferSource, media.DriveSource)):
+        # corps multipart produit en flux (pas de fichier temporaire)
+        success, err, result = _telegram_call(url, data, media_source=photo, kind="upload")
+    elif is_file:
+        success, err, result = _telegram_call(url, data, files={"photo": photo}, kind="upload")
+    else:
+        data["photo"] = photo     # URL ou file_id
+        success, err, result = _telegram_call(url, data)
+
+    file_id = ""
+    if success and isinstance(result, dict):
+        sizes = result.get("photo") or []
+        if sizes:
+            file_id = sizes[-1].get("file_id", "")  # la plus grande taille
+    return success, err, file_id
 
-        if r.status_code == 200:
-            return True, ""
-        return False, f"{r.status_code}:{r.text}"
-    except Exception as e:
-        return False, f"exception:{e}"
 
+def _post_with_retry(url, payload, files=None, kind="telegram"):
+    success, err, _ = _telegram_call(url, payload, files=files, kind=kind)
+    return success, err
 
-def _post_with_retry(url, payload):
-    # Retries for 429 / certain 5xx
+def _telegram_call(url, payload, files=None, kind="telegram", media_source=None):
+    """
+    Appel Bot API avec retries (429 / 5xx). Retourne (success, err, result).
+    media_source: image envoyée en multipart streamé (champ "photo"), ré-ouverte à chaque essai.
+    """
+    http = transport.get_transport()
     for attempt in range(1, TELEGRAM_MAX_RETRIES + 1):
+        if files:
+            # rembobine les fichiers pour un nouvel essai
+            for f in files.values():
+                if hasattr(f, "seek"):
+                    f.seek(0)
+        flux = None
         try:
-            r = requests.post(url, data=payload, timeout=TELEGRAM_TIMEOUT)
+            if media_source is not None:
+                flux = media_source.open()
+                body = media.MultipartBody(payload, "photo", flux)
+                r = http.post(url, kind=kind, data=body, headers={"Content-Type": body.content_type})
+            else:
+                r = http.post(url, kind=kind, data=payload, files=files)
         except requests.RequestException as e:
             if attempt >= TELEGRAM_MAX_RETRIES:
-                return False, f"request_exception:{e}"
+                return False, f"request_exception:{e}", None
+            metrics.incr("telegram_retries_total", motif="reseau")
             time.sleep(2 ** attempt)
             continue
+        finally:
+            if flux is not None:
+                flux.close()
 
         try:
             data = r.json()
@@ -162,60 +180,549 @@ def _post_with_retry(url, payload):
             data = {"ok": False, "error_code": r.status_code, "description": "invalid_json"}
 
         if r.status_code == 429:
+            metrics.incr("telegram_429_total")
             retry_after = 1
             try:
                 retry_after = int(data.get("parameters", {}).get("retry_after", 1))
             except Exception:
                 pass
+            if dispatcher.dans_worker():
+                # envoi concurrent : seul ce chat est mis en pause
+                raise dispatcher.RetryAfter(retry_after)
             time.sleep(retry_after + 1)
             continue
 
         if r.status_code >= 500 and attempt < TELEGRAM_MAX_RETRIES:
+            metrics.incr("telegram_retries_total", motif="5xx")
             time.sleep(2 ** attempt)
             continue
 
         if r.ok and data.get("ok", False):
-            return True, "ok"
+            return True, "ok", data.get("result")
 
         # Other client errors: no retry
-        return False, f"{data.get('error_code','?')}:{data.get('description','unknown')}"
+        return False, f"{data.get('error_code','?')}:{data.get('description','unknown')}", None
+
+    return False, "max_retries_exceeded", None
+
+_file_ids = None
+_sondes = None
+_prefetcher = None  # media.Prefetcher du run en cours
+
+def get_file_id_cache():
+    global _file_ids
+    if _file_ids is None:
+        _file_ids = media_cache.FileIdCache()
+    return _file_ids
+
+def get_sonde_cache():
+    global _sondes
+    if _sondes is None:
+        _sondes = media_cache.SondeCache()
+    return _sondes
+
+def sauver_caches_media():
+    get_file_id_cache().save()
+    get_sonde_cache().save()
+
+def sonder_image(url):
+    """
+    URL directe servant une image (HEAD, content-type image/*) ? Résultat en cache, échecs compris
+    (SONDE_TTL_H / SONDE_TTL_ECHEC_MIN) : une URL n'est sondée qu'une fois pour tous les chats et runs.
+    """
+    sondes = get_sonde_cache()
+    v = sondes.get(url)
+    if v is None:
+        with sondes.verrou(url):   # les autres chats attendent le résultat de la sonde en cours
+            v = sondes.get(url)
+            if v is None:
+                metrics.incr("sonde_image_total", resultat="miss")
+                ctype, motif = "", ""
+                try:
+                    h = transport.get_transport().head(url, allow_redirects=True)
+                    ctype = h.headers.get("content-type", "")
+                    if not ctype.startswith("image/"):
+                        motif = f"http {h.status_code}" if not h.ok else "pas une image"
+                except Exception as e:
+                    motif = type(e).__name__
+                sondes.put(url, not motif, ctype, motif)
+                if motif:
+                    print(f"⚠️ URL d'image refusée ({motif}), envoyée en lien : {url}")
+                return not motif
+    metrics.incr("sonde_image_total", resultat="hit")
+    return bool(v["ok"])
+
+def _file_id_invalide(err):
+    e = str(err).lower()
+    return "file identifier" in e or "wrong remote file" in e or "file reference" in e
+
+def _cle_image(url):
+    """(id Drive ou "", clé du cache de file_id) d'une image."""
+    drive_id = extract_drive_file_id(url)
+    return drive_id, (f"drive:{drive_id}" if drive_id else f"url:{url}")
+
+def envoyer_image(chat_id, caption, url):
+    """
+    Envoie une image (lien Drive ou URL directe), via le file_id Telegram en cache si connu.
+    Retourne (success, err).
+    """
+    cache = get_file_id_cache()
+    drive_id, key = _cle_image(url)
+
+    tg_file_id = cache.get(key)
+    metrics.incr("file_id_cache_total", resultat="hit" if tg_file_id else "miss")
+    if tg_file_id:
+        success, err, _ = _send_photo(chat_id, tg_file_id, caption=caption)
+        if success or not _file_id_invalide(err):
+            return success, err
+        cache.discard(key)  # file_id périmé -> nouvel upload
+
+    # un seul upload par image : les autres chats attendent le file_id
+    with cache.verrou(key):
+        tg_file_id = cache.get(key)
+        if tg_file_id:
+            success, err, _ = _send_photo(chat_id, tg_file_id, caption=caption)
+            return success, err
+
+        if drive_id:
+            # Cas Google Drive: image pré-téléchargée si dispo, sinon flux direct Drive -> Telegram
+            prefetcher = _prefetcher
+            source = prefetcher.take(drive_id) if prefetcher is not None else None
+            if source is None:
+                source = media.DriveSource(drive_id)
+            try:
+                success, err, tg_file_id = _send_photo(chat_id, source, caption=caption)
+            finally:
+                # tampon rendu au budget après la tentative, réussie ou non (429, échec) :
+                # un nouvel essai relit Drive en flux direct
+                if prefetcher is not None:
+                    prefetcher.release(drive_id)
+        else:
+            # Pas un lien Drive -> tentative "URL directe"
+            if not sonder_image(url):
+                # fallback : on envoie en texte + lien
+                text_to_send = f"{caption}\n{url}" if url else caption
+                return send_telegram_message(chat_id, text_to_send)
+            success, err, tg_file_id = _send_photo(chat_id, url, caption=caption)
+
+        if success and tg_file_id:
+            cache.put(key, tg_file_id)
+        return success, err
+
+def envoyer_ligne(row):
+    """
+    Envoie une ligne du planning (texte, image Drive ou image URL).
+    Retourne (success, err). Laisse passer dispatcher.RetryAfter (429 en mode concurrent).
+    """
+    chat_id = row["chat_id"]
+    raw_text = str(row["message"]).strip()  # on teste le "message" du planning, pas le texte après append url
+    fmt = str(row["format"]).strip().lower()
+    url = str(row["url"]).strip()
+
+    try:
+        if fmt == "image" and url:
+            success, err = envoyer_image(chat_id, raw_text, url)
+        else:
+            text_to_send = raw_text
+            if url:
+                text_to_send = f"{text_to_send}\n{url}"
+            success, err = send_telegram_message(chat_id, text_to_send)
+    except dispatcher.RetryAfter:
+        raise
+    except Exception as e:
+        success = False
+        err = f"exception:{e}"
+
+    return success, err
+
+def album_possible(row):
+    """Image envoyable dans un album : légende assez courte, file_id en cache ou URL directe (pas de téléversement)."""
+    if len(str(row["message"]).strip()) > rattrapage.LEGENDE_MAX:
+        return False
+    url = str(row["url"]).strip()
+    drive_id, key = _cle_image(url)
+    if drive_id:
+        return get_file_id_cache().get(key) is not None
+    sonde = get_sonde_cache().get(url)   # URL déjà refusée : envoyée seule, en lien
+    return sonde is None or bool(sonde["ok"])
+
+def envoyer_album(chat_id, lignes):
+    """
+    Images de plusieurs lignes en un sendMediaGroup (file_id en cache, sinon URL directe).
+    Retourne (success, err) ; les file_id des images envoyées par URL sont mis en cache.
+    """
+    cache = get_file_id_cache()
+    items, cles = [], []
+    for _, row in lignes:
+        _, key = _cle_image(str(row["url"]).strip())
+        file_id = cache.get(key)
+        item = {"type": "photo", "media": file_id or str(row["url"]).strip()}
+        legende = str(row["message"]).strip()
+        if legende:
+            item["caption"] = legende
+        items.append(item)
+        cles.append(None if file_id else key)
+    payload = {"chat_id": chat_id, "media": json.dumps(items, ensure_ascii=False)}
+    success, err, result = _telegram_call(_api("sendMediaGroup"), payload)
+    if success and isinstance(result, list):
+        for key, msg in zip(cles, result):
+            sizes = (msg or {}).get("photo") or []
+            if key and sizes:
+                cache.put(key, sizes[-1].get("file_id", ""))
+    return success, err
 
-    return False, "max_retries_exceeded"
+def envoyer_paquet(paquet, apres_envoi=None):
+    """
+    Envoie un rattrapage.Paquet : un appel (texte fusionné ou album) ; s'il est refusé (hors 429),
+    repli ligne à ligne au rythme d'un chat. Les lignes envoyées sont notées dans paquet.faits
+    (une reprise après 429 ne les renvoie pas). Retourne (success, err) : succès si toutes sont parties.
+    """
+    chat_id = paquet.lignes[0][1]["chat_id"]
+    err = "ok"
+    if not paquet.repli:
+        try:
+            if paquet.genre == "texte":
+                success, err = send_telegram_message(chat_id, paquet.texte)
+            else:
+                success, err = envoyer_album(chat_id, paquet.lignes)
+        except dispatcher.RetryAfter:
+            raise
+        except Exception as e:
+            success, err = False, f"exception:{e}"
+        metrics.incr("rattrapage_appels_total", genre=paquet.genre, statut="ok" if success else "repli")
+        if success:
+            for ws_row_num, row in paquet.lignes:
+                paquet.faits.add(ws_row_num)
+                if apres_envoi is not None:
+                    apres_envoi(ws_row_num, row)
+            return True, err
+        print(f"↩️ Envoi groupé refusé ({paquet.genre}, {len(paquet)} ligne(s)) -> chat_id={chat_id} ; {err} ; envoi ligne à ligne")
+        paquet.repli = True
+
+    for ws_row_num, row in paquet.lignes:
+        if ws_row_num in paquet.faits:
+            continue
+        if paquet.faits:
+            time.sleep(1.0 / max(TELEGRAM_RATE_CHAT, 0.01))   # rythme par chat (un seul jeton pris pour le paquet)
+        success, err = envoyer_ligne(row)
+        if not success:
+            return False, err
+        paquet.faits.add(ws_row_num)
+        if apres_envoi is not None:
+            apres_envoi(ws_row_num, row)
+    return True, err
 
 # ======================
-# Main
+# Lecture fenêtrée du planning
 # ======================
+DATE_ISO_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+HEURE_RE = re.compile(r"^\d{2}:\d{2}:\d{2}$")
 
-def lancer_bot():
-    tz = _tz()
+def _lignes_candidates(dates, envoyes, date_max, date_min="", chats=None, now_epoch=None):
+    """
+    Numéros de ligne (feuille, 1-based) pouvant être dus : envoye == "non" (ou bail expiré)
+    et date_min <= date <= date_max ; si chats est fourni, seulement les chats de ce shard.
+    Si la colonne date est triée (écrite ainsi par Script_Planning), le parcours est borné par bisection.
+    Les dates hors format ISO restent candidates (parse tolérant ensuite).
+    """
+    now_epoch = time.time() if now_epoch is None else now_epoch
+    n = max(len(dates), len(envoyes))
+    dates = [str(d).strip() for d in dates] + [""] * (n - len(dates))
+    envoyes = [str(e) for e in envoyes] + [""] * (n - len(envoyes))
+
+    lo, hi = 0, n
+    if all(DATE_ISO_RE.match(d) for d in dates) and all(dates[i] <= dates[i + 1] for i in range(n - 1)):
+        lo = bisect_left(dates, date_min) if date_min else 0
+        hi = bisect_right(dates, date_max)
+
+    rows = []
+    for i in range(lo, hi):
+        d = dates[i]
+        if not d or not planning_schema.est_disponible(envoyes[i], now_epoch):
+            continue
+        if chats is not None and BOT_SHARD_COUNT > 1 and not _dans_shard(chats[i] if i < len(chats) else ""):
+            continue
+        if DATE_ISO_RE.match(d) and (d > date_max or (date_min and d < date_min)):
+            continue
+        rows.append(i + 2)
+    return rows
+
+def _plages(rows, gap=0):
+    """Regroupe des numéros de ligne triés en plages (début, fin) ; écarts <= gap fusionnés."""
+    plages = []
+    for r in rows:
+        if plages and r - plages[-1][1] <= gap + 1:
+            plages[-1][1] = r
+        else:
+            plages.append([r, r])
+    return [tuple(p) for p in plages]
+
+def lire_colonnes_suivi(ws):
+    """
+    En-tête + colonnes date / envoye / chat_id (listes de même longueur ; chats None si colonne absente).
+    header None si planning vide.
+    """
+    header = ws.row_values(1)
+    if not header:
+        return None, [], [], None
+    noms = ["date", "envoye"] + (["chat_id"] if "chat_id" in header else [])
+    cols = planning_schema.colonnes(ws, header, noms)
+    return header, cols[0], cols[1], (cols[2] if len(cols) > 2 else None)
+
+def _echues(rows, dates, heures, now_local):
+    """
+    Lignes candidates dont date + heure <= maintenant, par simple comparaison de chaînes (format écrit
+    par Script_Planning), sans DataFrame. Une date ou heure hors format reste candidate (parse complet ensuite).
+    """
+    now_s = now_local.strftime("%Y-%m-%d %H:%M:%S")
+    out = []
+    for r in rows:
+        d, h = dates[r - 2].strip(), heures[r - 2].strip()
+        if DATE_ISO_RE.match(d) and HEURE_RE.match(h) and f"{d} {h}" > now_s:
+            continue
+        out.append(r)
+    return out
+
+def lire_plages(ws, header, rows):
+    """Lecture groupée (batch_get) des lignes demandées (numéros de ligne triés). index = numéro de ligne - 2."""
+    plages = _plages(rows, PLANNING_RANGE_GAP)
+    last_l = planning_schema.lettre_colonne(len(header))
+    data, index = [], []
+    for k in range(0, len(plages), PLANNING_RANGES_PAR_APPEL):
+        lot = plages[k:k + PLANNING_RANGES_PAR_APPEL]
+        res = ws.batch_get([f"A{a}:{last_l}{b}" for a, b in lot])
+        for (a, b), vr in zip(lot, res):
+            for j in range(b - a + 1):
+                vals = list(vr[j])[:len(header)] if j < len(vr) else []
+                data.append(vals + [""] * (len(header) - len(vals)))
+                index.append(a + j - 2)
+    return planning_schema.typer(pd.DataFrame(data, columns=header, index=index)), len(plages)
 
-    # Auth Sheets
-    scope = [
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    creds = Credentials.from_service_account_file(config.CHEMIN_CLE_JSON, scopes=scope)
-    client = gspread.authorize(creds)
+def _bornes_dates(now_local, jusqua=None):
+    """(date_min, date_max) ISO des lignes pouvant être dues jusqu'à `jusqua` (défaut : maintenant)."""
+    date_max = (jusqua or now_local).strftime("%Y-%m-%d")
+    date_min = ""
+    if SEND_WINDOW_MINUTES is not None:
+        date_min = (now_local - timedelta(minutes=int(SEND_WINDOW_MINUTES))).strftime("%Y-%m-%d")
+    return date_min, date_max
 
-    # Open planning
-    ws_planning = client.open(config.FICHIER_PLANNING).worksheet(config.FEUILLE_PLANNING)
+def lire_planning_due(ws, now_local):
+    """
+    Lit seulement les lignes du planning pouvant être dues : en-tête + colonnes date/heure/envoye,
+    puis lecture groupée (batch_get) des plages de lignes échues.
+    Retourne (header, df, nb_lignes) avec df.index = numéro de ligne - 2 ; header None si planning vide,
+    df None si aucune ligne n'est due (décidé sur les colonnes seules, sans DataFrame).
+    """
+    header = ws.row_values(1)
+    if not header:
+        return None, None, 0
+    if "date" not in header or "envoye" not in header:
+        # colonnes attendues absentes : lecture complète
+        header, df = planning_schema.lire_par_blocs(ws, header)
+        df.index = df.index - 2
+        return header, df, len(df)
 
-    # Read all records + header to compute row numbers
-    rows = ws_planning.get_all_values()
+    noms = ["date", "envoye"] + [c for c in ("chat_id", "heure") if c in header]
+    cols = dict(zip(noms, planning_schema.colonnes(ws, header, noms)))
+    dates, envoyes = cols["date"], cols["envoye"]
+    date_min, date_max = _bornes_dates(now_local)
+    rows = _lignes_candidates(dates, envoyes, date_max, date_min, cols.get("chat_id"))
+    if "heure" in cols:
+        rows = _echues(rows, dates, cols["heure"], now_local)
     if not rows:
-        print("Planning vide.")
-        return
-    header = rows[0]
-    data_rows = rows[1:]
-    if not data_rows:
-        print("Aucune ligne planning.")
+        return header, None, len(dates)
+    df, nb_plages = lire_plages(ws, header, rows)
+    print(f"[DEBUG] Lecture fenêtrée : {len(rows)} ligne(s) candidate(s) / {len(dates)}, {nb_plages} plage(s)")
+    return header, df, len(dates)
+
+def lire_planning_store(local_store, ws, now_local, tz, jusqua=None):
+    """
+    Comme lire_planning_due, mais via le store SQLite (requête sur index, sans appel Sheets).
+    Le store est amorcé depuis la feuille s'il est vide (premier run, cache perdu).
+    jusqua : borne haute de l'heure prévue (défaut : maintenant).
+    """
+    if local_store.vide():
+        header, df = planning_schema.lire_par_blocs(ws, tz=tz)   # par blocs, typé (scheduled_at compris)
+        if not header:
+            return None, None, 0
+        local_store.remplacer(header, df, tz)
+        print(f"[DEBUG] Store amorcé depuis la feuille ({len(df)} ligne(s))")
+        del df
+
+    debut = None
+    if SEND_WINDOW_MINUTES is not None:
+        debut = (now_local - timedelta(minutes=int(SEND_WINDOW_MINUTES))).timestamp()
+    fin = (jusqua or now_local).timestamp()
+    if not local_store.a_envoyer(fin, debut):
+        return local_store.header(), None, local_store.nb_lignes()
+    df = local_store.lignes_dues(fin, debut)
+    return local_store.header(), df, local_store.nb_lignes()
+
+# Clé chat_id|date|heure attendue de chaque ligne lue ce run (numéro de ligne -> clé). Script_Planning
+# peut insérer ou supprimer des lignes pendant un run : chaque écriture par numéro de ligne est d'abord
+# recalée sur les clés relues de la feuille.
+_cles_lignes = {}
+
+def noter_cles(df):
+    """Retient la clé de chaque ligne de df (index = numéro de ligne - 2)."""
+    if len(df):
+        cols = [planning_schema.texte(df[c]).str.strip() for c in ("chat_id", "date", "heure")]
+        _cles_lignes.update(zip((int(i) + 2 for i in df.index), cols[0] + "|" + cols[1] + "|" + cols[2]))
+
+def recaler(ws, updates):
+    """
+    updates [(numéro de ligne, valeur)] recalées sur la feuille actuelle (clés relues, une lecture groupée) :
+    ligne déplacée -> son nouveau numéro, ligne disparue -> écriture abandonnée. Ligne de clé inconnue : inchangée.
+    """
+    if not any(r in _cles_lignes for r, _ in updates):
+        return updates
+    sheets.oublier_lectures(getattr(ws, "client", None))
+    header = ws.row_values(1)
+    if not header or any(c not in header for c in ("chat_id", "date", "heure")):
+        return updates
+    cles = ["|".join(v.strip() for v in t) for t in zip(*planning_schema.colonnes(ws, header, ["chat_id", "date", "heure"]))]
+    par_cle = {}
+    for i, k in enumerate(cles):
+        par_cle.setdefault(k, i + 2)
+    out, deplacees, perdues = [], 0, 0
+    for r, v in updates:
+        k = _cles_lignes.get(r)
+        if k is None or (2 <= r < len(cles) + 2 and cles[r - 2] == k):
+            out.append((r, v))
+        elif k in par_cle:
+            out.append((par_cle[k], v))
+            deplacees += 1
+        else:
+            perdues += 1
+    if deplacees or perdues:
+        print(f"⚠️ Planning modifié pendant le run : {deplacees} marque(s) 'envoye' recalée(s), "
+              f"{perdues} abandonnée(s) (ligne supprimée)")
+        for issue, n in (("deplacee", deplacees), ("supprimee", perdues)):
+            if n:
+                metrics.incr("envoye_recalages_total", n, issue=issue)
+    return out
+
+def ecrire_envoye(ws, envoye_col_letter, updates):
+    """
+    Batch update des seules cellules 'envoye' modifiées. updates: [(row_1based, valeur)], recalées
+    d'abord sur les clés actuelles de la feuille (recaler).
+    """
+    updates = recaler(ws, updates)
+    if not updates:
         return
+    batch_body = {
+        "valueInputOption": "RAW",
+        "data": []
+    }
+    for rownum, value in updates:
+        rng = f"{envoye_col_letter}{rownum}:{envoye_col_letter}{rownum}"
+        batch_body["data"].append({
+            "range": f"{config.FEUILLE_PLANNING}!{rng}",
+            "values": [[value]]
+        })
+    ws.spreadsheet.values_batch_update(batch_body)
+
+def _lire_envoye(ws, envoye_col_letter, rows):
+    """Valeurs actuelles de la colonne envoye pour les lignes demandées : {numéro de ligne: valeur}."""
+    plages = _plages(sorted(rows), PLANNING_RANGE_GAP)
+    out = {}
+    for k in range(0, len(plages), PLANNING_RANGES_PAR_APPEL):
+        lot = plages[k:k + PLANNING_RANGES_PAR_APPEL]
+        res = ws.batch_get([f"{envoye_col_letter}{a}:{envoye_col_letter}{b}" for a, b in lot])
+        for (a, b), vr in zip(lot, res):
+            for j in range(b - a + 1):
+                out[a + j] = (vr[j][0] if j < len(vr) and vr[j] else "")
+    return out
+
+def duree_bail(chats):
+    """
+    Durée du bail (s) d'un lot : le chat le plus chargé part à ~TELEGRAM_RATE_CHAT msg/s, le lot entier à
+    TELEGRAM_RATE_GLOBAL ; estimation doublée (pauses 429, repli ligne à ligne) + LEASE_MINUTES de marge.
+    chats : chat_id de chaque ligne réservée.
+    """
+    if len(chats) == 0:
+        return LEASE_MINUTES * 60
+    par_chat = int(pd.Series(chats).astype(str).value_counts().max())
+    estime = max(len(chats) / max(TELEGRAM_RATE_GLOBAL, 0.01), par_chat / max(TELEGRAM_RATE_CHAT, 0.01))
+    return LEASE_MINUTES * 60 + 2 * estime
+
+def echeance_bail(valeur):
+    """Échéance (time.monotonic) des envois sous le bail `valeur` : son expiration moins LEASE_MARGE_S."""
+    expiration = planning_schema.expiration_bail(valeur) if valeur else None
+    if expiration is None:
+        return None
+    return time.monotonic() + (expiration - time.time()) - LEASE_MARGE_S
+
+def _plus_tot(*echeances):
+    echeances = [e for e in echeances if e is not None]
+    return min(echeances) if echeances else None
+
+def reserver(ws, envoye_col_letter, df_send):
+    """
+    Pose un bail sur les lignes à envoyer (envoye = en_cours:<worker>:<expiration>) pour qu'un autre
+    worker ou un run qui se chevauche ne les envoie pas aussi : relecture fraîche, écriture des baux,
+    attente LEASE_SETTLE_S, relecture ; seules les lignes dont le bail relu est le nôtre sont gardées.
+    Retourne (df_send réservé, valeur du bail).
+    """
+    if not BOT_LEASES or df_send.empty:
+        return df_send, None
+    rows = [int(i) + 2 for i in df_send.index]
+    sheets.oublier_lectures(getattr(ws, "client", None))
+    now = time.time()
+    statut = _lire_envoye(ws, envoye_col_letter, rows)
+    libres = [r for r in rows if planning_schema.est_disponible(statut.get(r, ""), now)]
+    if not libres:
+        print(f"🔒 Aucune des {len(rows)} ligne(s) dues n'est libre (réservées par un autre worker)")
+        return df_send.iloc[0:0], None
 
-    df = pd.DataFrame(data_rows, columns=header)
+    valeur = planning_schema.bail(BOT_WORKER_ID, now + duree_bail(df_send.loc[[r - 2 for r in libres], "chat_id"]))
+    ecrire_envoye(ws, envoye_col_letter, [(r, valeur) for r in libres])
+    time.sleep(LEASE_SETTLE_S)
+    statut = _lire_envoye(ws, envoye_col_letter, libres)
+    gardes = {r for r in libres if statut.get(r) == valeur}
+    if len(gardes) < len(rows):
+        print(f"🔒 {len(gardes)}/{len(rows)} ligne(s) réservée(s) par {BOT_WORKER_ID} ; les autres sont à un autre worker")
+    return df_send[[int(i) + 2 in gardes for i in df_send.index]], valeur
 
-    # Ensure required columns exist
-    required = ["client","programme","saison","chat_id","date","heure","type","avancement","message","format","url","envoye"]
-    for c in required:
+def envoyer_reserve(ws, envoye_col_letter, df_send, apres_envoi=None, bdg=None):
+    """
+    reserver + envoyer_lot ; les baux des envois échoués ou non lancés sont rendus (envoye = "non").
+    bdg (budget.Budget) : chats les plus prioritaires soumis d'abord, aucun envoi lancé après l'échéance.
+    """
+    df_send, valeur = reserver(ws, envoye_col_letter, df_send)
+    echeance = echeance_bail(valeur)   # aucun envoi lancé après : un bail expiré peut être repris ailleurs
+    if bdg:
+        df_send = budget.ordonner(df_send, time.time())
+        echeance = _plus_tot(bdg.echeance, echeance)
+    updates = envoyer_lot(df_send, apres_envoi, echeance)
+    if valeur is not None:
+        ok = {r for r, _ in updates}
+        updates += [(int(i) + 2, "non") for i in df_send.index if int(i) + 2 not in ok]
+    return updates
+
+# ======================
+# Main
+# ======================
+
+def prefetch_images(df_send):
+    """Lance le pré-téléchargement des images Drive dues (hors file_id déjà en cache)."""
+    global _prefetcher
+    is_img = df_send["format"].astype(str).str.strip().str.lower() == "image"
+    cache = get_file_id_cache()
+    ids = []
+    for u in df_send.loc[is_img, "url"].astype(str).str.strip():
+        fid = extract_drive_file_id(u)
+        if fid and cache.get(f"drive:{fid}") is None:
+            ids.append(fid)
+    if not ids:
+        return
+    _prefetcher = media.Prefetcher()
+    _prefetcher.prefetch(ids)
+    print(f"🖼️ Préchargement de {len(set(ids))} image(s) Drive")
+
+def preparer_planning(df, tz):
+    """Colonnes manquantes, normalisation des types et datetime '_dt' des lignes à envoyer."""
+    for c in planning_schema.COLONNES:
         if c not in df.columns:
             df[c] = ""
 
@@ -224,132 +731,430 @@ def lancer_bot():
     df["saison"] = pd.to_numeric(df["saison"], errors="coerce").fillna(1).astype(int)
     df["avancement"] = pd.to_numeric(df["avancement"], errors="coerce").fillna(1).astype(int)
 
-    # Build datetime
-    def mk_dt(row):
-        s = f"{row['date']} {row['heure']}".strip()
-        try:
-            return pd.to_datetime(s, errors="coerce")
-        except Exception:
-            return pd.NaT
+    # Build datetime (only rows still to send: envoye == "non" with a message)
+    df["_dt"] = parse_planning_dt(df, tz)
+    noter_cles(df)
+    return df
 
-    df["_dt_naive"] = df.apply(mk_dt, axis=1)
-    mask = df["_dt_naive"].notna()
-    if mask.any():
-        df.loc[mask, "_dt"] = localize_safe(df.loc[mask, "_dt_naive"].astype("datetime64[ns]"), tz)
-    else:
-        df["_dt"] = pd.NaT
-
-    now_local = datetime.now(tz)
+def envoyer_lot(df_send, apres_envoi=None, echeance=None):
+    """
+    Envoie les lignes de df_send (index = numéro de ligne - 2) : un worker à la fois par chat
+    (ordre conservé), chats en parallèle. apres_envoi(numéro de ligne, ligne) est appelé dès
+    chaque envoi réussi. Retourne [(numéro de ligne, "oui")] des envois réussis.
+    Lignes en retard de plus de RATTRAPAGE_MINUTES : regroupées par chat (rattrapage.py).
+    echeance (time.monotonic) : aucun envoi lancé après ; les lignes restantes sont laissées au run suivant.
+    """
+    global _prefetcher
+    def _envoyer(job):
+        if isinstance(job, rattrapage.Paquet):
+            return envoyer_paquet(job, apres_envoi)
+        success, err = envoyer_ligne(job[1])
+        if success and apres_envoi is not None:
+            apres_envoi(*job)
+        return success, err
 
-    # Filter candidates: envoye == "non" and datetime <= now (optionally within window)
-    has_msg = df["message"].astype(str).str.strip() != ""
-    
-    elig = (
-        (df["envoye"].str.lower() == "non")
-        & df["_dt"].notna()
-        & (df["_dt"] <= now_local)
-        & has_msg             # <<--- AJOUT
+    disp = dispatcher.Dispatcher(
+        _envoyer,
+        workers=TELEGRAM_WORKERS,
+        global_rate=TELEGRAM_RATE_GLOBAL,
+        chat_rate=TELEGRAM_RATE_CHAT,
+        max_429=TELEGRAM_MAX_RETRIES,
+        echeance=echeance,
     )
-    
-    if SEND_WINDOW_MINUTES is not None:
-        window_start = now_local - timedelta(minutes=int(SEND_WINDOW_MINUTES))
-        elig = elig & (df["_dt"] >= window_start)
-    
-    df_send = df[elig].copy()
-
-    # Column indices (1-based) for A1 ranges
-    col_map = {name: (i+1) for i, name in enumerate(header)}
-    if "envoye" not in col_map:
-        raise RuntimeError("Colonne 'envoye' absente de la feuille planning.")
-    envoye_col_idx = col_map["envoye"]
-    envoye_col_letter = col_idx_to_a1(envoye_col_idx)
-
-    # Send loop
-    updates = []  # list of (row_index_1based, value)
+    par_chat = {}
     for idx, row in df_send.iterrows():
         # Worksheet row number = idx in df + header row (1) + 1
         ws_row_num = int(idx) + 2
 
         chat_id = row["chat_id"]
-        raw_text = str(row["message"]).strip()  # on teste le "message" du planning, pas le texte après append url
-        fmt = str(row["format"]).strip().lower()
-        url = str(row["url"]).strip()
-        
+        raw_text = str(row["message"]).strip()
+
         # Ne rien envoyer si message vide
         if not raw_text:
             print(f"⏭️ Skip (message vide) ligne {ws_row_num} -> chat_id={chat_id}")
+            metrics.incr("envois_skips_total", motif="message_vide")
             continue
-        
-        try:
-            if fmt == "image" and url:
-                file_id = extract_drive_file_id(url)
-        
-                if file_id:
-                    # Cas Google Drive: on télécharge puis on upload à Telegram
-                    local_path = None
-                    try:
-                        local_path = download_drive_file_to_temp(file_id)
-                        # send_telegram_photo doit accepter un InputFile; si tu as déjà une fonction utilitaire
-                        # 'send_telegram_photo' qui accepte 'files', utilise-la. Sinon en brut:
-                        with open(local_path, "rb") as f:
-                            # Ex: requests.post(f"https://api.telegram.org/bot{TOKEN}/sendPhoto", data={...}, files={"photo": f})
-                            success, err = send_telegram_photo(chat_id, f, caption=raw_text, is_file=True)
-                    finally:
-                        if local_path and os.path.exists(local_path):
-                            try:
-                                os.unlink(local_path)
-                            except Exception:
-                                pass
-        
-                else:
-                    # Pas un lien Drive -> tentative "URL directe"
-                    ok_image = False
-                    try:
-                        h = requests.head(url, allow_redirects=True, timeout=7)
-                        ctype = h.headers.get("content-type", "")
-                        ok_image = ctype.startswith("image/")
-                    except Exception:
-                        ok_image = False
-        
-                    if ok_image:
-                        success, err = send_telegram_photo(chat_id, url, caption=raw_text)
-                    else:
-                        # fallback : on envoie en texte + lien
-                        text_to_send = f"{raw_text}\n{url}" if url else raw_text
-                        success, err = send_telegram_message(chat_id, text_to_send)
-            else:
-                text_to_send = raw_text
-                if url:
-                    text_to_send = f"{text_to_send}\n{url}"
-                success, err = send_telegram_message(chat_id, text_to_send)
-        except Exception as e:
-            success = False
-            err = f"exception:{e}"
 
+        par_chat.setdefault(chat_id, []).append((ws_row_num, row))
+
+    seuil = time.time() - rattrapage.RATTRAPAGE_MINUTES * 60
+    paquets = 0
+    for chat_id, lignes in par_chat.items():
+        for job in rattrapage.jobs_chat(lignes, seuil, album_possible):
+            if isinstance(job, rattrapage.Paquet):
+                paquets += 1
+                metrics.incr("rattrapage_lignes_total", len(job), genre=job.genre)
+            disp.submit(chat_id, job)
+    if paquets:
+        print(f"⏩ Rattrapage : {paquets} envoi(s) groupé(s) (lignes en retard de plus de {rattrapage.RATTRAPAGE_MINUTES} min)")
 
+    prefetch_images(df_send)
+    try:
+        results = disp.run()
+    finally:
+        if _prefetcher is not None:
+            _prefetcher.close()
+            _prefetcher = None
+    restants = sum(len(j) if isinstance(j, rattrapage.Paquet) else 1 for j in disp.restants())
+    if restants:
+        print(f"⏳ Échéance atteinte (budget du run ou fin du bail) : {restants} ligne(s) laissée(s) au run suivant")
+        metrics.incr("envois_reportes_total", restants, classe="echeance")
 
+    updates = []  # list of (row_index_1based, value)
+    lignes = []
+    for job, success, err in results:
+        if isinstance(job, rattrapage.Paquet):
+            lignes += [(n, row, n in job.faits, err) for n, row in job.lignes]
+        else:
+            lignes.append((job[0], job[1], success, err))
+    for ws_row_num, row, success, err in lignes:
+        chat_id = row["chat_id"]
         if success:
             updates.append((ws_row_num, "oui"))
+            metrics.incr("envois_total", statut="ok")
             print(f"✅ Envoyé (ligne {ws_row_num}) -> chat_id={chat_id}")
         else:
+            metrics.incr("envois_total", statut="echec")
             print(f"⚠️ Echec envoi (ligne {ws_row_num}) -> chat_id={chat_id} ; {err}")
 
+    sauver_caches_media()
+    return updates
+
+def enregistrer_envoyes(ws, envoye_col_letter, local_store, updates):
+    """Écrit les marques 'envoye' (store local d'abord s'il est activé, puis la feuille)."""
+    # Store: write locally first, then push every not-yet-synced mark (this run + earlier failed syncs)
+    if local_store is not None:
+        local_store.marquer(updates)
+        updates = local_store.a_pousser()
+        _cles_lignes.update(local_store.cles([r for r, _ in updates if r not in _cles_lignes]))
+
     # Batch update only changed 'envoye' cells
     if updates:
-        batch_body = {
-            "valueInputOption": "RAW",
-            "data": []
-        }
-        for rownum, value in updates:
-            rng = f"{envoye_col_letter}{rownum}:{envoye_col_letter}{rownum}"
-            batch_body["data"].append({
-                "range": f"{config.FEUILLE_PLANNING}!{rng}",
-                "values": [[value]]
-            })
-        ws_planning.spreadsheet.values_batch_update(batch_body)
-        print(f"Marqués 'envoye=oui' pour {len(updates)} ligne(s).")
+        ecrire_envoye(ws, envoye_col_letter, updates)
+        if local_store is not None:
+            local_store.pousse([r for r, _ in updates])
+        nb_oui = sum(1 for _, v in updates if v == "oui")
+        print(f"Marqués 'envoye=oui' pour {nb_oui} ligne(s).")
+        if nb_oui < len(updates):
+            print(f"🔓 {len(updates) - nb_oui} bail(s) rendu(s) (envois échoués)")
+
+def _journal():
+    nom = "envois.jsonl" if BOT_SHARD_COUNT == 1 else f"envois_{BOT_SHARD_INDEX}.jsonl"
+    return journal.Journal(os.path.join(fichiers.CACHE_DIR, nom))
+
+def rejouer_journal(ws, jrnl, local_store):
+    """
+    Envois notés au journal mais dont la marque 'envoye' n'a pas été écrite (run interrompu) :
+    marqués 'oui' avant tout nouvel envoi. Chaque ligne est vérifiée par sa clé chat_id|date|heure
+    (le planning a pu être réécrit entre-temps) et retrouvée par clé si elle a bougé.
+    """
+    attente = jrnl.en_attente()
+    if not attente:
+        jrnl.vider()
+        return
+    header = ws.row_values(1)
+    if not header or any(c not in header for c in ("chat_id", "date", "heure", "envoye")):
+        print(f"⚠️ Journal : {len(attente)} envoi(s) non rejoué(s), en-tête du planning inattendu")
+        return
+    cols = planning_schema.colonnes(ws, header, ["chat_id", "date", "heure"])
+    n = len(cols[0])
+    cles = ["|".join(v.strip() for v in t) for t in zip(*cols)]
+    par_cle = {}
+    for i, k in enumerate(cles):
+        par_cle.setdefault(k, i + 2)
+
+    updates, perdus = [], 0
+    for row, cle in attente:
+        if 2 <= row < n + 2 and cles[row - 2] == cle:
+            updates.append((row, "oui"))
+        elif cle in par_cle:
+            row = par_cle[cle]
+            updates.append((row, "oui"))
+        else:
+            perdus += 1   # ligne purgée du planning depuis
+            continue
+        _cles_lignes[row] = cle
+    print(f"📓 Journal : {len(updates)} marque(s) 'envoye' rejouée(s), {perdus} ligne(s) introuvable(s)")
+    enregistrer_envoyes(ws, _colonne_envoye(header), local_store, updates)
+    jrnl.vider()
+
+def suivre_envois(ws, envoye_col_letter, local_store, jrnl):
+    """
+    Écriture différée des marques : retourne (apres_envoi, ecriture). apres_envoi note chaque envoi
+    au journal (fsync) puis le confie à l'écriture par lots ; un lot poussé est acquitté au journal.
+    """
+    def pousser(updates):
+        enregistrer_envoyes(ws, envoye_col_letter, local_store, updates)
+        jrnl.acquitter([r for r, v in updates if v == "oui"])
+    ecriture = journal.EcritureDifferee(pousser)
+
+    def apres_envoi(ws_row_num, row):
+        jrnl.noter(ws_row_num, journal.cle_ligne(row))
+        ecriture.ajouter([(ws_row_num, "oui")])
+    return apres_envoi, ecriture
+
+def terminer_envois(ws, envoye_col_letter, local_store, jrnl, ecriture):
+    """Pousse les dernières marques ; journal vidé si tout est écrit, sinon rejoué au prochain run."""
+    ok = ecriture.fermer()
+    if local_store is not None:
+        # marques du store pas encore poussées (échec d'écriture d'un run précédent)
+        try:
+            enregistrer_envoyes(ws, envoye_col_letter, local_store, [])
+        except Exception as e:
+            print(f"⚠️ Marques 'envoye' du store non poussées : {e}")
+    if ok and not jrnl.en_attente():
+        jrnl.vider()
+    jrnl.fermer()
+
+def _colonne_envoye(header):
+    col_map = {name: (i+1) for i, name in enumerate(header)}
+    if "envoye" not in col_map:
+        raise RuntimeError("Colonne 'envoye' absente de la feuille planning.")
+    return planning_schema.lettre_colonne(col_map["envoye"])
+
+def _ouvrir_planning():
+    # Auth Sheets (client partagé du processus)
+    client = sheets.client()
+
+    # Open planning by key (configured or cached), not by Drive title search
+    doc = sheets.ouvrir(client, config.FICHIER_PLANNING, getattr(config, "CLE_PLANNING", ""))
+    ws_planning = doc.worksheet(config.FEUILLE_PLANNING)
+    return client, ws_planning
+
+def lancer_bot():
+    _verifier_token()
+    bdg = budget.Budget()   # mesuré depuis le lancement (lecture et baux compris)
+    tz = _tz()
+    client, ws_planning = _ouvrir_planning()
+    local_store = store.ouvrir(PLANNING_STORE)
+    metrics.jalon("auth")
+    if local_store is not None:
+        store.verifier(local_store, ws_planning, tz)
+
+    # Envois d'un run interrompu : marques rejouées avant de chercher les lignes dues
+    jrnl = _journal()
+    rejouer_journal(ws_planning, jrnl, local_store)
+    metrics.jalon("journal")
+
+    now_local = datetime.now(tz)
+
+    # Read header + only the row ranges that can be due (index = row number - 2)
+    if local_store is not None:
+        header, df, nb_lignes = lire_planning_store(local_store, ws_planning, now_local, tz)
+    else:
+        header, df, nb_lignes = lire_planning_due(ws_planning, now_local)
+    metrics.jalon("lecture")
+    if header is None:
+        print("Planning vide.")
+        jrnl.fermer()
+        sheets.afficher_rapport(client)
+        return
+    if not nb_lignes:
+        print("Aucune ligne planning.")
+        jrnl.fermer()
+        sheets.afficher_rapport(client)
+        return
+    if df is None:
+        # décidé sur les colonnes date/heure/envoye : ni DataFrame, ni import de pandas
+        print(f"💤 Aucune ligne due ({nb_lignes} ligne(s) au planning).")
+        jrnl.fermer()
+        sheets.afficher_rapport(client)
+        return
+
+    df = preparer_planning(df, tz)
+
+    # Filter candidates: datetime <= now (optionally within window)
+    elig = df["_dt"].notna() & (df["_dt"] <= now_local)
+
+    if SEND_WINDOW_MINUTES is not None:
+        window_start = now_local - timedelta(minutes=int(SEND_WINDOW_MINUTES))
+        elig = elig & (df["_dt"] >= window_start)
+    
+    df_send = df[elig].copy()
+    metrics.incr("lignes_dues_total", len(df_send))
+    df_send, laissees = bdg.selectionner(df_send, now_local.timestamp())
+    if laissees:
+        print(f"⏳ BOT_BUDGET_ENVOIS={bdg.envois} : {laissees} ligne(s) moins prioritaire(s) laissée(s) au run suivant")
+        metrics.incr("envois_reportes_total", laissees, classe="quota")
+    metrics.jalon("normalisation")
+
+    # Column letter for A1 ranges
+    envoye_col_letter = _colonne_envoye(header)
+
+    # Marques 'envoye' écrites au fil de l'eau (journal + lots), baux rendus en fin de lot
+    apres_envoi, ecriture = suivre_envois(ws_planning, envoye_col_letter, local_store, jrnl)
+    try:
+        updates = envoyer_reserve(ws_planning, envoye_col_letter, df_send, apres_envoi, bdg)
+        ecriture.ajouter([u for u in updates if u[1] != "oui"])
+        metrics.jalon("envoi")
+    finally:
+        terminer_envois(ws_planning, envoye_col_letter, local_store, jrnl, ecriture)
+        metrics.jalon("ecriture")
 
+    sheets.afficher_rapport(client)
     print(f"🕒 Terminé à {now_local.strftime('%Y-%m-%d %H:%M:%S %Z')}")
 
+# ======================
+# Mode résident (--daemon)
+# ======================
+# Les lignes à venir sont gardées dans un tas trié par heure prévue ; le bot dort jusqu'à
+# l'échéance suivante, envoie, écrit 'envoye' aussitôt. Rechargement périodique incrémental :
+# colonnes date/envoye seulement, puis lecture des seules lignes candidates pas encore connues.
+# SIGTERM / SIGINT : le lot en cours se termine et ses marques sont écrites avant l'arrêt.
+
+DAEMON_RELOAD_S = getattr(config, "DAEMON_RELOAD_S", 300)        # intervalle de rechargement du planning
+DAEMON_DUREE_MAX_MIN = getattr(config, "DAEMON_DUREE_MAX_MIN", None)  # None = sans limite
+
+class _Echeancier:
+    """Lignes à venir : numéro de ligne -> (epoch prévu, ligne), tas (epoch, numéro) à suppression paresseuse."""
+
+    def __init__(self):
+        self.lignes = {}
+        self.tas = []
+        self.dates = None   # colonne date au dernier rechargement (détection des décalages de lignes)
+
+    def vider(self):
+        self.lignes.clear()
+        self.tas.clear()
+
+    def ajouter(self, df):
+        for idx, row in df[df["_dt"].notna()].iterrows():
+            n = int(idx) + 2
+            t = row["_dt"].timestamp()
+            self.lignes[n] = (t, row)
+            heapq.heappush(self.tas, (t, n))
+
+    def retirer(self, rows):
+        for n in rows:
+            self.lignes.pop(n, None)
+
+    def prochaine(self):
+        while self.tas and (self.tas[0][1] not in self.lignes or self.lignes[self.tas[0][1]][0] != self.tas[0][0]):
+            heapq.heappop(self.tas)
+        return self.tas[0][0] if self.tas else None
+
+    def dues(self, now):
+        out = []
+        while self.prochaine() is not None and self.tas[0][0] <= now:
+            _, n = heapq.heappop(self.tas)
+            out.append(self.lignes.pop(n)[1])
+        return out
+
+def _recharger_feuille(ws, ech, now_local, jusqua, tz):
+    header, dates, envoyes, chats = lire_colonnes_suivi(ws)
+    if header is None:
+        ech.vider()
+        ech.dates = []
+        return None
+    old = ech.dates
+    if old is not None and dates[:len(old)] != old[:len(dates)]:
+        # lignes insérées / supprimées (réécriture du planning) : numéros invalides, tout relire
+        print("[DEBUG] Planning modifié (lignes décalées) : rechargement complet de l'échéancier")
+        ech.vider()
+    ech.dates = dates
+
+    date_min, date_max = _bornes_dates(now_local, jusqua)
+    rows = _lignes_candidates(dates, envoyes, date_max, date_min, chats)
+    ech.retirer(set(ech.lignes) - set(rows))   # envoyées ailleurs ou sorties de la fenêtre
+    nouvelles = [r for r in rows if r not in ech.lignes]
+    if nouvelles:
+        df, _ = lire_plages(ws, header, nouvelles)
+        ech.ajouter(preparer_planning(df, tz))
+    print(f"[DEBUG] Rechargement : {len(nouvelles)} nouvelle(s) ligne(s) lue(s), {len(ech.lignes)} à venir")
+    return header
+
+def _recharger_store(local_store, ws, ech, now_local, jusqua, tz):
+    store.verifier(local_store, ws, tz)   # planning réécrit pendant que le démon tourne
+    header, df, _ = lire_planning_store(local_store, ws, now_local, tz, jusqua)
+    ech.vider()
+    if header is None:
+        return None
+    if df is not None:
+        ech.ajouter(preparer_planning(df, tz))
+    print(f"[DEBUG] Rechargement (store) : {len(ech.lignes)} ligne(s) à venir")
+    return header
+
+def lancer_daemon():
+    _verifier_token()
+    tz = _tz()
+    client, ws_planning = _ouvrir_planning()
+    local_store = store.ouvrir(PLANNING_STORE)
+
+    stop = threading.Event()
+    def _arret(signum, frame):
+        print(f"🛑 Signal {signum} reçu : arrêt après le lot en cours")
+        stop.set()
+    signal.signal(signal.SIGTERM, _arret)
+    signal.signal(signal.SIGINT, _arret)
+
+    fin = None
+    if DAEMON_DUREE_MAX_MIN:
+        fin = time.time() + float(DAEMON_DUREE_MAX_MIN) * 60
+    ech = _Echeancier()
+    header, prochain_rechargement = None, 0.0
+    if local_store is not None:
+        store.verifier(local_store, ws_planning, tz)
+    jrnl = _journal()
+    rejouer_journal(ws_planning, jrnl, local_store)
+    suivi = None   # (lettre envoye, apres_envoi, ecriture), créé au premier en-tête lu
+    print(f"🤖 Mode résident (rechargement toutes les {DAEMON_RELOAD_S}s)")
+
+    while not stop.is_set():
+        now = time.time()
+        if fin is not None and now >= fin:
+            print("⏹️ Durée maximale atteinte")
+            break
+        if now >= prochain_rechargement:
+            now_local = datetime.now(tz)
+            jusqua = now_local + timedelta(seconds=DAEMON_RELOAD_S)
+            try:
+                sheets.oublier_lectures(client)
+                if local_store is not None:
+                    header = _recharger_store(local_store, ws_planning, ech, now_local, jusqua, tz)
+                else:
+                    header = _recharger_feuille(ws_planning, ech, now_local, jusqua, tz)
+            except Exception as e:
+                print(f"⚠️ Rechargement du planning échoué : {e}")
+            prochain_rechargement = time.time() + DAEMON_RELOAD_S
+
+        dues = ech.dues(time.time())
+        if SEND_WINDOW_MINUTES is not None:
+            limite = time.time() - int(SEND_WINDOW_MINUTES) * 60
+            dues = [r for r in dues if r["_dt"].timestamp() >= limite]
+        if dues and header is not None:
+            df_send = pd.DataFrame(dues)
+            try:
+                if suivi is None:
+                    envoye_col_letter = _colonne_envoye(header)
+                    suivi = (envoye_col_letter,) + suivre_envois(ws_planning, envoye_col_letter, local_store, jrnl)
+                updates = envoyer_reserve(ws_planning, suivi[0], df_send, suivi[1])
+                suivi[2].ajouter([u for u in updates if u[1] != "oui"])
+            except Exception as e:
+                print(f"⚠️ Lot en erreur (bail ou colonne 'envoye') : {e}")
+            continue
+
+        suivante = ech.prochaine()
+        reveil = prochain_rechargement if suivante is None else min(suivante, prochain_rechargement)
+        if fin is not None:
+            reveil = min(reveil, fin)
+        stop.wait(max(0.0, reveil - time.time()))
+
+    if suivi is not None:
+        terminer_envois(ws_planning, suivi[0], local_store, jrnl, suivi[2])
+    else:
+        jrnl.fermer()
+    sauver_caches_media()
+    sheets.afficher_rapport(client)
+    print(f"🕒 Mode résident arrêté à {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S %Z')}")
+
 if __name__ == "__main__":
-    lancer_bot()
+    import sys
+    # --profile : profil cProfile du run (comme METRICS_PROFILE=1)
+    try:
+        with metrics.profiler("bot", True if "--profile" in sys.argv[1:] else None):
+            if "--daemon" in sys.argv[1:]:
+                lancer_daemon()
+            else:
+                lancer_bot()
+    finally:
+        metrics.exporter("bot")
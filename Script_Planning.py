@@ -1,10 +1,16 @@
 import gspread
-from google.oauth2.service_account import Credentials
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 import config
+import metrics
+import planning_schema
+import programme_cache
+import sheets
+import store
 
 # ========= Helpers =========
 
@@ -51,8 +57,7 @@ def _norm_chat(s):
         s = s[:-2]
     return s
 
-def _weekday_fr(d):
-    return ["lundi","mardi","mercredi","jeudi","vendredi","samedi","dimanche"][d.weekday()]
+JOURS_FR = ["lundi","mardi","mercredi","jeudi","vendredi","samedi","dimanche"]
 
 def _parse_jours_diffusion(v):
     if isinstance(v, (list, tuple)):
@@ -63,34 +68,412 @@ def _parse_jours_diffusion(v):
                "friday":"vendredi","saturday":"samedi","sunday":"dimanche"}
     return set(mapping.get(p,p) for p in parts)
 
+def _weekmask(jours):
+    """Set de jours FR -> weekmask numpy ("1010100" = lun/mer/ven). Set vide = tous les jours."""
+    if len(jours) == 0:
+        return "1111111"
+    return "".join("1" if j in jours else "0" for j in JOURS_FR)
+
+def _starts_days(starts):
+    # datetime64 (NaT toléré) -> datetime64[D] (équivalent de Timestamp.date())
+    return np.asarray(pd.to_datetime(starts, errors="coerce").values).astype("datetime64[D]")
+
+def _avancements(starts, jours_list, dates):
+    """
+    Avancement de chaque client à chaque date : nb de jours de diffusion dans [start, d], 0 si d < start.
+    Temps constant par (client, date) via numpy.busday_count, vectorisé par weekmask.
+    Retourne un array int (n_clients, n_dates) ; 0 pour les starts invalides.
+    """
+    s = _starts_days(starts)
+    d = np.array(dates, dtype="datetime64[D]")
+    out = np.zeros((len(s), len(d)), dtype=np.int64)
+    masks = np.array([_weekmask(j) for j in jours_list])
+    valid = ~np.isnat(s)
+    for m in np.unique(masks[valid]) if valid.any() else []:
+        if "1" not in m:
+            continue  # aucun jour reconnu : jamais diffusé, avancement 0
+        sel = valid & (masks == m)
+        st = s[sel][:, None]
+        cnt = np.busday_count(st, d[None, :] + 1, weekmask=m)
+        out[sel] = np.where(d[None, :] >= st, cnt, 0)
+    return out
+
+def _dates_fin(starts, jours_list, nbs):
+    """
+    Date du nb-ième jour de diffusion à partir de start (inclus), vectorisé par weekmask
+    (numpy.busday_offset, roll="forward"). NaT si start invalide, nb <= 0 ou aucun jour de diffusion.
+    """
+    s = _starts_days(starts)
+    nbs = np.asarray(nbs, dtype=np.int64)
+    out = np.full(len(s), np.datetime64("NaT"), dtype="datetime64[D]")
+    masks = np.array([_weekmask(j) for j in jours_list])
+    valid = ~np.isnat(s) & (nbs > 0)
+    for m in np.unique(masks[valid]) if valid.any() else []:
+        if "1" not in m:
+            continue
+        sel = valid & (masks == m)
+        out[sel] = np.busday_offset(s[sel], nbs[sel] - 1, roll="forward", weekmask=m)
+    return out
+
+def _categorie(valeurs, pos):
+    """Valeurs par client (ou par créneau) -> colonne catégorielle des lignes pos ; catégories triées, comme typer()."""
+    codes, cats = pd.factorize(np.asarray(valeurs, dtype=object).ravel(), sort=True)
+    return pd.Categorical.from_codes(codes[pos], categories=cats)
+
+def _generer_lignes(dfc, dates, adv_mat):
+    """
+    Nouvelles lignes du planning : produit croisé clients × dates × créneaux (Heure envoi 1..3) en tableaux numpy,
+    jours de diffusion appliqués en masque (clients, 7 jours). Sortie déjà normalisée et typée (planning_schema),
+    dans l'ordre client, date, créneau ; type / message / format / url vides (remplis après la fusion).
+    Retourne (DataFrame, skips) ; DataFrame vide sans colonnes si aucune ligne.
+    """
+    client = dfc["Client"].astype(str).str.strip().values
+    chat = dfc["Canal ID"].astype(str).str.strip().values
+    start_ok = dfc["Date de Démarrage"].notna().values
+    heures = np.stack([dfc[f"Heure envoi {k}"].astype(str).values for k in (1, 2, 3)], axis=1)  # (clients, 3)
+
+    a_client = client != ""
+    a_chat = chat != ""
+    valide = a_client & a_chat & start_ok
+    creneaux = heures != ""
+    skips = {
+        "client_vide": int((~a_client).sum()),
+        "canalid_vide": int((a_client & ~a_chat).sum()),
+        "date_invalide": int((a_client & a_chat & ~start_ok).sum()),
+        "sans_heure": int((valide & ~creneaux.any(axis=1)).sum()),
+    }
+
+    # jours de diffusion : un masque lundi..dimanche par weekmask distinct (ensemble vide = tous les jours)
+    inv, masques = pd.factorize(pd.Series([_weekmask(j) for j in dfc["Jours de Diffusion"]], dtype=object))
+    semaine = np.array([[c == "1" for c in m] for m in masques], dtype=bool).reshape(-1, 7)[inv]
+    jours = semaine[:, [d.weekday() for d in dates]]                                        # (clients, dates)
+
+    garde = valide[:, None, None] & jours[:, :, None] & creneaux[:, None, :]               # (clients, dates, 3)
+    ci, di, ki = np.nonzero(garde)   # ordre C : client, puis date, puis créneau (comme l'ancienne boucle)
+    if len(ci) == 0:
+        return pd.DataFrame(), skips
+
+    n = len(ci)
+    dfn = pd.DataFrame({
+        "client": _categorie(client, ci),
+        "programme": _categorie(dfc["Programme"].astype(str).str.strip().str.zfill(3).values, ci),
+        "saison": planning_schema.depuis_entiers(dfc["Saison"].values[ci], "saison"),
+        "chat_id": _categorie(chat, ci),
+        "date": pd.Categorical.from_codes(di, categories=[d.strftime("%Y-%m-%d") for d in dates]),
+        "heure": _categorie(heures, ci * 3 + ki),
+        "type": pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), categories=[""]),
+        "avancement": planning_schema.depuis_entiers(adv_mat[ci, di], "avancement"),
+        "message": np.full(n, "", dtype=object),
+        "format": pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), categories=[""]),
+        "url": np.full(n, "", dtype=object),
+        "envoye": pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), categories=["non"]),
+        "_slot": planning_schema.depuis_entiers(ki + 1, "_slot"),
+    })
+    return dfn, skips
+
+PROG_FETCH_WORKERS = getattr(config, "PROG_FETCH_WORKERS", 4)
+BATCH_GET_MAX_RANGES = 100
+
+def _records(values):
+    """Équivalent de Worksheet.get_all_records() sur des valeurs brutes (values_batch_get)."""
+    if not values or values == [[]]:
+        return []
+    values = gspread.utils.fill_gaps(values)
+    keys, rows = values[0], values[1:]
+    if len(keys) != len(set(keys)):
+        raise gspread.exceptions.GSpreadException("the header row in the worksheet is not unique")
+    return gspread.utils.to_records(keys, [gspread.utils.numericise_all(r) for r in rows])
+
+def _lire_onglets_sheets(doc, titres):
+    """
+    Un seul values_batch_get pour les onglets demandés (existants). En cas d'échec du lot,
+    lectures individuelles concurrentes. Retourne {titre: records} ; onglets illisibles omis.
+    """
+    out = {}
+    try:
+        for i in range(0, len(titres), BATCH_GET_MAX_RANGES):
+            lot = titres[i:i + BATCH_GET_MAX_RANGES]
+            res = doc.values_batch_get([gspread.utils.absolute_range_name(t) for t in lot])
+            for t, vr in zip(lot, res.get("valueRanges", [])):
+                try:
+                    out[t] = _records(vr.get("values", []))
+                except Exception as e:
+                    print(f"⚠️ Onglet {t} illisible : {e}")
+        print(f"[DEBUG] {len(out)} onglet(s) programmes lus par lecture groupée")
+        return out
+    except Exception as e:
+        print(f"⚠️ Lecture groupée des onglets impossible ({e}) ; lecture concurrente")
+
+    def _get(t):
+        return doc.worksheet(t).get_all_records()
+    with ThreadPoolExecutor(max_workers=PROG_FETCH_WORKERS) as ex:
+        futs = {t: ex.submit(_get, t) for t in titres if t not in out}
+    for t, f in futs.items():
+        try:
+            out[t] = f.result()
+        except Exception as e:
+            print(f"⚠️ Onglet {t} illisible : {e}")
+    return out
+
+def _lire_onglets(doc, titres, cache=None, refresh=False):
+    """
+    Lit plusieurs onglets d'un classeur, via le cache persistant si fourni :
+    modifiedTime Drive inchangé -> onglets déjà en cache servis sans lecture de la feuille.
+    Sinon une lecture des métadonnées (onglets existants) puis une lecture groupée.
+    Retourne {titre: records comme get_all_records()} ; onglets absents/illisibles omis.
+    """
+    titres = list(dict.fromkeys(titres))
+    version = None
+    if cache is not None:
+        try:
+            version = doc.get_lastUpdateTime()
+        except Exception as e:
+            print(f"⚠️ Date de modification des programmes illisible ({e}) ; cache ignoré")
+
+    out, existants = {}, None
+    if version and not refresh:
+        existants = cache.existants(doc.id, version)
+        for t in titres:
+            rec = cache.get(doc.id, version, t)
+            if rec is not None:
+                out[t] = rec
+        if out:
+            print(f"[DEBUG] {len(out)} onglet(s) programmes servis par le cache (version {version})")
+
+    if existants is None:
+        try:
+            existants = [ws.title for ws in doc.worksheets()]
+        except Exception as e:
+            print(f"⚠️ Liste des onglets programmes illisible : {e}")
+            return out
+        if version:
+            cache.set_existants(doc.id, version, existants)
+
+    a_lire = [t for t in titres if t in set(existants) and t not in out]
+    if a_lire:
+        lus = _lire_onglets_sheets(doc, a_lire)
+        if version:
+            for t, rec in lus.items():
+                cache.put(doc.id, version, t, rec)
+        out.update(lus)
+    if cache is not None:
+        cache.save()
+    return out
+
+CONTENU_KEYS = ["programme","saison","jour","_slot"]
+
+def _compiler_programme(prog, dfp, types_id_to_label):
+    """
+    Compile un onglet programme en index de contenu, indexé par (programme, saison, jour, _slot) :
+    lignes triées par Type dans chaque (Saison, Jour), _slot = rang 1..n, valeurs finales
+    type / message / format / url. Les lignes sans Phrase gardent leur rang mais sont retirées.
+    """
+    cols = ["type","message","format","url"]
+    if dfp is None or dfp.empty:
+        return pd.DataFrame(columns=cols, index=pd.MultiIndex.from_arrays([[]] * 4, names=CONTENU_KEYS))
+    d = dfp.sort_values(["Saison","Jour","Type"], kind="stable", na_position="last")
+    slot = d.groupby(["Saison","Jour"], sort=False).cumcount() + 1
+    phrase = d["Phrase"]
+    ok = phrase.notna() & (phrase.astype(str) != "")
+    d, slot = d[ok], slot[ok]
+
+    type_id = pd.to_numeric(d["Type"], errors="coerce").fillna(0).astype(int)
+    label = type_id.map(lambda t: types_id_to_label.get(t, str(t)))
+    saison = d["Saison"].astype(int)
+    jour = d["Jour"].astype(int)
+    message = ("Saison " + saison.astype(str) + " - Jour " + jour.astype(str) + " : \n"
+               + label + " : " + phrase[ok].astype(str))
+    fmt = d["Format"].astype(str).str.strip().str.lower().replace("", "texte")
+    out = pd.DataFrame({
+        "programme": str(prog).zfill(3),
+        "saison": saison.values,
+        "jour": jour.values,
+        "_slot": slot.values.astype(int),
+        "type": label.values,
+        "message": message.values,
+        "format": fmt.values,
+        "url": d["Url"].astype(str).values,
+    })
+    # doublons impossibles (rang unique par (saison, jour)) : index direct
+    return out.set_index(CONTENU_KEYS)[cols]
+
+def _cles_contenu(dfm):
+    """Clés de jointure (programme, saison, jour, _slot) de chaque ligne du planning (0/invalide -> 1)."""
+    def _int1(s):
+        v = pd.to_numeric(s, errors="coerce").astype(float)
+        return v.where(v.notna() & (v != 0), 1).astype(float).astype(int)
+    return pd.DataFrame({
+        "programme": dfm["programme"].astype(str).str.zfill(3),
+        "saison": _int1(dfm["saison"]),
+        "jour": _int1(dfm["avancement"]),
+        "_slot": _int1(dfm["_slot"]) if "_slot" in dfm.columns else 1,
+    }, index=dfm.index)
+
+def _remplir_contenu(dfm, get_prog_index):
+    """Remplit type / message / format / url par jointure vectorisée sur l'index de contenu."""
+    keys = _cles_contenu(dfm)
+    contenu = pd.concat([get_prog_index(p) for p in keys["programme"].unique()]) if len(keys) else None
+    if contenu is None or contenu.empty:
+        res = pd.DataFrame(index=dfm.index, columns=["type","message","format","url"])
+    else:
+        res = keys.join(contenu, on=CONTENU_KEYS, how="left")
+    dfm["type"] = res["type"].fillna("").values
+    dfm["message"] = res["message"].fillna("").values
+    dfm["format"] = res["format"].fillna("texte").values
+    dfm["url"] = res["url"].fillna("").values
+
 def _normalize_key_columns(df):
-    df["client"]    = df["client"].astype(str).str.strip()
-    df["programme"] = df["programme"].astype(str).str.zfill(3)
-    df["saison"]    = df["saison"].astype(str).str.strip()
+    # colonnes catégorielles (planning_schema.typer) : chaque fonction s'applique une fois par valeur distincte
+    df["client"]    = df["client"].apply(lambda v: str(v).strip())
+    df["programme"] = df["programme"].apply(lambda v: str(v).zfill(3))
+    if not pd.api.types.is_integer_dtype(df["saison"].dtype):
+        df["saison"] = df["saison"].apply(lambda v: str(v).strip())
     df["chat_id"]   = df["chat_id"].apply(_norm_chat)
     df["date"]      = df["date"].apply(_norm_date)
     df["heure"]     = df["heure"].apply(_norm_hms)
     # type left empty at generation; filled later
 
+# ========= Écriture différentielle du planning =========
+
+def _plages_lignes(rows):
+    """Numéros de ligne triés -> plages contiguës [(début, fin)]."""
+    plages = []
+    for r in rows:
+        if plages and r == plages[-1][1] + 1:
+            plages[-1][1] = r
+        else:
+            plages.append([r, r])
+    return [tuple(p) for p in plages]
+
+def _diff_planning(header, brut, dfm, lignes):
+    """
+    Compare le planning cible à la feuille lue.
+    brut : valeurs brutes de la feuille (index = numéro de ligne, colonnes = header) ;
+    dfm : planning cible (colonnes = header, typé ou non) ; lignes : ligne d'origine de chaque ligne de dfm (NaN = nouvelle).
+    Retourne (cellules [(ligne, 1ère colonne 1-based, [valeurs])], ajouts [[valeurs]], suppressions [ligne]).
+    La colonne 'envoye' des lignes existantes n'est jamais réécrite (marques posées par Script_Bot).
+    Comparaison colonne par colonne sur les chaînes (planning_schema.texte) : une seule colonne
+    convertie à la fois, et seules les lignes modifiées / ajoutées sont converties en entier.
+    """
+    cols = list(header)
+    existe = lignes.notna().values
+    rows = lignes[existe].astype(int).values
+    avant = brut.loc[rows, cols]
+    apres = dfm.loc[existe, cols]
+    diff = np.zeros((len(rows), len(cols)), dtype=bool)
+    for j, c in enumerate(cols):
+        if c != "envoye":
+            diff[:, j] = planning_schema.texte(avant[c]).values != planning_schema.texte(apres[c]).values
+
+    cellules = []
+    modifiees = np.flatnonzero(diff.any(axis=1))
+    valeurs = planning_schema.en_texte(apres.iloc[modifiees]).values
+    for k, i in enumerate(modifiees):
+        for a, b in _plages_lignes(np.flatnonzero(diff[i]).tolist()):
+            cellules.append((int(rows[i]), a + 1, valeurs[k, a:b + 1].tolist()))
+    ajouts = planning_schema.en_texte(dfm.loc[~existe, cols]).values.tolist()
+    suppressions = sorted(set(brut.index) - set(rows.tolist()))
+    return cellules, ajouts, suppressions
+
+def _ordre_feuille(lignes, sched):
+    """
+    Ordre des lignes dans la feuille écrite (positions, pour iloc) : lignes existantes dans leur ordre,
+    chaque nouvelle ligne insérée avant la première ligne existante prévue plus tard qu'elle.
+    La feuille reste triée par date/heure (bisection de Script_Bot.lire_planning_due).
+    lignes : ligne d'origine (NaN = nouvelle) ; sched : heure prévue (epoch, NA si invalide -> en fin).
+    """
+    row = lignes.to_numpy(dtype=float, na_value=np.nan)
+    t = sched.to_numpy(dtype=float, na_value=np.nan)
+    existe = ~np.isnan(row)
+    rang = np.empty(len(row))
+    ex = np.flatnonzero(existe)
+    ex = ex[np.argsort(row[ex], kind="stable")]
+    rang[ex] = 2 * np.arange(len(ex)) + 1
+    # bornes croissantes même si une ligne existante est hors ordre ou sans date valide
+    plafond = np.maximum.accumulate(np.where(np.isnan(t[ex]), -np.inf, t[ex])) if len(ex) else np.array([])
+    nv = np.flatnonzero(~existe)
+    pos = np.searchsorted(plafond, np.where(np.isnan(t[nv]), np.inf, t[nv]), side="right")
+    rang[nv] = 2 * pos
+    return np.lexsort((np.where(np.isnan(t), np.inf, t), rang))
+
+def _ecrire_planning(ws, header, brut, dfm, lignes):
+    """
+    Écrit le planning cible dans la feuille : seules les cellules modifiées, les lignes nouvelles
+    (insérées à leur place, insertDimension, ou ajoutées en fin) et les lignes purgées (suppressions groupées)
+    sont envoyées. dfm est dans l'ordre final de la feuille (_ordre_feuille).
+    En-tête absent ou différent : réécriture complète.
+    """
+    cols = dfm.columns.tolist()
+    if list(header) != cols:
+        print("[DEBUG] En-tête du planning absent ou modifié : réécriture complète")
+        ws.clear()
+        ws.update([cols] + planning_schema.en_texte(dfm).values.tolist())
+        return
+
+    cellules, ajouts, suppressions = _diff_planning(header, brut, dfm, lignes)
+    data = [{"range": gspread.utils.absolute_range_name(ws.title, gspread.utils.rowcol_to_a1(r, c)),
+             "values": [vals]} for r, c, vals in cellules]
+
+    # lignes nouvelles : numéro final = position dans dfm + 2 ; suites contiguës insérées d'un bloc,
+    # la dernière suite (après toutes les lignes existantes) simplement écrite en fin
+    finales = (np.flatnonzero(lignes.isna().values) + 2).tolist()
+    suites = _plages_lignes(finales)
+    fin = suites.pop() if suites and suites[-1][1] == len(dfm) + 1 else None
+    structure = [
+        # de bas en haut : les numéros des plages restantes ne bougent pas
+        {"deleteDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS", "startIndex": a - 1, "endIndex": b}}}
+        for a, b in reversed(_plages_lignes(suppressions))
+    ] + [
+        # puis de haut en bas, en numéros finaux : tout ce qui précède une suite est déjà en place
+        {"insertDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS", "startIndex": a - 1, "endIndex": b},
+                             "inheritFromBefore": a > 2}}
+        for a, b in suites
+    ]
+    nouvelles, k = [], 0
+    for a, b in suites + ([fin] if fin else []):
+        nouvelles.append({"range": gspread.utils.absolute_range_name(ws.title, f"A{a}"),
+                          "values": ajouts[k:k + b - a + 1]})
+        k += b - a + 1
+    if fin:
+        manque = len(dfm) + 1 - (ws.row_count - len(suppressions) + sum(b - a + 1 for a, b in suites))
+        if manque > 0:
+            ws.add_rows(manque)
+
+    if not structure:
+        data += nouvelles
+    if data:
+        # cellules des lignes existantes : numéros d'origine, avant suppressions et insertions
+        ws.spreadsheet.values_batch_update({"valueInputOption": "RAW", "data": data})
+    if structure:
+        ws.spreadsheet.batch_update({"requests": structure})
+        if nouvelles:
+            ws.spreadsheet.values_batch_update({"valueInputOption": "RAW", "data": nouvelles})
+    print(f"[DEBUG] Planning : {len(cellules)} plage(s) de cellules modifiée(s), "
+          f"{len(ajouts)} ligne(s) ajoutée(s) ({len(suites)} insertion(s) en place), "
+          f"{len(suppressions)} ligne(s) supprimée(s)")
+
 # ========= Main =========
 
-def generer_planning():
+def generer_planning(refresh_programmes=None):
     tz = _tz()
     NB_JOURS = getattr(config, "NB_JOURS_GENERATION", 2)
     RETENTION = getattr(config, "RETENTION_JOURS", 2)
     DEFAULT_SLOT_TYPE_IDS = getattr(config, "DEFAULT_SLOT_TYPE_IDS", [1,2,3])
 
     # Auth
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = Credentials.from_service_account_file(config.CHEMIN_CLE_JSON, scopes=scope)
-    client = gspread.authorize(creds)
+    client = sheets.client()
 
-    ws_clients = client.open(config.FICHIER_CLIENTS).worksheet(config.FEUILLE_CLIENTS)
-    ws_planning = client.open(config.FICHIER_PLANNING).worksheet(config.FEUILLE_PLANNING)
-    doc_programmes = client.open(config.FICHIER_PROGRAMMES)
+    # classeurs ouverts par clé (configurée ou mémorisée), pas par recherche Drive du titre
+    ws_clients = sheets.ouvrir(client, config.FICHIER_CLIENTS,
+                               getattr(config, "CLE_CLIENTS", "")).worksheet(config.FEUILLE_CLIENTS)
+    ws_planning = sheets.ouvrir(client, config.FICHIER_PLANNING,
+                                getattr(config, "CLE_PLANNING", "")).worksheet(config.FEUILLE_PLANNING)
+    doc_programmes = sheets.ouvrir(client, config.FICHIER_PROGRAMMES, getattr(config, "CLE_PROGRAMMES", ""))
+    metrics.jalon("auth")
 
     # Read Clients
     dfc = pd.DataFrame(ws_clients.get_all_records())
+    metrics.jalon("lecture")
     required = ["Client","Thème","Canal ID","Programme","Saison","Date de Démarrage",
                 "Jours de Diffusion","Heure envoi 1","Heure envoi 2","Heure envoi 3"]
     for c in required:
@@ -117,18 +500,55 @@ def generer_planning():
     dfc["Date de Démarrage"] = pd.to_datetime(dfc["Date de Démarrage"], errors="coerce", dayfirst=True)
     dfc["Jours de Diffusion"] = dfc["Jours de Diffusion"].apply(_parse_jours_diffusion)
     for k in (1,2,3):
-        dfc[f"Heure envoi {k}"] = dfc[f"Heure envoi {k}"].apply(_norm_hms)
+        # one parse per distinct hour (a few dozen), not per client
+        h = dfc[f"Heure envoi {k}"]
+        dfc[f"Heure envoi {k}"] = h.map({v: _norm_hms(v) for v in h.unique()})
+
+    metrics.jalon("normalisation")
 
     # Date window
     today = datetime.now(tz).date()
     dates_fenetre = [today + timedelta(days=i) for i in range(NB_JOURS)]
     print(f"[DEBUG] today={today} NB_JOURS={NB_JOURS} dates={dates_fenetre}")
 
+    # Read existing planning (local store if enabled and checked against the sheet, else the sheet)
+    local_store = store.ouvrir(getattr(config, "PLANNING_STORE", ""))
+    cols_plan = planning_schema.COLONNES
+    # (typed cell values kept aside, index = sheet row: the writer only sends the cells that differ,
+    # and deletes/inserts rows by number -> a stale store is re-seeded from the sheet first)
+    if local_store is not None and store.verifier(local_store, ws_planning, tz) and not local_store.vide():
+        header_plan = local_store.header()
+        brut = local_store.dataframe().reindex(columns=header_plan, fill_value="")
+        brut.index = pd.RangeIndex(2, len(brut) + 2)  # numéro de ligne dans la feuille
+        print(f"[DEBUG] Planning existant lu depuis le store ({len(brut)} ligne(s))")
+    else:
+        # read in row blocks, each block converted to the compact typed form as it arrives
+        header_plan, brut = planning_schema.lire_par_blocs(ws_planning)
+    if len(brut):
+        dfe = brut.copy()
+        for c in cols_plan:
+            if c not in dfe.columns:
+                dfe[c] = ""
+    else:
+        dfe = pd.DataFrame(columns=cols_plan)
+    dfe["_row"] = dfe.index
+
+    # All programme tabs referenced by clients or existing planning + "Types", in one batch read
+    # (served from the persistent cache when the programmes file is unchanged)
+    progs = {str(p).strip().zfill(3) for p in dfc["Programme"] if str(p).strip()}
+    progs |= {str(p).strip().zfill(3) for p in dfe["programme"].unique() if str(p).strip()}
+    if refresh_programmes is None:
+        refresh_programmes = getattr(config, "PROG_CACHE_REFRESH", False)
+    cache_programmes = programme_cache.ProgrammeCache() if getattr(config, "PROG_CACHE", True) else None
+    onglets = _lire_onglets(doc_programmes, sorted(progs) + ["Types"], cache_programmes, refresh_programmes)
+
     # Read Types mapping from 'Types'
     types_id_to_label, types_label_to_id = {}, {}
     try:
-        ws_types = doc_programmes.worksheet("Types")
-        dft = pd.DataFrame(ws_types.get_all_records())
+        records_types = onglets.get("Types")
+        if records_types is None:
+            records_types = doc_programmes.worksheet("Types").get_all_records()
+        dft = pd.DataFrame(records_types)
         for _,r in dft.iterrows():
             try:
                 tid = int(pd.to_numeric(r.get("Id",""), errors="coerce"))
@@ -141,77 +561,23 @@ def generer_planning():
     except Exception:
         pass
 
-    # Generate planning rows WITHOUT type; include internal _slot
-    rows = []
-    skips = {"client_vide":0,"canalid_vide":0,"date_invalide":0,"sans_heure":0}
-    for _, r in dfc.iterrows():
-        client_name = str(r["Client"]).strip()
-        chat_id = str(r["Canal ID"]).strip()
-        prog = str(r["Programme"]).strip()
-        saison = int(r["Saison"])
-        start = r["Date de Démarrage"]
-        jours = r["Jours de Diffusion"]
-        if not client_name: skips["client_vide"]+=1; continue
-        if not chat_id: skips["canalid_vide"]+=1; continue
-        if pd.isna(start): skips["date_invalide"]+=1; continue
-
-        # avancement counting only diffusion days
-        max_d = max(dates_fenetre)
-        cnt=0; adv_by_date={}
-        cur = start.date()
-        while cur <= max_d:
-            if len(jours)==0 or _weekday_fr(cur) in jours:
-                cnt += 1
-            adv_by_date[cur]=cnt
-            cur += timedelta(days=1)
-
-        for d in dates_fenetre:
-            if len(jours)!=0 and _weekday_fr(d) not in jours:
-                continue
-            adv = int(adv_by_date.get(d,0))
-            # Build slots 1..3
-            for k in (1,2,3):
-                h = r.get(f"Heure envoi {k}", "")
-                if not h:
-                    continue
-                rows.append({
-                    "client": client_name,
-                    "programme": prog,
-                    "saison": saison,
-                    "chat_id": chat_id,
-                    "date": d.strftime("%Y-%m-%d"),
-                    "heure": h,
-                    "type": "",  # will be filled later
-                    "avancement": adv,
-                    "message": "",
-                    "format": "",
-                    "url": "",
-                    "envoye": "non",
-                    "_slot": k,
-                })
-        if (not r.get("Heure envoi 1") and not r.get("Heure envoi 2") and not r.get("Heure envoi 3")):
-            skips["sans_heure"] += 1
-
-    dfn = pd.DataFrame(rows)
+    metrics.jalon("lecture")
+
+    # avancement counting only diffusion days (closed form, all clients × dates at once)
+    adv_mat = _avancements(dfc["Date de Démarrage"], dfc["Jours de Diffusion"].tolist(), dates_fenetre)
+
+    # Generate planning rows WITHOUT type, with internal _slot: clients × dates × slots at once, already normalized
+    dfn, skips = _generer_lignes(dfc, dates_fenetre, adv_mat)
+    for motif, n in skips.items():
+        metrics.incr("planning_skips_total", n, motif=motif)
+    metrics.incr("planning_lignes_generees_total", len(dfn))
+    metrics.jalon("generation")
     if dfn.empty:
         print(f"[DEBUG] df_nouveau est vide ; skips={skips}")
     else:
-        print(f"[DEBUG] Nouveau par date: {dfn['date'].value_counts().to_dict()}\n[DEBUG] skips={skips}")
-
-    # Read existing planning
-    records = ws_planning.get_all_records()
-    cols_plan = ["client","programme","saison","chat_id","date","heure","type","avancement","message","format","url","envoye"]
-    if records:
-        dfe = pd.DataFrame(records)
-        for c in cols_plan:
-            if c not in dfe.columns:
-                dfe[c] = ""
-    else:
-        dfe = pd.DataFrame(columns=cols_plan)
+        print(f"[DEBUG] Nouveau par date: {dfn['date'].value_counts()[lambda n: n > 0].to_dict()}\n[DEBUG] skips={skips}")
 
-    # Normalize keys before merge
-    if not dfn.empty:
-        _normalize_key_columns(dfn)
+    # Normalize existing keys before merge (typed: categories, small ints; new rows are generated normalized)
     if not dfe.empty:
         _normalize_key_columns(dfe)
 
@@ -224,8 +590,9 @@ def generer_planning():
     # Merge & dedup
     key_cols = ["client","programme","saison","chat_id","date","heure"]
     # NOTE: exclude 'type' from key since it's now filled post-merge
-    dfm = pd.concat([dfe, dfn], ignore_index=True)
+    dfm = planning_schema.concat([dfe, dfn], ignore_index=True)
     dfm.drop_duplicates(subset=key_cols, keep="first", inplace=True)
+    metrics.jalon("fusion")
 
     # ==== Fill messages / type from programme tabs ====
     # Preload programme tabs
@@ -235,8 +602,11 @@ def generer_planning():
         if prog in cache_prog:
             return cache_prog[prog]
         try:
-            ws = doc_programmes.worksheet(prog)
-            dfp = pd.DataFrame(ws.get_all_records())
+            records_prog = onglets.get(prog)
+            if records_prog is None:
+                # onglet non préchargé (ou lecture groupée en échec) : lecture directe
+                records_prog = doc_programmes.worksheet(prog).get_all_records()
+            dfp = pd.DataFrame(records_prog)
             for c in ["Support","Saison","Jour","Type","Phrase","Format","Url"]:
                 if c not in dfp.columns: dfp[c] = ""
             dfp["Saison"] = pd.to_numeric(dfp["Saison"], errors="coerce").fillna(1).astype(int)
@@ -247,17 +617,14 @@ def generer_planning():
         cache_prog[prog]=dfp
         return dfp
 
-    # Determine slot position for rows (if _slot missing because it came from existing dfe)
-    def compute_slot_indices(group):
-        # sort by heure then assign slot 1..3
-        temp = group.copy()
-        temp["_slot"] = pd.to_datetime(temp["heure"], format="%H:%M:%S", errors="coerce")
-        temp = temp.sort_values("_slot", kind="stable")
-        temp["_slot"] = range(1, len(temp)+1)
-        return temp["_slot"]
-
+    # Determine slot position for rows (if _slot missing because it came from existing dfe):
+    # rank 1..n by heure within (client, programme, saison, date); observed=True, the keys being categoricals
     if "_slot" not in dfm.columns or dfm["_slot"].isna().any():
-        dfm["_slot"] = dfm.groupby(["client","programme","saison","date"]).apply(compute_slot_indices).reset_index(level=[0,1,2,3], drop=True)
+        heure_dt = pd.to_datetime(dfm["heure"].astype(object), format="%H:%M:%S", errors="coerce")
+        ordre = dfm[["client","programme","saison","date"]].assign(_h=heure_dt)
+        ordre = ordre.sort_values("_h", kind="stable", na_position="last")
+        rang = ordre.groupby(["client","programme","saison","date"], observed=True, sort=False).cumcount() + 1
+        dfm["_slot"] = rang.reindex(dfm.index).astype("Int8")
 
     # choose type_id per slot: prefer client-specified 'Type envoi k', else DEFAULT_SLOT_TYPE_IDS[k-1]
     def type_id_for_row(r):
@@ -270,50 +637,35 @@ def generer_planning():
         except Exception:
             return None
 
-    labels, messages, formats, urls = [], [], [], []
-    for idx, r in dfm.iterrows():
-        prog = str(r["programme"]).zfill(3)
-        saison = int(pd.to_numeric(r["saison"], errors="coerce") or 1)
-        jour = int(pd.to_numeric(r["avancement"], errors="coerce") or 1)
-        dfp = get_prog_df(prog)
-
-        # pick k-th row for this (saison, jour) sorted by Type id, based on slot
-        k = int(r.get("_slot", 1))
-        subset = dfp[(dfp["Saison"]==saison) & (dfp["Jour"]==jour)].copy()
-        subset = subset.sort_values("Type")
-        rec = subset.iloc[k-1] if len(subset) >= k else None
-
-        if rec is not None and pd.notna(rec.get("Phrase","")) and str(rec.get("Phrase","")) != "":
-            val = pd.to_numeric(rec.get("Type"), errors="coerce")
-            type_id = int(val) if pd.notna(val) else 0
-            label = types_id_to_label.get(type_id, str(type_id))
-            labels.append(label)
-            messages.append(f"Saison {saison} - Jour {jour} : \n{label} : {rec.get('Phrase','')}")
-            fmt = str(rec.get("Format","texte")).strip().lower() or "texte"
-            formats.append(fmt)
-            urls.append(str(rec.get("Url","")))
-        else:
-            labels.append("")
-            messages.append("")
-            formats.append("texte")
-            urls.append("")
-
-    dfm["type"] = labels
-    dfm["message"] = messages
-    dfm["format"] = formats
-    dfm["url"] = urls
-
-    # Sort by date then time (as strings standardized), to avoid tz warnings
-    dfm["date_norm"] = dfm["date"].apply(lambda x: pd.to_datetime(x, format="%Y-%m-%d", errors="coerce"))
-    dfm["heure_norm"] = pd.to_datetime(dfm["heure"], format="%H:%M:%S", errors="coerce")
-    dfm = dfm.sort_values(["date_norm","heure_norm"]).drop(columns=["date_norm","heure_norm","_slot"], errors="ignore")
-
-    # Write
-    for c in dfm.columns:
-        dfm[c] = dfm[c].astype(str)
-    ws_planning.clear()
-    ws_planning.update([dfm.columns.tolist()] + dfm.values.tolist())
-    print(f"[DEBUG] Total par date (après fusion): {dfm['date'].value_counts().to_dict()}\n📅 Mise à jour planning à {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S %Z')}")
+    # Each programme tab compiled once into a content index keyed by (programme, saison, jour, _slot)
+    cache_index = {}
+    def get_prog_index(prog):
+        prog = str(prog).zfill(3)
+        if prog not in cache_index:
+            cache_index[prog] = _compiler_programme(prog, get_prog_df(prog), types_id_to_label)
+        return cache_index[prog]
+
+    # pick k-th row (sorted by Type id) of (saison, jour) for each slot: one vectorized join
+    _remplir_contenu(dfm, get_prog_index)
+    metrics.jalon("remplissage")
+
+    # Existing rows keep their sheet order; each new row goes at its date/heure position (int64 epoch),
+    # so the sheet stays sorted for Script_Bot's bisection
+    sched = planning_schema.scheduled_at(dfm["date"], dfm["heure"], tz)
+    dfm = dfm.iloc[_ordre_feuille(dfm["_row"], sched)]
+    dfm = dfm.drop(columns=["_slot"], errors="ignore")
+
+    # Write (diff against the sheet as read: appended rows, changed cells, purged rows);
+    # kept typed, cells converted to text column by column by the writer
+    lignes = dfm.pop("_row")
+    dfm = planning_schema.typer(dfm)
+    _ecrire_planning(ws_planning, header_plan, brut, dfm, lignes)
+    if local_store is not None:
+        # le store reflète exactement la feuille écrite (numéros de ligne compris)
+        local_store.remplacer(dfm.columns.tolist(), dfm, tz)
+    metrics.incr("planning_lignes_total", len(dfm))
+    metrics.jalon("ecriture")
+    print(f"[DEBUG] Total par date (après fusion): {dfm['date'].value_counts()[lambda n: n > 0].to_dict()}\n📅 Mise à jour planning à {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S %Z')}")
 
     # === Mise à jour "Date de Fin" dans la feuille Clients (si vide) ===
 
@@ -350,8 +702,8 @@ def generer_planning():
         nb_jours_cache[key] = nb
         return nb
 
-    # 3) Construire les updates pour chaque client sans "Date de Fin"
-    updates = []
+    # 3) Clients sans "Date de Fin" : (ligne sheet, start, jours, nb)
+    cand = []
     for i, (_, r) in enumerate(dfc.iterrows(), start=2):  # lignes sheet = 2..N
         current_fin = str(r.get("Date de Fin", "")).strip()
         if current_fin:
@@ -385,17 +737,17 @@ def generer_planning():
         else:
             jours_set = {p.strip().lower() for p in str(jours).replace(";", ",").split(",") if p.strip()}
 
-        # 4) Simuler les jours de diffusion pour trouver la dernière date
-        count = 0
-        cur = start_dt.date()
-        last = cur
-        while count < nb:
-            if (not jours_set) or (_weekday_fr(cur) in jours_set):
-                count += 1
-                last = cur
-            cur += timedelta(days=1)
+        cand.append((i, start_dt, jours_set, nb))
 
-        updates.append((i, last.strftime("%Y-%m-%d")))
+    # 4) nb-ième jour de diffusion depuis le démarrage (forme close, tous les clients d'un coup)
+    updates = []
+    if cand:
+        fins = _dates_fin([c[1] for c in cand], [c[2] for c in cand], [c[3] for c in cand])
+        for (i, _, jours_set, _), fin in zip(cand, fins):
+            if np.isnat(fin):
+                print(f"⚠️ Date de fin non calculable ligne {i} (aucun jour de diffusion reconnu : {sorted(jours_set)})")
+                continue
+            updates.append((i, str(fin)))
 
     # 5) Batch update
     if updates:
@@ -414,5 +766,15 @@ def generer_planning():
     else:
         print("📝 Aucune date de fin à compléter.")
 
+    metrics.jalon("date_fin")
+    sheets.afficher_rapport(client)
+
 if __name__ == "__main__":
-    generer_planning()
+    import sys
+    # --refresh-programmes : ignore le cache des onglets programmes (relecture complète)
+    # --profile : profil cProfile du run (comme METRICS_PROFILE=1)
+    try:
+        with metrics.profiler("planning", True if "--profile" in sys.argv[1:] else None):
+            generer_planning(refresh_programmes=True if "--refresh-programmes" in sys.argv[1:] else None)
+    finally:
+        metrics.exporter("planning")
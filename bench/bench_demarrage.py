@@ -0,0 +1,87 @@
+"""
+Coût de démarrage de Script_Bot, dans un interpréteur neuf à chaque essai (médiane de N) :
+  import      python -c "import Script_Bot"
+  run_vide    lancer_bot() sur un planning sans aucune ligne due (heure creuse), faux gspread
+              (bench/fake_gspread.py) ; la durée inclut les imports, pas la génération des données
+Indique aussi si pandas a été importé pendant le run.
+
+    python bench/bench_demarrage.py
+    python bench/bench_demarrage.py --essais 9 --lignes 20000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+RACINE = os.path.dirname(BENCH)
+sys.path.insert(0, RACINE)
+sys.path.insert(0, BENCH)
+
+ENFANT_IMPORT = """
+import sys, time
+t0 = time.perf_counter()
+sys.path[:0] = [{racine!r}]
+import Script_Bot
+print(time.perf_counter() - t0, "pandas" in sys.modules, "gspread" in sys.modules)
+"""
+
+ENFANT_RUN = """
+import sys, time, json, io, contextlib
+t0 = time.perf_counter()
+sys.path[:0] = [{racine!r}, {bench!r}]
+grille = json.load(open({grille!r}, encoding="utf-8"))
+from fake_gspread import FauxClasseur, FauxClient, installer
+import config
+client = FauxClient({{config.FICHIER_PLANNING: FauxClasseur({{config.FEUILLE_PLANNING: grille}}, "planning")}})
+with installer(client), contextlib.redirect_stdout(io.StringIO()):
+    import Script_Bot
+    Script_Bot.lancer_bot()
+print(time.perf_counter() - t0, "pandas" in sys.modules)
+"""
+
+
+def _essais(code, n, env):
+    """Durée médiane et, pour chaque module suivi (pandas, gspread...), importé dans au moins un essai."""
+    durees, importes = [], []
+    for _ in range(n):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, cwd=RACINE)
+        if out.returncode != 0:
+            raise SystemExit(f"❌ Échec de l'essai :\n{out.stderr}")
+        d, *flags = out.stdout.strip().splitlines()[-1].split()
+        durees.append(float(d))
+        importes = [a or f == "True" for a, f in zip(importes or [False] * len(flags), flags)]
+    return statistics.median(durees), importes
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--essais", type=int, default=5)
+    ap.add_argument("--lignes", type=int, default=6000, help="taille du planning (run_vide)")
+    a = ap.parse_args()
+
+    import pytz
+    import config
+    import synthetique
+    now = datetime.now(pytz.timezone(config.FUSEAU_HORAIRE))
+
+    with tempfile.TemporaryDirectory(prefix="metabot-demarrage-") as tmp:
+        env = dict(os.environ, CACHE_DIR=tmp, PLANNING_STORE="", METRICS_JSON="")
+        chemin = os.path.join(tmp, "planning.json")
+        with open(chemin, "w", encoding="utf-8") as f:
+            json.dump(synthetique.planning(a.lignes, now, dues=0), f)
+
+        d, (p, g) = _essais(ENFANT_IMPORT.format(racine=RACINE), a.essais, env)
+        print(f"⏱️ import Script_Bot : {d * 1000:7.0f} ms  (pandas importé : {'oui' if p else 'non'}, "
+              f"gspread : {'oui' if g else 'non'})")
+        d, (p,) = _essais(ENFANT_RUN.format(racine=RACINE, bench=BENCH, grille=chemin), a.essais, env)
+        print(f"⏱️ run sans envoi    : {d * 1000:7.0f} ms  (pandas importé : {'oui' if p else 'non'}, "
+              f"{a.lignes} ligne(s), faux gspread)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark du parse date/heure du planning dans lancer_bot (Script_Bot.parse_planning_dt).
+
+Compare l'ancien chemin (df.apply + pd.to_datetime ligne à ligne, sur toutes les lignes)
+au chemin vectorisé (filtrage envoye/message puis parse au format connu).
+
+    python bench/bench_parse_dt.py                 # 10k, 100k, 1M lignes
+    python bench/bench_parse_dt.py --rows 10000 --legacy-max 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import Script_Bot
+
+
+def planning_synthetique(n, part_envoye=0.8, part_hors_format=0.001, seed=0):
+    """Planning type : J-2..J+1, 3 créneaux/jour, ~80 % déjà envoyé, quelques heures hors format."""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp.now().normalize()
+    dates = (today + pd.to_timedelta(rng.integers(-2, 2, n), unit="D")).strftime("%Y-%m-%d")
+    heures = np.array(["08:00:00", "12:30:00", "19:45:00"])[rng.integers(0, 3, n)]
+    heures = heures.astype(object)
+    hors = rng.random(n) < part_hors_format
+    heures[hors] = "8h05"
+    envoye = np.where(rng.random(n) < part_envoye, "oui", "non")
+    return pd.DataFrame({
+        "date": dates,
+        "heure": heures,
+        "envoye": envoye,
+        "message": "Saison 1 - Jour 3 : \nConseil : ...",
+    })
+
+
+def legacy(df, tz):
+    def mk_dt(row):
+        s = f"{row['date']} {row['heure']}".strip()
+        try:
+            return pd.to_datetime(s, errors="coerce")
+        except Exception:
+            return pd.NaT
+
+    df = df.copy()
+    df["_dt_naive"] = df.apply(mk_dt, axis=1)
+    mask = df["_dt_naive"].notna()
+    df.loc[mask, "_dt"] = Script_Bot.localize_safe(df.loc[mask, "_dt_naive"].astype("datetime64[ns]"), tz)
+    return df["_dt"].where((df["envoye"].str.lower() == "non") & (df["message"].str.strip() != ""))
+
+
+def chrono(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, res
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="*", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--legacy-max", type=int, default=100_000,
+                    help="au-delà, l'ancien chemin n'est pas mesuré (trop long)")
+    args = ap.parse_args()
+
+    tz = Script_Bot._tz()
+    print(f"{'lignes':>10} | {'vectorisé (s)':>14} | {'ancien (s)':>11} | {'gain':>6}")
+    for n in args.rows:
+        df = planning_synthetique(n)
+        t_new, res_new = chrono(Script_Bot.parse_planning_dt, df, tz)
+        if n <= args.legacy_max:
+            t_old, res_old = chrono(legacy, df, tz, repeat=1)
+            same = res_new.dropna().equals(res_old.dropna().astype(res_new.dtype))
+            gain = f"x{t_old / t_new:.0f}" + ("" if same else " (!=)")
+            print(f"{n:>10} | {t_new:>14.3f} | {t_old:>11.3f} | {gain:>6}")
+        else:
+            print(f"{n:>10} | {t_new:>14.3f} | {'-':>11} | {'-':>6}")
+
+
+if __name__ == "__main__":
+    main()
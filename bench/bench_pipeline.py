@@ -0,0 +1,271 @@
+"""
+Benchmark hors ligne de generer_planning et lancer_bot, sur données synthétiques :
+faux gspread en mémoire (bench/fake_gspread.py) et stub HTTP de la Bot API (bench/stub_telegram.py).
+
+Scénarios, pour chaque taille (nombre de clients) :
+  planning_froid  feuille Planning vide, cache des onglets programmes vide
+  planning_chaud  second run du jour : rien à écrire, onglets servis par le cache
+  bot             planning de ~6 lignes par client, ENVOIS lignes dues, envoi au stub
+  bot_rattrapage  bot arrêté depuis la veille : toutes les lignes passées sont dues (~20 clients par chat),
+                  regroupées par chat (rattrapage.py ; --sans-rattrapage pour comparer)
+
+Durées et mémoire (RSS) par étape (metrics.py), appels Sheets, débits ; comparaison aux seuils de bench/seuils.json
+(code de sortie 1 en cas de régression).
+
+    python bench/bench_pipeline.py                              # 100, 1000, 10000 clients
+    python bench/bench_pipeline.py --clients 100000 --scenarios planning_froid
+    python bench/bench_pipeline.py --latence-telegram 0.08 --taux-429 0.02 --latence-sheets 0.2
+    python bench/bench_pipeline.py --calibrer 3                 # réécrit seuils.json (mesures x3)
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SEUILS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "seuils.json")
+SCENARIOS = ("planning_froid", "planning_chaud", "bot", "bot_rattrapage")
+
+
+def _args():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--clients", default="100,1000,10000", help="tailles (nombre de clients), séparées par des virgules")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--programmes", type=int, default=10, help="nombre d'onglets programmes")
+    ap.add_argument("--envois", type=int, default=300, help="lignes dues par run du bot")
+    ap.add_argument("--part-image", type=float, default=0.05, help="part des envois en image (URL servie par le stub)")
+    ap.add_argument("--latence-telegram", type=float, default=0.0, help="secondes par appel Bot API")
+    ap.add_argument("--taux-429", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--latence-sheets", type=float, default=0.0, help="secondes par appel Sheets simulé")
+    ap.add_argument("--rate-global", type=float, default=None, help="msg/s (défaut : config)")
+    ap.add_argument("--rate-chat", type=float, default=None, help="msg/s par chat (défaut : config)")
+    ap.add_argument("--store", action="store_true", help="avec le store SQLite (PLANNING_STORE)")
+    ap.add_argument("--sans-rattrapage", action="store_true", help="bot_rattrapage envoyé ligne à ligne")
+    ap.add_argument("--seuils", default=SEUILS)
+    ap.add_argument("--calibrer", type=float, default=None, metavar="MARGE",
+                    help="écrit les seuils à partir des mesures (durée x MARGE, débit / MARGE)")
+    ap.add_argument("--sortie", default="", help="résultats détaillés (JSON)")
+    return ap.parse_args()
+
+
+A = _args()
+
+# cache, journal et métriques dans un dossier jetable ; pas de store sauf --store
+_TMP = tempfile.mkdtemp(prefix="metabot-bench-")
+os.environ["CACHE_DIR"] = _TMP
+os.environ["PLANNING_STORE"] = os.path.join(_TMP, "planning.sqlite") if A.store else ""
+os.environ.setdefault("TELEGRAM_TOKEN", "bench")
+
+from datetime import datetime  # noqa: E402
+
+import config  # noqa: E402
+import metrics  # noqa: E402
+import transport  # noqa: E402
+import Script_Bot  # noqa: E402
+import Script_Planning  # noqa: E402
+import rattrapage  # noqa: E402
+import synthetique  # noqa: E402
+from fake_gspread import FauxClasseur, FauxClient, installer  # noqa: E402
+from stub_telegram import StubTelegram  # noqa: E402
+
+
+class _Silence:
+    """Les scripts sont bavards (une ligne par envoi) : sortie standard coupée pendant la mesure."""
+
+    def __enter__(self):
+        self._stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+
+    def __exit__(self, *exc):
+        sys.stdout.close()
+        sys.stdout = self._stdout
+
+
+def _mesurer(fn):
+    metrics.reset()
+    t0 = time.perf_counter()
+    with _Silence():
+        fn()
+    duree = time.perf_counter() - t0
+    return duree, metrics._registre.instantane("bench")
+
+
+def _compteur(inst, nom, **labels):
+    return sum(c["valeur"] for c in inst["compteurs"]
+               if c["nom"] == nom and all(c["labels"].get(k) == str(v) for k, v in labels.items()))
+
+
+def _memoire(inst):
+    """RSS (Mo) en fin de chaque étape, et pic du processus."""
+    pic = inst["pic_memoire_octets"]
+    return ({k: round(v["rss"] / 2**20, 1) for k, v in inst["memoire_octets"].items()},
+            round(pic / 2**20, 1) if pic else None)
+
+
+def _appels(client):
+    """Appels Sheets des classeurs + recherches Drive par titre."""
+    return sum(n for appels in client.appels().values() for n in appels.values()) + client.recherches
+
+
+def bench_planning(n, stub_url):
+    """planning_froid puis planning_chaud sur les mêmes classeurs."""
+    onglets = synthetique.programmes(A.programmes, part_image=A.part_image, url_image=f"{stub_url}/img")
+    client = FauxClient({
+        config.FICHIER_CLIENTS: FauxClasseur({config.FEUILLE_CLIENTS: synthetique.clients(n, A.programmes)},
+                                             "clients", A.latence_sheets),
+        config.FICHIER_PLANNING: FauxClasseur({config.FEUILLE_PLANNING: []}, "planning", A.latence_sheets),
+        config.FICHIER_PROGRAMMES: FauxClasseur(onglets, "programmes", A.latence_sheets),
+    })
+    try:
+        os.remove(os.path.join(_TMP, "programmes.json"))
+    except FileNotFoundError:
+        pass
+    grille = client.classeurs[config.FICHIER_PLANNING].grille
+    out = {}
+    with installer(client):
+        for nom in ("planning_froid", "planning_chaud"):
+            client.remettre_compteurs()
+            duree, inst = _mesurer(lambda: Script_Planning.generer_planning(refresh_programmes=False))
+            lignes = len(grille(config.FEUILLE_PLANNING)) - 1
+            out[nom] = {
+                "duree_s": round(duree, 3),
+                "debit": round(lignes / duree, 1) if duree else None,
+                "unite": "lignes/s",
+                "lignes": lignes,
+                "appels_sheets": _appels(client),
+                "detail_appels": client.appels(),
+                "etapes_s": inst["etapes_s"],
+            }
+            out[nom]["memoire_mo"], out[nom]["pic_mo"] = _memoire(inst)
+    return out
+
+
+def bench_bot(n, stub, retard=False):
+    tz = Script_Bot._tz()
+    nb_chats = max(1, n // 20) if retard else max(1, n)
+    grille = synthetique.planning(n * 6, datetime.now(tz), dues=0 if retard else A.envois, nb_chats=nb_chats,
+                                  part_image=A.part_image, url_image=f"{stub.url}/img", retard=retard)
+    classeur = FauxClasseur({config.FEUILLE_PLANNING: grille}, "planning", A.latence_sheets)
+    client = FauxClient({config.FICHIER_PLANNING: classeur})
+    if Script_Bot.PLANNING_STORE and os.path.exists(Script_Bot.PLANNING_STORE):
+        os.remove(Script_Bot.PLANNING_STORE)   # store ré-amorcé depuis ce planning
+    stub.stats.clear()
+    with installer(client):
+        duree, inst = _mesurer(Script_Bot.lancer_bot)
+    envoyes = _compteur(inst, "envois_total", statut="ok")
+    envoi_s = inst["etapes_s"].get("envoi", 0.0)
+    memoire, pic = _memoire(inst)
+    return {"bot_rattrapage" if retard else "bot": {
+        "duree_s": round(duree, 3),
+        "debit": round(envoyes / envoi_s, 1) if envoi_s else None,
+        "unite": "envois/s",
+        "lignes": len(grille) - 1,
+        "envoyes": envoyes,
+        "echecs": _compteur(inst, "envois_total", statut="echec"),
+        "restants": sum(1 for r in classeur.grille(config.FEUILLE_PLANNING)[1:] if r[-1] != "oui"
+                        and r[4] + " " + r[5] <= datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S")),
+        "telegram_429": stub.stats.get("429", 0),
+        "appels_telegram": sum(v for k, v in stub.stats.items() if k.startswith("appels.")),
+        "sondes_images": stub.stats.get("sondes", 0),
+        "appels_sheets": _appels(client),
+        "detail_appels": client.appels(),
+        "etapes_s": inst["etapes_s"],
+        "memoire_mo": memoire,
+        "pic_mo": pic,
+    }}
+
+
+def _verifier(resultats, seuils):
+    regressions = []
+    for cle, r in resultats.items():
+        s = seuils.get(cle)
+        if not s:
+            continue
+        if "max_s" in s and r["duree_s"] > s["max_s"]:
+            regressions.append(f"{cle} : {r['duree_s']:.2f}s > {s['max_s']}s")
+        if "min_debit" in s and r["debit"] is not None and r["debit"] < s["min_debit"]:
+            regressions.append(f"{cle} : {r['debit']} {r['unite']} < {s['min_debit']}")
+    return regressions
+
+
+def main():
+    tailles = [int(x) for x in A.clients.split(",") if x.strip()]
+    scenarios = {s.strip() for s in A.scenarios.split(",") if s.strip()}
+    if A.rate_global is not None:
+        Script_Bot.TELEGRAM_RATE_GLOBAL = A.rate_global
+    if A.rate_chat is not None:
+        Script_Bot.TELEGRAM_RATE_CHAT = A.rate_chat
+    Script_Bot.LEASE_SETTLE_S = 0   # attente fixe, sans intérêt ici
+
+    resultats = {}
+    with StubTelegram(A.latence_telegram, taux_429=A.taux_429, retry_after=A.retry_after) as stub:
+        transport.set_transport(transport.Transport(telegram_base=stub.url))
+        for n in tailles:
+            res = {}
+            if scenarios & {"planning_froid", "planning_chaud"}:
+                res.update(bench_planning(n, stub.url))
+            if "bot" in scenarios:
+                res.update(bench_bot(n, stub))
+            if "bot_rattrapage" in scenarios:
+                rattrapage.RATTRAPAGE = not A.sans_rattrapage
+                res.update(bench_bot(n, stub, retard=True))
+            for nom, r in res.items():
+                if nom not in scenarios:
+                    continue
+                cle = f"{nom}@{n}"
+                resultats[cle] = r
+                etapes = ", ".join(f"{k} {v:.2f}s" for k, v in r["etapes_s"].items())
+                debit = f"{r['debit']} {r['unite']}" if r["debit"] is not None else "-"
+                telegram = f"  {r['appels_telegram']} appel(s) Telegram" if "appels_telegram" in r else ""
+                if r.get("sondes_images"):
+                    telegram += f" + {r['sondes_images']} sonde(s) HEAD"
+                print(f"⏱️ {cle:<22} {r['duree_s']:>8.2f}s  {debit:<18} {r['appels_sheets']:>4} appel(s) Sheets{telegram}  ({etapes})")
+                if r["memoire_mo"]:
+                    memoire = ", ".join(f"{k} {v:.0f}" for k, v in r["memoire_mo"].items())
+                    print(f"   🧠 RSS en fin d'étape (Mo) : {memoire} ; pic du processus {r['pic_mo']:.0f} Mo")
+
+    if A.sortie:
+        with open(A.sortie, "w", encoding="utf-8") as f:
+            json.dump({"date": datetime.now().isoformat(timespec="seconds"), "args": vars(A),
+                       "resultats": resultats}, f, ensure_ascii=False, indent=1)
+        print(f"📝 Résultats : {A.sortie}")
+
+    if A.calibrer:
+        seuils = {}
+        if os.path.exists(A.seuils):
+            with open(A.seuils, encoding="utf-8") as f:
+                seuils = json.load(f)
+        for cle, r in resultats.items():
+            seuils[cle] = {"max_s": round(r["duree_s"] * A.calibrer, 2)}
+            if r["debit"]:
+                seuils[cle]["min_debit"] = round(r["debit"] / A.calibrer, 1)
+        with open(A.seuils, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(seuils.items())), f, ensure_ascii=False, indent=1)
+            f.write("\n")
+        print(f"📝 Seuils réécrits : {A.seuils} (marge x{A.calibrer})")
+        return 0
+
+    seuils = {}
+    if os.path.exists(A.seuils):
+        with open(A.seuils, encoding="utf-8") as f:
+            seuils = json.load(f)
+    regressions = _verifier(resultats, seuils)
+    for r in regressions:
+        print(f"❌ Régression {r}")
+    if not regressions:
+        print(f"✅ Aucun seuil dépassé ({sum(1 for c in resultats if c in seuils)} mesure(s) comparée(s)).")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    try:
+        code = main()
+    finally:
+        shutil.rmtree(_TMP, ignore_errors=True)
+    sys.exit(code)
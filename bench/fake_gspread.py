@@ -0,0 +1,228 @@
+"""
+Faux gspread en mémoire pour les benchmarks : la partie de l'API Spreadsheet / Worksheet utilisée
+par Script_Planning et Script_Bot, sur des grilles de chaînes. Chaque appel qui serait un
+aller-retour vers l'API Sheets est compté (et peut être ralenti de `latence_s`).
+
+    client = FauxClient({config.FICHIER_PLANNING: FauxClasseur({"Planning": grille})})
+    with installer(client):
+        Script_Bot.lancer_bot()
+"""
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import gspread
+from google.oauth2.service_account import Credentials
+
+import sheets
+
+_A1_RE = re.compile(r"^([A-Z]*)(\d*)$")
+
+
+def _borne(a1):
+    """'B12' -> (12, 2) ; 'B' -> (None, 2) ; '12' -> (12, None)."""
+    m = _A1_RE.match(a1.strip().replace("$", ""))
+    if not m:
+        raise ValueError(f"plage A1 non gérée : {a1}")
+    lettres, chiffres = m.groups()
+    col = gspread.utils.a1_to_rowcol(f"{lettres}1")[1] if lettres else None
+    return (int(chiffres) if chiffres else None), col
+
+
+def _plage(rng):
+    """'Feuille'!A2:C / A2:C10 / 'Feuille' -> (titre ou None, r1, c1, r2, c2), None = non borné."""
+    titre = None
+    if "!" in rng:
+        titre, rng = rng.rsplit("!", 1)
+    elif not _A1_RE.match(rng.split(":")[0].replace("$", "")):
+        titre, rng = rng, ""
+    if titre is not None:
+        titre = titre.strip("'").replace("''", "'")
+    if not rng:
+        return titre, 1, 1, None, None
+    a, _, b = rng.partition(":")
+    r1, c1 = _borne(a)
+    r2, c2 = _borne(b) if b else (r1, c1)
+    return titre, r1 or 1, c1 or 1, r2, c2
+
+
+class FauxClasseur:
+    """Spreadsheet : onglets {titre: grille}, lectures / écritures groupées."""
+
+    def __init__(self, onglets, titre="classeur", latence_s=0.0, version="v1"):
+        self.id = self.title = titre
+        self.latence_s = latence_s
+        self.version = version
+        self.appels = {}
+        self._lock = threading.Lock()
+        self._onglets = {}
+        for t, grille in onglets.items():
+            self._onglets[t] = FauxOnglet(self, t, grille, len(self._onglets))
+
+    def _appel(self, nom):
+        with self._lock:
+            self.appels[nom] = self.appels.get(nom, 0) + 1
+        if self.latence_s:
+            time.sleep(self.latence_s)
+
+    def grille(self, titre):
+        return self._onglets[titre].grid
+
+    def worksheet(self, titre):
+        self._appel("worksheet")
+        if titre not in self._onglets:
+            raise gspread.exceptions.WorksheetNotFound(titre)
+        return self._onglets[titre]
+
+    def worksheets(self):
+        self._appel("worksheets")
+        return list(self._onglets.values())
+
+    def get_lastUpdateTime(self):
+        self._appel("get_lastUpdateTime")
+        return self.version
+
+    def values_batch_get(self, ranges, params=None):
+        self._appel("values_batch_get")
+        return {"valueRanges": [{"range": r, "values": self._lire(r)} for r in ranges]}
+
+    def values_batch_update(self, body):
+        self._appel("values_batch_update")
+        for d in body["data"]:
+            titre, r1, c1, _, _ = _plage(d["range"])
+            self._onglets[titre]._ecrire(r1, c1, d["values"])
+        self.version = f"{self.version}+"
+
+    def batch_update(self, body):
+        self._appel("batch_update")
+        for q in body["requests"]:
+            (genre, req), = q.items()
+            rg = req["range"]
+            ws = next(w for w in self._onglets.values() if w.id == rg["sheetId"])
+            if genre == "deleteDimension":
+                del ws.grid[rg["startIndex"]:rg["endIndex"]]
+            elif genre == "insertDimension":
+                ws.grid[rg["startIndex"]:rg["startIndex"]] = [[] for _ in range(rg["endIndex"] - rg["startIndex"])]
+                ws.row_count += rg["endIndex"] - rg["startIndex"]
+
+    def _lire(self, rng):
+        titre, r1, c1, r2, c2 = _plage(rng)
+        return self._onglets[titre]._lire(r1, c1, r2, c2)
+
+
+class FauxOnglet:
+    """Worksheet sur une grille (liste de lignes, lignes de longueurs variables comme l'API)."""
+
+    def __init__(self, classeur, titre, grille, sheet_id):
+        self.spreadsheet = classeur
+        self.title = titre
+        self.id = sheet_id
+        self.grid = [[str(v) for v in r] for r in grille]
+        self.row_count = max(1000, len(self.grid))
+
+    def _lire(self, r1, c1, r2, c2):
+        r2 = len(self.grid) if r2 is None else min(r2, len(self.grid))
+        out = []
+        for r in range(r1, r2 + 1):
+            ligne = self.grid[r - 1][c1 - 1:c2]
+            while ligne and ligne[-1] == "":
+                ligne = ligne[:-1]
+            out.append(ligne)
+        while out and not out[-1]:
+            out.pop()
+        return out
+
+    def _ecrire(self, r1, c1, values):
+        for i, row in enumerate(values):
+            while len(self.grid) < r1 + i:
+                self.grid.append([])
+            g = self.grid[r1 + i - 1]
+            if len(g) < c1 - 1 + len(row):
+                g.extend([""] * (c1 - 1 + len(row) - len(g)))
+            for j, v in enumerate(row):
+                g[c1 - 1 + j] = str(v)
+        self.row_count = max(self.row_count, len(self.grid))
+
+    def get_all_values(self):
+        self.spreadsheet._appel("get_all_values")
+        return gspread.utils.fill_gaps(self._lire(1, 1, None, None))
+
+    def get_all_records(self):
+        vals = self.get_all_values()
+        if not vals:
+            return []
+        return gspread.utils.to_records(vals[0], [gspread.utils.numericise_all(r) for r in vals[1:]])
+
+    def row_values(self, i):
+        self.spreadsheet._appel("row_values")
+        return self._lire(i, 1, i, None)[0] if len(self.grid) >= i else []
+
+    def batch_get(self, ranges):
+        self.spreadsheet._appel("batch_get")
+        return [self._lire(*_plage(r)[1:]) for r in ranges]
+
+    def update(self, values=None, range_name=None, **kwargs):
+        if isinstance(values, str):  # ancien ordre (plage, valeurs)
+            values, range_name = range_name, values
+        self.spreadsheet._appel("update")
+        _, r1, c1, _, _ = _plage(range_name or "A1")
+        self._ecrire(r1, c1, values)
+
+    def clear(self):
+        self.spreadsheet._appel("clear")
+        self.grid = []
+
+    def add_rows(self, n):
+        self.spreadsheet._appel("add_rows")
+        self.row_count += n
+
+
+class FauxClient:
+    """gspread.Client : classeurs par nom (open) ou par id (open_by_key)."""
+
+    def __init__(self, classeurs):
+        self.classeurs = classeurs
+        for nom, c in classeurs.items():
+            c.title = nom
+        self.recherches = 0   # recherches Drive par titre
+
+    def open(self, nom):
+        if nom not in self.classeurs:
+            raise gspread.exceptions.SpreadsheetNotFound(nom)
+        return self.classeurs[nom]
+
+    def open_by_key(self, cle):
+        for c in self.classeurs.values():
+            if c.id == cle:
+                return c
+        raise gspread.exceptions.SpreadsheetNotFound(cle)
+
+    def list_spreadsheet_files(self, title=None, folder_id=None):
+        self.recherches += 1
+        return [{"id": c.id, "name": nom, "modifiedTime": c.version}
+                for nom, c in self.classeurs.items() if title is None or nom == title]
+
+    def appels(self):
+        """{classeur: {appel: nombre}}"""
+        return {nom: dict(c.appels) for nom, c in self.classeurs.items()}
+
+    def remettre_compteurs(self):
+        self.recherches = 0
+        for c in self.classeurs.values():
+            c.appels = {}
+
+
+@contextmanager
+def installer(client):
+    """Les scripts obtiennent `client` au lieu de s'authentifier auprès de Google."""
+    authorize, from_file = sheets.authorize, Credentials.__dict__["from_service_account_file"]
+    sheets.authorize = lambda creds, *a, **k: client
+    Credentials.from_service_account_file = classmethod(lambda cls, *a, **k: None)
+    sheets.oublier_client()
+    try:
+        yield client
+    finally:
+        sheets.authorize = authorize
+        Credentials.from_service_account_file = from_file
+        sheets.oublier_client()
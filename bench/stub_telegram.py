@@ -0,0 +1,166 @@
+"""
+Serveur HTTP local imitant la Bot API Telegram (sendMessage, sendPhoto, sendMediaGroup) pour les benchmarks,
+avec latence et 429 injectés. Sert aussi des "images" (HEAD/GET /img/...) pour les envois par URL.
+
+    with StubTelegram(latence_s=0.05, taux_429=0.02) as stub:
+        transport.set_transport(transport.Transport(telegram_base=stub.url))
+
+    python bench/stub_telegram.py --port 8081 --latence 0.05 --taux-429 0.02
+    TELEGRAM_API_BASE=http://127.0.0.1:8081 python Script_Bot.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, comme l'API réelle
+
+    def log_message(self, *args):
+        pass
+
+    def _repondre(self, code, corps=b"", ctype="application/json", entetes=None):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(corps)))
+        for k, v in (entetes or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(corps)
+
+    def _lire_corps(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            morceaux = []
+            while True:
+                taille = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                morceaux.append(self.rfile.read(taille + 2)[:taille])
+                if taille == 0:
+                    return b"".join(morceaux)
+        n = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(n) if n else b""
+
+    def do_HEAD(self):
+        stub = self.server.stub
+        with stub._lock:
+            stub._compte("sondes")
+        self._image()
+
+    def do_GET(self):
+        self._image()
+
+    def _image(self):
+        if self.path.startswith("/img/"):
+            self._repondre(200, b"\xff\xd8\xff\xe0" + b"\0" * 1024, ctype="image/jpeg")
+        else:
+            self._repondre(404, b"")
+
+    def do_POST(self):
+        stub = self.server.stub
+        corps = self._lire_corps()
+        methode = self.path.rsplit("/", 1)[-1]
+        album = 0
+        if methode == "sendMediaGroup":
+            champs = parse_qs(corps.decode("utf-8", "replace"))
+            album = len(json.loads(champs.get("media", ["[]"])[0]))
+        code, corps = stub._traiter(methode, len(corps), album)
+        self._repondre(code, json.dumps(corps).encode("utf-8"))
+
+
+class StubTelegram:
+    """
+    latence_s : délai de chaque réponse (± jitter_s) ; taux_429 : part des appels refusés en 429
+    (retry_after secondes) ; taux_5xx : part des appels en 502.
+    """
+
+    def __init__(self, latence_s=0.0, jitter_s=0.0, taux_429=0.0, retry_after=1, taux_5xx=0.0,
+                 hote="127.0.0.1", port=0, seed=0):
+        self.latence_s = latence_s
+        self.jitter_s = jitter_s
+        self.taux_429 = taux_429
+        self.retry_after = retry_after
+        self.taux_5xx = taux_5xx
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {}
+        self._server = ThreadingHTTPServer((hote, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        hote, port = self._server.server_address[:2]
+        return f"http://{hote}:{port}"
+
+    def _compte(self, cle, n=1):
+        self.stats[cle] = self.stats.get(cle, 0) + n
+
+    def _traiter(self, methode, octets, album=0):
+        with self._lock:
+            tirage = self._rng.random()
+            pause = max(0.0, self.latence_s + self._rng.uniform(-self.jitter_s, self.jitter_s))
+            self._compte(f"appels.{methode}")
+            self._compte("octets_recus", octets)
+            if tirage < self.taux_429:
+                self._compte("429")
+                code = 429
+            elif tirage < self.taux_429 + self.taux_5xx:
+                self._compte("5xx")
+                code = 502
+            else:
+                self._compte(f"ok.{methode}")
+                code = 200
+            n = self.stats.get(f"appels.{methode}", 0)
+        if pause:
+            time.sleep(pause)
+        if code == 429:
+            return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry later",
+                         "parameters": {"retry_after": self.retry_after}}
+        if code == 502:
+            return 502, {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+        if methode == "sendPhoto":
+            return 200, {"ok": True, "result": {"message_id": n, "photo": [
+                {"file_id": f"stub-photo-{n}-s", "width": 90}, {"file_id": f"stub-photo-{n}", "width": 800}]}}
+        if methode == "sendMessage":
+            return 200, {"ok": True, "result": {"message_id": n}}
+        if methode == "sendMediaGroup":
+            return 200, {"ok": True, "result": [
+                {"message_id": n, "photo": [{"file_id": f"stub-album-{n}-{i}", "width": 800}]} for i in range(album)]}
+        return 404, {"ok": False, "error_code": 404, "description": f"Not Found: method {methode}"}
+
+    def demarrer(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-telegram", daemon=True)
+        self._thread.start()
+        return self
+
+    def arreter(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.demarrer()
+
+    def __exit__(self, *exc):
+        self.arreter()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--latence", type=float, default=0.0, help="secondes par réponse")
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--taux-429", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--taux-5xx", type=float, default=0.0)
+    a = ap.parse_args()
+    stub = StubTelegram(a.latence, a.jitter, a.taux_429, a.retry_after, a.taux_5xx, port=a.port)
+    print(f"🤖 Stub Telegram sur {stub.url} (Ctrl+C pour arrêter)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"📊 {stub.stats}")
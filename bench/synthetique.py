@@ -0,0 +1,99 @@
+"""
+Données synthétiques pour les benchmarks : feuille Clients, onglets programmes (+ "Types")
+et feuille Planning, à la taille voulue (100 à 100k clients). Tout est produit sous forme
+de grilles (listes de lignes de chaînes), comme les renvoie get_all_values().
+"""
+import os
+import sys
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import planning_schema
+
+ENTETE_CLIENTS = ["Client", "Thème", "Canal ID", "Programme", "Saison", "Date de Démarrage",
+                  "Jours de Diffusion", "Heure envoi 1", "Heure envoi 2", "Heure envoi 3", "Date de Fin"]
+ENTETE_PROGRAMME = ["Support", "Saison", "Jour", "Type", "Phrase", "Format", "Url"]
+TYPES = [["Id", "Type"], ["1", "Aphorisme"], ["2", "Conseil"], ["3", "Réflexion"]]
+
+JOURS = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
+HEURES = ["07:30", "08:00", "09:15", "12:00", "12:30", "18:00", "19:45", "21:00"]
+
+
+def clients(n, nb_programmes=10, part_jours=0.3, part_sans_fin=0.2, seed=0, aujourdhui=None):
+    """
+    Feuille Clients : n clients répartis sur nb_programmes programmes, démarrés dans les 300 derniers jours.
+    part_jours : part des clients limités à certains jours ; part_sans_fin : "Date de Fin" vide (à calculer).
+    """
+    rng = np.random.default_rng(seed)
+    aujourdhui = aujourdhui or np.datetime64("today", "D")
+    debuts = (np.datetime64(aujourdhui, "D") - rng.integers(0, 300, n)).astype("datetime64[D]")
+    grid = [list(ENTETE_CLIENTS)]
+    for i in range(n):
+        d = debuts[i].item()
+        jours = ""
+        if rng.random() < part_jours:
+            jours = ", ".join(sorted(set(rng.choice(JOURS, 3)), key=JOURS.index))
+        h = sorted(rng.choice(HEURES, 3, replace=False))
+        fin = "" if rng.random() < part_sans_fin else "31/12/2099"
+        grid.append([
+            f"Client {i:06d}", "bien-être", str(-1001000000000 - i), str(1 + i % nb_programmes), "1",
+            d.strftime("%d/%m/%Y"), jours, h[0], h[1], h[2] if rng.random() < 0.7 else "", fin,
+        ])
+    return grid
+
+
+def programmes(nb_programmes=10, nb_jours=365, part_image=0.0, url_image="", seed=0):
+    """{titre onglet: grille} : un onglet par programme ("001", "002"...), 3 types par jour, plus "Types"."""
+    rng = np.random.default_rng(seed)
+    onglets = {}
+    for p in range(1, nb_programmes + 1):
+        grid = [list(ENTETE_PROGRAMME)]
+        for j in range(1, nb_jours + 1):
+            for t in (1, 2, 3):
+                image = url_image and rng.random() < part_image
+                grid.append(["", "1", str(j), str(t), f"Programme {p} - jour {j} - texte {t}",
+                             "image" if image else "", f"{url_image}/{p}-{j}-{t}.jpg" if image else ""])
+        onglets[f"{p:03d}"] = grid
+    onglets["Types"] = [list(r) for r in TYPES]
+    return onglets
+
+
+def planning(n, now_local, dues=100, nb_chats=None, part_image=0.0, url_image="", seed=0, retard=False):
+    """
+    Feuille Planning pour Script_Bot : n lignes triées par date/heure, de J-1 à J+1.
+    Les lignes passées sont déjà envoyées, sauf `dues` lignes (envoye=non, dans les 10 dernières minutes
+    ou depuis minuit) ; les lignes à venir (au-delà de 10 minutes) sont à "non".
+    retard=True : aucune ligne passée n'est envoyée (bot arrêté depuis J-1, à rattraper).
+    """
+    rng = np.random.default_rng(seed)
+    nb_chats = nb_chats or max(1, n // 6)
+    debut = (now_local - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    depuis_minuit = (now_local - now_local.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds()
+    recul = max(1, int(min(600, depuis_minuit - 1)))
+    now_naif = now_local.replace(tzinfo=None)
+    debut_naif = debut.replace(tzinfo=None)
+
+    # dues : juste avant maintenant ; les autres : réparties sur les 3 jours, hors de la fenêtre des dues
+    dues = min(dues, n)
+    offs = rng.integers(0, 3 * 86400, n - dues).astype("timedelta64[s]")
+    autres = np.datetime64(debut_naif, "s") + offs
+    pivot = np.datetime64(now_naif, "s")
+    autres = autres[(autres < pivot - np.timedelta64(recul, "s")) | (autres > pivot + np.timedelta64(600, "s"))]
+    instants = np.concatenate([autres, pivot - rng.integers(1, recul + 1, dues).astype("timedelta64[s]")])
+    instants.sort(kind="stable")
+
+    grid = [list(planning_schema.COLONNES)]
+    chats = rng.integers(0, nb_chats, len(instants))
+    images = rng.random(len(instants)) < part_image if url_image else np.zeros(len(instants), bool)
+    for t, c, img in zip(instants, chats, images):
+        dt = t.item()
+        passe = t <= pivot
+        envoye = "oui" if passe and t < pivot - np.timedelta64(recul, "s") and not retard else "non"
+        grid.append([
+            f"Client {c:06d}", "001", "1", str(-1001000000000 - int(c)), dt.strftime("%Y-%m-%d"),
+            dt.strftime("%H:%M:%S"), "Conseil", "12", f"Saison 1 - Jour 12 : \nConseil : message {len(grid)}",
+            "image" if img else "texte", f"{url_image}/{len(grid)}.jpg" if img else "", envoye,
+        ])
+    return grid
@@ -0,0 +1,94 @@
+import time
+import config
+import lazy
+import planning_schema
+
+pd = lazy.module("pandas")  # importé au premier usage
+
+# ======================
+# Budget d'un run Script_Bot (cron) et ordre de priorité des lignes dues
+# ======================
+# Un run ne doit pas déborder sur le tick suivant (ni sur la limite de durée du job Actions) :
+# - BOT_BUDGET_ENVOIS : au plus N lignes envoyées ; les lignes gardées sont les plus prioritaires
+# - BOT_BUDGET_S : plus aucun envoi n'est lancé après BOT_BUDGET_S - BOT_BUDGET_MARGE_S secondes ;
+#   la marge sert à écrire les dernières marques 'envoye' et à rendre les baux des lignes non envoyées
+# Priorité : lignes à l'heure, puis retard récent (les plus récentes d'abord), puis lignes périmées.
+# Elle choisit les lignes gardées et l'ordre des chats ; les lignes d'un chat partent toujours dans l'ordre chronologique.
+# Les lignes laissées restent "non" : le run suivant les reprend.
+
+BOT_BUDGET_S = getattr(config, "BOT_BUDGET_S", None)            # None = sans limite de durée
+BOT_BUDGET_ENVOIS = getattr(config, "BOT_BUDGET_ENVOIS", None)  # None = sans limite d'envois
+BOT_BUDGET_MARGE_S = getattr(config, "BOT_BUDGET_MARGE_S", 60)
+PRIORITE_PONCTUEL_MIN = getattr(config, "PRIORITE_PONCTUEL_MIN", 60)  # retard max d'une ligne "à l'heure"
+PRIORITE_PERIME_H = getattr(config, "PRIORITE_PERIME_H", 24)          # au-delà : ligne périmée
+
+
+def classes(dts, now_epoch):
+    """Classe de priorité (0 à l'heure, 1 retard récent, 2 périmée) de chaque heure prévue (Series datetime)."""
+    retard = now_epoch - planning_schema.to_epoch(dts)
+    out = pd.Series(1, index=dts.index)
+    out[retard <= PRIORITE_PONCTUEL_MIN * 60] = 0
+    out[retard > PRIORITE_PERIME_H * 3600] = 2
+    return out
+
+
+class Budget:
+    """Budget d'un run : échéance (horloge monotone) et nombre d'envois, mesurés depuis la création."""
+
+    def __init__(self, secondes=BOT_BUDGET_S, envois=BOT_BUDGET_ENVOIS, marge_s=BOT_BUDGET_MARGE_S,
+                 clock=time.monotonic):
+        self.clock = clock
+        self.debut = clock()
+        self.secondes = secondes
+        self.envois = envois
+        # échéance des envois : fin du budget moins la marge d'écriture (au moins la moitié du budget)
+        self.echeance = None
+        if secondes:
+            self.echeance = self.debut + max(float(secondes) - float(marge_s or 0), float(secondes) / 2)
+
+    def __bool__(self):
+        return bool(self.secondes or self.envois)
+
+    def selectionner(self, df, now_epoch):
+        """
+        Lignes gardées pour ce run, au plus `envois`, par priorité : à l'heure (plus anciennes d'abord),
+        puis retard récent et lignes périmées (plus récentes d'abord). Une ligne n'est gardée qu'avec
+        les lignes antérieures de son chat (ordre par chat conservé). Retourne (gardées, nb laissées).
+        """
+        if not self.envois or len(df) <= self.envois:
+            return df, 0
+        rang = rangs(df, now_epoch)
+        # rang effectif : pas avant les lignes antérieures du même chat
+        chrono = df["_dt"].sort_values(kind="stable").index
+        eff = rang[chrono].groupby(_chats(df)[chrono], sort=False).cummax()
+        t = planning_schema.to_epoch(df["_dt"])
+        ordre = pd.DataFrame({"r": eff, "t": t[chrono]}).sort_values(["r", "t"], kind="stable")
+        gardes = ordre.index[:int(self.envois)]
+        return df.loc[df.index.isin(gardes)], len(df) - len(gardes)
+
+
+def _chats(df):
+    return df["chat_id"].astype(str).str.strip()
+
+
+def rangs(df, now_epoch):
+    """Rang de priorité de chaque ligne (0 = la plus prioritaire), voir Budget.selectionner."""
+    cls = classes(df["_dt"], now_epoch)
+    t = planning_schema.to_epoch(df["_dt"])
+    cle = pd.DataFrame({"c": cls, "t": t.where(cls == 0, -t)}, index=df.index)
+    ordre = cle.sort_values(["c", "t"], kind="stable").index
+    return pd.Series(range(len(ordre)), index=ordre).reindex(df.index)
+
+
+def ordonner(df, now_epoch):
+    """
+    Ordre de soumission d'un lot : chats par ordre de leur ligne la plus prioritaire (le Dispatcher
+    sert d'abord les premiers soumis), lignes de chaque chat en ordre chronologique.
+    """
+    if df.empty:
+        return df
+    chats = _chats(df)
+    tete = rangs(df, now_epoch).groupby(chats, sort=False).transform("min")
+    t = planning_schema.to_epoch(df["_dt"])
+    cle = pd.DataFrame({"p": tete, "t": t}, index=df.index)
+    return df.loc[cle.sort_values(["p", "t"], kind="stable").index]
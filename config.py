@@ -8,6 +8,13 @@ FICHIER_CLIENTS = "Suivi Programme et heure client"
 FICHIER_PLANNING = "planning"
 FICHIER_PROGRAMMES = "Méta-université_Programmes"
 
+# Clés des classeurs (.../spreadsheets/d/<clé>/edit) : ouverture directe, sans recherche Drive par titre.
+# Vide = clé trouvée une fois par titre puis mémorisée dans CACHE_DIR/classeurs.json
+CLE_CLIENTS = os.environ.get("CLE_CLIENTS", "")
+CLE_PLANNING = os.environ.get("CLE_PLANNING", "")
+CLE_PROGRAMMES = os.environ.get("CLE_PROGRAMMES", "")
+CLES_CACHE_TTL_H = 24        # clé mémorisée re-vérifiée par titre au-delà (heures)
+
 # Google Sheet – Feuilles internes
 FEUILLE_CLIENTS = "Clients"
 FEUILLE_PLANNING = "Planning"
@@ -15,12 +22,99 @@ FEUILLE_PLANNING = "Planning"
 # === API Telegram ===
 TELEGRAM_TOKEN = os.environ.get('TELEGRAM_TOKEN', 'VOTRE_TOKEN_PAR_DEFAUT')
 
+# Envoi concurrent (limites Telegram appliquées en seaux à jetons)
+TELEGRAM_WORKERS = 8         # nb de threads d'envoi
+TELEGRAM_RATE_GLOBAL = 30    # msg/s tous chats confondus
+TELEGRAM_RATE_CHAT = 1       # msg/s par chat
+
+# Rattrapage après une interruption : lignes d'un chat en retard de plus de RATTRAPAGE_MINUTES regroupées
+# (textes fusionnés jusqu'à 4096 caractères, images en album sendMediaGroup). Change ce que reçoivent les
+# destinataires : désactivé par défaut, et ignoré si SEND_WINDOW_MINUTES est renseigné
+RATTRAPAGE = False
+RATTRAPAGE_MINUTES = 60
+
+# Lecture fenêtrée du planning (Script_Bot) : seules les plages de lignes pouvant être dues sont lues
+PLANNING_RANGE_GAP = 5          # lignes d'écart fusionnées dans une même plage
+PLANNING_RANGES_PAR_APPEL = 100 # plages par appel batch_get
+# Lecture complète du planning (Script_Planning, amorçage du store) : par blocs de lignes, chaque bloc
+# converti en DataFrame typé (catégories, petits entiers) dès sa réception
+PLANNING_BLOC_LIGNES = 5000
+
+# Plusieurs workers Script_Bot : chats répartis par crc32(chat_id) % BOT_SHARD_COUNT,
+# et bail sur les lignes (envoye = "en_cours:<worker>:<expiration>") pour éviter les doubles envois
+BOT_SHARD_COUNT = int(os.environ.get("BOT_SHARD_COUNT") or 1)
+BOT_SHARD_INDEX = int(os.environ.get("BOT_SHARD_INDEX") or 0)
+BOT_WORKER_ID = os.environ.get("BOT_WORKER_ID", "")   # vide = <hôte>-<pid>
+BOT_LEASES = BOT_SHARD_COUNT > 1   # réserver les lignes avant envoi (True : protège aussi un worker unique
+                                   # contre un run qui se chevauche, au prix d'une écriture + LEASE_SETTLE_S par lot)
+LEASE_MINUTES = 10           # au-delà (+ 2 x durée estimée du lot, chat le plus chargé compris), un bail abandonné est repris
+LEASE_SETTLE_S = 2           # attente entre la pose des baux et leur relecture
+LEASE_MARGE_S = 60           # plus aucun envoi lancé moins de N s avant l'expiration du bail (le reste est rendu)
+
+# Budget d'un run Script_Bot (cron) : le run se termine avant le tick suivant, le reste est repris ensuite.
+# Priorité : lignes à l'heure, puis retard récent (plus récentes d'abord), puis lignes périmées
+BOT_BUDGET_S = int(os.environ.get("BOT_BUDGET_S") or 0) or None          # durée max du run (s), None = sans limite
+BOT_BUDGET_ENVOIS = int(os.environ.get("BOT_BUDGET_ENVOIS") or 0) or None  # envois max par run, None = sans limite
+BOT_BUDGET_MARGE_S = 60      # fin des envois BOT_BUDGET_MARGE_S avant l'échéance (écriture des marques, baux rendus)
+PRIORITE_PONCTUEL_MIN = 60   # retard max d'une ligne "à l'heure" (minutes)
+PRIORITE_PERIME_H = 24       # retard au-delà duquel une ligne est périmée (heures)
+
+# Journal des envois (CACHE_DIR/envois.jsonl) + écriture des marques 'envoye' par lots pendant le run
+FLUSH_ENVOIS = 50            # lot poussé dès N envois réussis...
+FLUSH_SECONDES = 10          # ...ou N secondes après le premier envoi en attente
+
+# Mode résident de Script_Bot (python Script_Bot.py --daemon)
+DAEMON_RELOAD_S = 300        # rechargement incrémental du planning (s)
+DAEMON_DUREE_MAX_MIN = None  # arrêt propre au bout de N minutes (None = sans limite)
+
+# Transport HTTP partagé (connexions keep-alive en pool, Telegram + Drive)
+TELEGRAM_API_BASE = os.environ.get("TELEGRAM_API_BASE", "https://api.telegram.org")
+HTTP_POOL_CONNECTIONS = 4    # nb d'hôtes gardés en pool
+HTTP_POOL_MAXSIZE = 16       # connexions par hôte (>= TELEGRAM_WORKERS)
+HTTP_TIMEOUT_CONNECT = 5     # secondes
+HTTP_TIMEOUT_TELEGRAM = 10   # sendMessage / sendPhoto par URL
+HTTP_TIMEOUT_UPLOAD = 20     # sendPhoto avec fichier
+HTTP_TIMEOUT_DRIVE = 15      # téléchargement Google Drive
+HTTP_TIMEOUT_PROBE = 7       # HEAD des URLs d'images
+
+# Caches locaux conservés entre deux runs (actions/cache dans les workflows)
+CACHE_DIR = os.environ.get("CACHE_DIR", ".cache")
+FILE_ID_CACHE_MAX = 500          # images (Drive / URL) -> file_id Telegram, LRU au-delà
+FILE_ID_CACHE_TTL_JOURS = 30
+# Sonde (HEAD) des URLs d'images non Drive, en cache dans CACHE_DIR/sondes_images.json, échecs compris
+SONDE_CACHE_MAX = 2000           # URLs gardées, LRU au-delà
+SONDE_TTL_H = 24                 # URL servant une image : re-sondée au-delà (heures)
+SONDE_TTL_ECHEC_MIN = 60         # URL refusée / hôte injoignable : envoyée en lien sans re-sonde pendant N minutes
+
+# Store local SQLite du planning (optionnel) : index sur (envoye, scheduled_at) et (chat_id, date),
+# la feuille "Planning" reste synchronisée pour les opérateurs. Vide = désactivé.
+# Ex: PLANNING_STORE=.store/planning.sqlite (cache Actions à part, voir bot.yaml) ; vérifié contre la feuille à chaque run
+PLANNING_STORE = os.environ.get("PLANNING_STORE", "")
+
+# Images Drive : flux direct Drive -> Telegram + préchargement en mémoire des images du run
+MEDIA_PREFETCH_WORKERS = 4
+MEDIA_PREFETCH_MAX_MO = 64   # budget mémoire total du préchargement
+MEDIA_MAX_MO = 10            # taille max d'une image (limite Telegram sendPhoto)
+
+
+# Métriques de run (étapes, compteurs, latences) : rapport JSON et/ou fichier Prometheus ({script} = bot / planning)
+METRICS_JSON = os.environ.get("METRICS_JSON", os.path.join(CACHE_DIR, "metrics", "{script}.json"))
+METRICS_PROM = os.environ.get("METRICS_PROM", "")    # ex: /var/lib/node_exporter/metabot_{script}.prom
+METRICS_PROFILE = os.environ.get("METRICS_PROFILE", "").lower() in ("1", "true", "oui")  # cProfile (ou --profile)
+
 
 # === ⏱️ Autres paramètres
-NB_JOURS_GENERATION = 2      # Nombre de jours de planning à générer
+NB_JOURS_GENERATION = 2      # Nombre de jours de planning à générer (génération vectorisée : 30 à 90 jours possibles)
 RETENTION_JOURS = 2          # garde J-2 (purge plus vieux)
+PROG_CACHE = True            # cache persistant des onglets programmes (CACHE_DIR/programmes.json)
+PROG_CACHE_MAX_MO = 20       # taille max du cache (onglets les moins récemment utilisés retirés)
+PROG_CACHE_REFRESH = os.environ.get("PROG_CACHE_REFRESH", "").lower() in ("1", "true", "oui")  # force la relecture
+PROG_FETCH_WORKERS = 4       # lectures concurrentes des onglets programmes (si la lecture groupée échoue)
 GSHEETS_MAX_RETRIES = 5
 GSHEETS_RETRY_BASE = 1.5     # exponentiel (1.5^n) + jitter
+GSHEETS_RETRY_MAX_S = 64     # attente max entre deux essais (hors Retry-After)
+GSHEETS_READS_PAR_MIN = 60   # quota Sheets lectures / minute / utilisateur
+GSHEETS_WRITES_PAR_MIN = 60  # quota Sheets écritures / minute / utilisateur
 
 FUSEAU_HORAIRE = "Europe/Paris"
 LANGUE = "fr_FR.UTF-8"
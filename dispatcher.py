@@ -0,0 +1,193 @@
+import heapq
+import threading
+import time
+from collections import deque
+
+# ======================
+# Moteur d'envoi concurrent (Script_Bot)
+# ======================
+# - pool borné de workers (threads : les appels HTTP sont bloquants)
+# - seau à jetons global (~30 msg/s) + un seau par chat (~1 msg/s)
+# - l'ordre des messages est conservé dans chaque chat (un seul envoi en cours par chat)
+# - un 429 (retry_after) ne met en pause que le chat concerné
+# - échéance optionnelle : plus aucune tâche lancée après, les tâches restantes sont rendues (restants())
+
+_local = threading.local()
+
+
+def dans_worker():
+    """True si le thread courant exécute un envoi pour un Dispatcher."""
+    return getattr(_local, "actif", False)
+
+
+class RetryAfter(Exception):
+    """
+    Levée par l'envoi quand Telegram répond 429 depuis un worker :
+    le dispatcher remet la tâche en tête de file et met le chat en pause.
+    """
+    def __init__(self, seconds):
+        super().__init__(f"retry_after:{seconds}")
+        self.seconds = max(0.0, float(seconds))
+
+
+class TokenBucket:
+    """Seau à jetons thread-safe : `rate` jetons/s, au plus `capacity` en réserve."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.clock = clock
+        self.stamp = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self.stamp:
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def try_acquire(self):
+        """Prend un jeton si possible. Retourne 0 si pris, sinon le délai d'attente (s)."""
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0.0
+            return (1.0 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Bloque jusqu'à obtention d'un jeton."""
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+class _Tache:
+    __slots__ = ("chat", "job", "essais_429")
+
+    def __init__(self, chat, job):
+        self.chat = chat
+        self.job = job
+        self.essais_429 = 0
+
+
+class Dispatcher:
+    """
+    File d'envoi par chat + pool de workers.
+
+    send_fn(job) -> (success, err) ; peut lever RetryAfter.
+    run() retourne la liste des (job, success, err) dans l'ordre de fin ; echeance (même horloge
+    que clock) : les tâches pas encore lancées à l'échéance ne le sont pas, voir restants().
+    """
+
+    def __init__(self, send_fn, workers=8, global_rate=30.0, chat_rate=1.0,
+                 chat_burst=1, max_429=5, clock=time.monotonic, echeance=None):
+        self.send_fn = send_fn
+        self.workers = max(1, int(workers))
+        self.global_bucket = TokenBucket(global_rate, clock=clock)
+        self.chat_rate = float(chat_rate)
+        self.chat_burst = chat_burst
+        self.max_429 = int(max_429)
+        self.clock = clock
+        self.echeance = echeance
+
+        self._queues = {}   # chat -> deque[_Tache]
+        self._buckets = {}  # chat -> TokenBucket
+        self._heap = []     # (ready_at, seq, chat) pour les chats prêts et inactifs
+        self._seq = 0
+        self._active = 0
+        self._cv = threading.Condition()
+        self._results = []
+
+    def submit(self, chat_id, job):
+        chat = str(chat_id).strip()
+        q = self._queues.get(chat)
+        if q is None:
+            q = self._queues[chat] = deque()
+            self._buckets[chat] = TokenBucket(self.chat_rate, self.chat_burst, clock=self.clock)
+            self._push(chat, self.clock())
+        q.append(_Tache(chat, job))
+
+    def _push(self, chat, ready_at):
+        self._seq += 1
+        heapq.heappush(self._heap, (ready_at, self._seq, chat))
+
+    def _next(self):
+        """Attend le prochain chat prêt ; retourne sa tâche de tête, ou None si tout est fini."""
+        with self._cv:
+            while True:
+                if self.echeance is not None and self.clock() >= self.echeance:
+                    self._cv.notify_all()
+                    return None
+                if not self._heap:
+                    if self._active == 0:
+                        self._cv.notify_all()
+                        return None
+                    self._cv.wait()
+                    continue
+                ready_at, _, chat = self._heap[0]
+                wait = ready_at - self.clock()
+                if wait > 0:
+                    if self.echeance is not None:
+                        wait = min(wait, max(0.0, self.echeance - self.clock()))
+                    self._cv.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                wait = self._buckets[chat].try_acquire()
+                if wait > 0:
+                    self._push(chat, self.clock() + wait)
+                    continue
+                self._active += 1
+                return self._queues[chat].popleft()
+
+    def _done(self, tache, result=None, pause=None):
+        with self._cv:
+            self._active -= 1
+            q = self._queues[tache.chat]
+            if result is not None:
+                self._results.append((tache.job,) + tuple(result))
+            if pause is not None:
+                q.appendleft(tache)
+                self._push(tache.chat, self.clock() + pause)
+            elif q:
+                self._push(tache.chat, self.clock())
+            self._cv.notify_all()
+
+    def _worker(self):
+        while True:
+            tache = self._next()
+            if tache is None:
+                return
+            self.global_bucket.acquire()
+            _local.actif = True
+            try:
+                result = self.send_fn(tache.job)
+            except RetryAfter as e:
+                tache.essais_429 += 1
+                if tache.essais_429 > self.max_429:
+                    self._done(tache, (False, f"429:{e}"))
+                else:
+                    self._done(tache, pause=e.seconds + 1)
+                continue
+            except Exception as e:
+                result = (False, f"exception:{e}")
+            finally:
+                _local.actif = False
+            self._done(tache, result)
+
+    def restants(self):
+        """Tâches jamais terminées (échéance atteinte avant leur tour), dans l'ordre de chaque chat."""
+        with self._cv:
+            return [t.job for q in self._queues.values() for t in q]
+
+    def run(self):
+        n = min(self.workers, max(1, len(self._queues)))
+        threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return self._results
@@ -0,0 +1,28 @@
+import json
+import os
+import tempfile
+import config
+
+# ======================
+# Fichiers persistants des runs (caches, journal, métriques)
+# ======================
+# CACHE_DIR est conservé entre deux runs (actions/cache dans les workflows) ;
+# write_json_atomic : fichier temporaire puis os.replace, jamais de JSON à moitié écrit.
+
+CACHE_DIR = getattr(config, "CACHE_DIR", ".cache")
+
+
+def write_json_atomic(path, obj):
+    d = os.path.dirname(path) or "."
+    os.makedirs(d, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=d, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.unlink(tmp)
+        except Exception:
+            pass
+        raise
@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+import time
+import config
+from fichiers import CACHE_DIR
+
+# ======================
+# Journal des envois (write-ahead) + écriture différée des marques 'envoye'
+# ======================
+# Chaque envoi réussi est d'abord ajouté (fsync) au journal local, puis poussé vers la feuille
+# par lots (toutes les FLUSH_ENVOIS lignes ou FLUSH_SECONDES) ; une fois la feuille à jour,
+# le lot est acquitté dans le journal. Un run interrompu (crash, timeout Actions, écriture
+# échouée) laisse des entrées non acquittées, rejouées par le run suivant avant tout envoi.
+
+FLUSH_ENVOIS = getattr(config, "FLUSH_ENVOIS", 50)
+FLUSH_SECONDES = getattr(config, "FLUSH_SECONDES", 10)
+
+
+def cle_ligne(row):
+    """Identité d'une ligne du planning, indépendante de son numéro (chat_id|date|heure)."""
+    return "|".join(str(row[c]).strip() for c in ("chat_id", "date", "heure"))
+
+
+class Journal:
+    """Fichier JSONL append-only : {"r": ligne, "k": clé} par envoi, {"ack": [lignes]} par lot poussé."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, "envois.jsonl")
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._lock = threading.Lock()
+        self._f = open(self.path, "a", encoding="utf-8")
+
+    def _ecrire(self, obj):
+        with self._lock:
+            self._f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def noter(self, row, cle):
+        self._ecrire({"r": int(row), "k": cle, "t": int(time.time())})
+
+    def acquitter(self, rows):
+        if rows:
+            self._ecrire({"ack": [int(r) for r in rows]})
+
+    def en_attente(self):
+        """[(ligne, clé)] des envois notés mais pas encore acquittés."""
+        attente = {}
+        with self._lock:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            e = json.loads(line)
+                        except ValueError:
+                            continue  # ligne tronquée (arrêt pendant l'écriture)
+                        if "ack" in e:
+                            for r in e["ack"]:
+                                attente.pop(r, None)
+                        elif "r" in e:
+                            attente[e["r"]] = e.get("k", "")
+            except FileNotFoundError:
+                pass
+        return list(attente.items())
+
+    def vider(self):
+        """Tout est acquitté : repart d'un journal vide."""
+        with self._lock:
+            self._f.close()
+            self._f = open(self.path, "w", encoding="utf-8")
+            os.fsync(self._f.fileno())
+
+    def fermer(self):
+        with self._lock:
+            self._f.close()
+
+
+class EcritureDifferee:
+    """
+    Write-behind : pousser(updates) est appelé depuis un thread dès que FLUSH_ENVOIS mises à jour
+    attendent, ou FLUSH_SECONDES après la première. En cas d'échec, le lot reste en attente
+    (nouvel essai au tour suivant). fermer() pousse le reste.
+    """
+
+    def __init__(self, pousser, n=FLUSH_ENVOIS, secondes=FLUSH_SECONDES):
+        self.pousser = pousser
+        self.n = max(1, int(n))
+        self.secondes = float(secondes)
+        self._attente = []
+        self._depuis = None
+        self._cond = threading.Condition()
+        self._fin = False
+        self._thread = threading.Thread(target=self._boucle, name="flush-envoye", daemon=True)
+        self._thread.start()
+
+    def ajouter(self, updates):
+        with self._cond:
+            if not self._attente:
+                self._depuis = time.monotonic()
+            self._attente.extend(updates)
+            if len(self._attente) >= self.n:
+                self._cond.notify()
+
+    def _prendre(self):
+        lot, self._attente, self._depuis = self._attente, [], None
+        return lot
+
+    def _pousser(self, lot):
+        try:
+            self.pousser(lot)
+            return True
+        except Exception as e:
+            print(f"⚠️ Écriture des marques 'envoye' échouée ({len(lot)} ligne(s)), nouvel essai : {e}")
+            with self._cond:
+                self._attente[:0] = lot
+                self._depuis = self._depuis or time.monotonic()
+            return False
+
+    def _boucle(self):
+        while True:
+            with self._cond:
+                while not self._fin and not (
+                    len(self._attente) >= self.n
+                    or (self._attente and time.monotonic() - self._depuis >= self.secondes)
+                ):
+                    delai = None if not self._attente else max(0.0, self.secondes - (time.monotonic() - self._depuis))
+                    self._cond.wait(delai)
+                if self._fin:
+                    return
+                lot = self._prendre()
+            if not self._pousser(lot):
+                time.sleep(min(self.secondes, 5))
+
+    def fermer(self):
+        """Arrête le thread et pousse les mises à jour restantes. Retourne False si l'écriture échoue."""
+        with self._cond:
+            self._fin = True
+            self._cond.notify()
+        self._thread.join()
+        with self._cond:
+            lot = self._prendre()
+        if not lot:
+            return True
+        try:
+            self.pousser(lot)
+            return True
+        except Exception as e:
+            print(f"⚠️ Marques 'envoye' non écrites ({len(lot)} ligne(s)) : rejouées au prochain run ({e})")
+            return False
@@ -0,0 +1,36 @@
+import importlib
+import threading
+
+# ======================
+# Imports différés
+# ======================
+# pd = lazy.module("pandas") : pandas n'est importé qu'au premier accès à un attribut (pd.DataFrame...).
+# Un run de Script_Bot sans ligne due ne paie donc pas l'import de pandas / numpy.
+
+
+class _Module:
+    def __init__(self, nom):
+        self._nom = nom
+        self._mod = None
+        self._lock = threading.Lock()
+
+    def _charger(self):
+        if self._mod is None:
+            with self._lock:
+                if self._mod is None:
+                    self._mod = importlib.import_module(self._nom)
+        return self._mod
+
+    def __getattr__(self, attr):
+        if attr in ("_nom", "_mod", "_lock"):   # objet pas encore initialisé (copie, pickle)
+            raise AttributeError(attr)
+        return getattr(self._charger(), attr)
+
+    def __repr__(self):
+        etat = "chargé" if self._mod is not None else "différé"
+        return f"<module {self._nom!r} ({etat})>"
+
+
+def module(nom):
+    """Module importé au premier accès à un de ses attributs."""
+    return _Module(nom)
@@ -0,0 +1,263 @@
+import functools
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import config
+import metrics
+import transport
+
+# ======================
+# Étape média : Drive -> Telegram en flux, sans fichier temporaire
+# ======================
+# - le corps multipart de sendPhoto est produit à la volée à partir de la réponse Drive
+#   (mémoire bornée à un chunk)
+# - les images Drive dues dans le run sont pré-téléchargées en parallèle, en mémoire,
+#   dans la limite d'un budget (MEDIA_PREFETCH_MAX_MO) ; au-delà, flux direct à l'envoi
+
+MEDIA_PREFETCH_WORKERS = getattr(config, "MEDIA_PREFETCH_WORKERS", 4)
+MEDIA_PREFETCH_MAX_MO = getattr(config, "MEDIA_PREFETCH_MAX_MO", 64)   # budget mémoire total
+MEDIA_MAX_MO = getattr(config, "MEDIA_MAX_MO", 10)                     # limite Telegram sendPhoto
+CHUNK = 64 * 1024
+
+DRIVE_FILE_RE = re.compile(
+    r"(?:https?://)?(?:drive\.google\.com)/(?:file/d/([a-zA-Z0-9_-]+)|open\?id=([a-zA-Z0-9_-]+))"
+)
+DRIVE_DOWNLOAD_URL = "https://drive.google.com/uc?export=download"
+
+@functools.lru_cache(maxsize=4096)
+def extract_drive_file_id(url: str) -> str:
+    """
+    Extrait l'ID Google Drive à partir de liens de type:
+    - https://drive.google.com/file/d/<FILE_ID>/view?...
+    - https://drive.google.com/open?id=<FILE_ID>
+    Retourne "" si non reconnu. Mémorisé : une même URL revient sur de nombreuses lignes.
+    """
+    if not url:
+        return ""
+    m = DRIVE_FILE_RE.search(url)
+    if not m:
+        return ""
+    return m.group(1) or m.group(2) or ""
+
+def open_drive_stream(file_id: str):
+    """
+    Ouvre un fichier Google Drive public via 'uc?export=download&id=...' en streaming.
+    Gère le token de confirmation pour les redirections/scan antivirus de Drive.
+    Retourne la réponse requests (stream=True, à fermer). Lève une Exception en cas d'échec.
+    """
+    if not file_id:
+        raise ValueError("Missing Google Drive file id")
+
+    http = transport.get_transport()
+    params = {"id": file_id}
+    r = http.get(DRIVE_DOWNLOAD_URL, params=params, stream=True, allow_redirects=True)
+
+    # Si Drive renvoie une page HTML de confirmation, récupérer le token 'confirm'
+    if ("text/html" in r.headers.get("content-type", "")) and r.text:
+        m = re.search(r"confirm=([0-9A-Za-z_]+)", r.text)
+        if m:
+            params["confirm"] = m.group(1)
+            r.close()
+            r = http.get(DRIVE_DOWNLOAD_URL, params=params, stream=True, allow_redirects=True)
+
+    try:
+        r.raise_for_status()
+    except Exception:
+        r.close()
+        raise
+    return r
+
+def _content_length(r):
+    # la longueur n'est fiable que si le corps n'est pas ré-encodé (gzip…)
+    if r.headers.get("content-encoding"):
+        return None
+    try:
+        return int(r.headers.get("content-length", ""))
+    except ValueError:
+        return None
+
+def _suffix(ctype):
+    # Déterminer une extension selon le content-type si possible
+    for k, ext in (("jpeg", ".jpg"), ("png", ".png"), ("webp", ".webp"), ("gif", ".gif")):
+        if k in ctype:
+            return ext
+    return ".bin"  # inconnu (Telegram s'en fiche si c'est bien une image)
+
+
+class Flux:
+    """Contenu ouvert : content_type, itérable de chunks, longueur (ou None), fermeture."""
+
+    def __init__(self, content_type, chunks, length=None, close=None):
+        self.content_type = content_type or "application/octet-stream"
+        self.chunks = chunks
+        self.length = length
+        self._close = close
+
+    def close(self):
+        if self._close:
+            try:
+                self._close()
+            except Exception:
+                pass
+
+
+class BufferSource:
+    """Image déjà en mémoire (pré-téléchargée) : rejouable à chaque essai."""
+
+    def __init__(self, data, content_type):
+        self.data = data
+        self.content_type = content_type
+
+    def open(self):
+        view = memoryview(self.data)
+        return Flux(self.content_type, (view[i:i + CHUNK] for i in range(0, len(view), CHUNK)), len(view))
+
+
+class DriveSource:
+    """Image Drive lue en flux direct : chaque essai ré-ouvre la réponse Drive."""
+
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+    def open(self):
+        r = open_drive_stream(self.file_id)
+        return Flux(r.headers.get("content-type", ""), r.iter_content(CHUNK), _content_length(r), r.close)
+
+
+class MultipartBody:
+    """
+    Corps multipart/form-data produit à la volée (itérable) : champs texte + un fichier.
+    Longueur connue -> Content-Length, sinon requests envoie en chunked.
+    """
+
+    def __init__(self, fields, name, flux):
+        self.boundary = uuid.uuid4().hex
+        b = self.boundary
+        head = []
+        for k, v in fields.items():
+            head.append(f'--{b}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n'.encode()
+                        + str(v).encode("utf-8") + b"\r\n")
+        filename = f"{name}{_suffix(flux.content_type)}"
+        head.append((f'--{b}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f"Content-Type: {flux.content_type}\r\n\r\n").encode())
+        self._head = b"".join(head)
+        self._tail = f"\r\n--{b}--\r\n".encode()
+        self._flux = flux
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        if self._flux.length is None:
+            return 0
+        return len(self._head) + self._flux.length + len(self._tail)
+
+    def __bool__(self):
+        # __len__ vaut 0 si la longueur est inconnue : le corps n'est pas vide pour autant
+        return True
+
+    def __iter__(self):
+        yield self._head
+        for chunk in self._flux.chunks:
+            if chunk:
+                yield bytes(chunk)
+        yield self._tail
+
+
+class Prefetcher:
+    """
+    Pré-télécharge en parallèle les images Drive du run, en mémoire, dans un budget borné.
+    take(file_id) -> BufferSource, ou None (pas pré-téléchargée : flux direct à l'envoi).
+    """
+
+    def __init__(self, workers=MEDIA_PREFETCH_WORKERS, max_bytes=MEDIA_PREFETCH_MAX_MO * 1024 * 1024,
+                 max_item_bytes=MEDIA_MAX_MO * 1024 * 1024):
+        self.max_bytes = int(max_bytes)
+        self.max_item_bytes = int(max_item_bytes)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="media")
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._used = 0
+
+    def _reserve(self, n):
+        with self._lock:
+            if self._used + n > self.max_bytes:
+                return False
+            self._used += n
+            return True
+
+    def _release(self, n):
+        with self._lock:
+            self._used = max(0, self._used - n)
+
+    def prefetch(self, file_ids):
+        with self._lock:
+            for fid in dict.fromkeys(file_ids):
+                if fid and fid not in self._futures:
+                    self._futures[fid] = self._pool.submit(self._fetch, fid)
+
+    def _fetch(self, file_id):
+        with metrics.chrono("drive_telechargement_secondes"):
+            return self._telecharger(file_id)
+
+    def _telecharger(self, file_id):
+        reserved = 0
+        try:
+            r = open_drive_stream(file_id)
+        except Exception as e:
+            print(f"⚠️ Préchargement Drive échoué ({file_id}) : {e}")
+            return None
+        try:
+            length = _content_length(r)
+            if length is not None:
+                if length > self.max_item_bytes or not self._reserve(length):
+                    return None
+                reserved = length
+            buf = bytearray()
+            for chunk in r.iter_content(CHUNK):
+                buf += chunk
+                if len(buf) > reserved:
+                    if len(buf) > self.max_item_bytes or not self._reserve(len(buf) - reserved):
+                        self._release(reserved)
+                        return None
+                    reserved = len(buf)
+            if reserved > len(buf):
+                self._release(reserved - len(buf))
+            return BufferSource(buf, r.headers.get("content-type", ""))
+        except Exception as e:
+            self._release(reserved)
+            print(f"⚠️ Préchargement Drive échoué ({file_id}) : {e}")
+            return None
+        finally:
+            r.close()
+
+    def take(self, file_id):
+        with self._lock:
+            fut = self._futures.get(file_id)
+            if fut is None:
+                return None
+            if fut.cancel():
+                # pas encore commencé : inutile d'attendre, l'envoi lira Drive en flux direct
+                del self._futures[file_id]
+                return None
+        try:
+            return fut.result()
+        except Exception:
+            return None
+
+    def release(self, file_id):
+        """Libère le tampon d'une image (après la tentative d'envoi, réussie ou non)."""
+        with self._lock:
+            fut = self._futures.pop(file_id, None)
+        if fut is not None and fut.done() and not fut.cancelled():
+            src = fut.result()
+            if src is not None:
+                self._release(len(src.data))
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self._futures.clear()
+            self._used = 0
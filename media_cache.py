@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+import time
+import config
+from fichiers import CACHE_DIR, write_json_atomic
+
+# ======================
+# Cache persistant des file_id Telegram
+# ======================
+# Une image déjà envoyée une fois (Drive ou URL) est renvoyée par son file_id Telegram :
+# plus de téléchargement ni d'upload. Le fichier JSON est conservé entre deux runs
+# (actions/cache sur CACHE_DIR dans le workflow).
+
+FILE_ID_CACHE_MAX = getattr(config, "FILE_ID_CACHE_MAX", 500)          # nb d'entrées (LRU au-delà)
+FILE_ID_CACHE_TTL_JOURS = getattr(config, "FILE_ID_CACHE_TTL_JOURS", 30)
+SONDE_CACHE_MAX = getattr(config, "SONDE_CACHE_MAX", 2000)         # nb d'URLs sondées (LRU au-delà)
+SONDE_TTL_H = getattr(config, "SONDE_TTL_H", 24)                    # résultat positif (image)
+SONDE_TTL_ECHEC_MIN = getattr(config, "SONDE_TTL_ECHEC_MIN", 60)    # résultat négatif (pas une image, hôte muet)
+
+
+class CacheJson:
+    """
+    Cache clé -> entrée (dict) persisté en JSON, partagé entre threads.
+    Chaque entrée porte son horodatage d'écriture (champ `horodatage`) et de dernier usage ("used").
+    Éviction : entrées expirées (ttl_s, voir _ttl), puis LRU au-delà de max_entries.
+    Sous-classes : nom (messages), horodatage, _valide (entrées relues), _ttl (TTL par entrée).
+    """
+
+    nom = "cache"
+    horodatage = "created"
+
+    def __init__(self, path, max_entries, ttl_s):
+        self.path = path
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl_s)
+        self._data = {}   # clé -> entrée
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._dirty = False
+        self._load()
+
+    def _valide(self, v):
+        return isinstance(v, dict)
+
+    def _ttl(self, v):
+        return self.ttl
+
+    def _expire(self, v, now):
+        return now - float(v.get(self.horodatage, 0)) > self._ttl(v)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._data = {k: v for k, v in data.items() if self._valide(v)}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ {self.nom} illisible ({self.path}) : {e}")
+        self._evict(time.time())
+
+    def _evict(self, now):
+        expired = [k for k, v in self._data.items() if self._expire(v, now)]
+        for k in expired:
+            del self._data[k]
+        extra = len(self._data) - self.max_entries
+        if extra > 0:
+            for k, _ in sorted(self._data.items(), key=lambda kv: float(kv[1].get("used", 0)))[:extra]:
+                del self._data[k]
+        if expired or extra > 0:
+            self._dirty = True
+
+    def _get(self, key):
+        """Entrée encore valide pour key (marquée utilisée) ou None."""
+        now = time.time()
+        with self._lock:
+            v = self._data.get(key)
+            if v is None:
+                return None
+            if self._expire(v, now):
+                del self._data[key]
+                self._dirty = True
+                return None
+            v["used"] = now
+            self._dirty = True
+            return v
+
+    def _put(self, key, entree):
+        now = time.time()
+        with self._lock:
+            self._data[key] = dict(entree, **{self.horodatage: now, "used": now})
+            self._dirty = True
+            self._evict(now)
+
+    def discard(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._dirty = True
+
+    def verrou(self, key):
+        """Verrou par clé : un seul calcul (upload, sonde) à la fois pour une même clé."""
+        with self._lock:
+            lk = self._inflight.get(key)
+            if lk is None:
+                lk = self._inflight[key] = threading.Lock()
+            return lk
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = dict(self._data)
+            self._dirty = False
+        try:
+            write_json_atomic(self.path, snapshot)
+        except Exception as e:
+            print(f"⚠️ {self.nom} non sauvegardé : {e}")
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FileIdCache(CacheJson):
+    """
+    clé ("drive:<id>" ou "url:<url>") -> file_id Telegram.
+    Éviction : entrées plus vieilles que ttl_jours, puis LRU au-delà de max_entries.
+    """
+
+    nom = "Cache file_id"
+
+    def __init__(self, path=None, max_entries=FILE_ID_CACHE_MAX, ttl_jours=FILE_ID_CACHE_TTL_JOURS):
+        super().__init__(path or os.path.join(CACHE_DIR, "telegram_file_ids.json"),
+                         max_entries, float(ttl_jours) * 86400)
+
+    def _valide(self, v):
+        return isinstance(v, dict) and bool(v.get("file_id"))
+
+    def get(self, key):
+        v = self._get(key)
+        return None if v is None else v["file_id"]
+
+    def put(self, key, file_id):
+        if file_id:
+            self._put(key, {"file_id": file_id})
+
+
+# ======================
+# Cache persistant de la résolution des URLs d'images
+# ======================
+# Une URL d'image non Drive est sondée (HEAD, content-type image/*) une fois par SONDE_TTL_H,
+# et non plus à chaque ligne, chaque chat et chaque run. Les échecs (pas une image, délai dépassé,
+# hôte injoignable) sont aussi gardés, SONDE_TTL_ECHEC_MIN : un hôte lent ne coûte qu'une sonde.
+
+
+class SondeCache(CacheJson):
+    """
+    url -> {"ok": bool, "ctype": content-type reçu, "motif": raison de l'échec}.
+    Éviction : entrées expirées (TTL selon le résultat), puis LRU au-delà de max_entries.
+    """
+
+    nom = "Cache des sondes"
+    horodatage = "checked"
+
+    def __init__(self, path=None, max_entries=SONDE_CACHE_MAX, ttl_h=SONDE_TTL_H, ttl_echec_min=SONDE_TTL_ECHEC_MIN):
+        self.ttl_echec = float(ttl_echec_min) * 60
+        super().__init__(path or os.path.join(CACHE_DIR, "sondes_images.json"), max_entries, float(ttl_h) * 3600)
+
+    def _valide(self, v):
+        return isinstance(v, dict) and "ok" in v
+
+    def _ttl(self, v):
+        return self.ttl if v.get("ok") else self.ttl_echec
+
+    def get(self, url):
+        """Résultat encore valide pour url (dict) ou None."""
+        return self._get(url)
+
+    def put(self, url, ok, ctype="", motif=""):
+        self._put(url, {"ok": bool(ok), "ctype": ctype, "motif": motif})
@@ -0,0 +1,233 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import config
+from fichiers import CACHE_DIR, write_json_atomic
+
+# ======================
+# Instrumentation des runs (Script_Bot / Script_Planning)
+# ======================
+# - étapes chronométrées : with metrics.etape("lecture"): ...  ou  metrics.jalon("lecture") en fin de bloc
+# - compteurs : metrics.incr("telegram_429_total")
+# - histogrammes de latence par appel externe : metrics.observer("http_latence_secondes", dt, appel="telegram.sendMessage")
+# - mémoire : RSS du processus et pic atteint jusque-là (ru_maxrss), relevés à la fin de chaque étape
+# En fin de run : rapport JSON (METRICS_JSON) et/ou fichier texte Prometheus (METRICS_PROM,
+# pour le textfile collector de node_exporter). METRICS_PROFILE=1 : profil cProfile du run.
+
+METRICS_JSON = getattr(config, "METRICS_JSON", os.path.join(CACHE_DIR, "metrics", "{script}.json"))
+METRICS_PROM = getattr(config, "METRICS_PROM", "")
+METRICS_PROFILE = getattr(config, "METRICS_PROFILE", False)
+
+# bornes des histogrammes (secondes)
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def rss_octets():
+    """Mémoire résidente actuelle du processus (/proc/self/statm), à défaut le pic ; None si indisponible."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError, IndexError):
+        return pic_octets()
+
+
+def pic_octets():
+    """Pic de mémoire résidente du processus depuis son démarrage (None hors Unix)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pic = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pic if sys.platform == "darwin" else pic * 1024   # octets sous macOS, Kio ailleurs
+
+
+def _mo(octets):
+    return f"{octets / 2**20:.0f} Mo"
+
+
+def _cle(nom, labels):
+    return nom, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metriques:
+    """Registre thread-safe : étapes (durées), compteurs, histogrammes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.debut = time.time()
+            self.etapes = {}      # nom -> secondes (cumulées)
+            self.memoire = {}     # nom d'étape -> {"rss", "pic"} (octets) à sa dernière fin
+            self.compteurs = {}   # (nom, labels) -> valeur
+            self.histos = {}      # (nom, labels) -> {"buckets": [...], "somme", "nb"}
+            self._dernier_jalon = time.perf_counter()
+
+    def _ajouter_etape(self, nom, dt):
+        rss, pic = rss_octets(), pic_octets()
+        with self._lock:
+            self.etapes[nom] = self.etapes.get(nom, 0.0) + dt
+            if rss is not None:
+                self.memoire[nom] = {"rss": rss, "pic": pic}
+
+    @contextmanager
+    def etape(self, nom):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._ajouter_etape(nom, time.perf_counter() - t0)
+
+    def jalon(self, nom):
+        """Fin d'étape : temps écoulé depuis le jalon précédent (ou le début du run) attribué à `nom`."""
+        now = time.perf_counter()
+        with self._lock:
+            dt, self._dernier_jalon = now - self._dernier_jalon, now
+        self._ajouter_etape(nom, dt)
+
+    def incr(self, nom, n=1, **labels):
+        k = _cle(nom, labels)
+        with self._lock:
+            self.compteurs[k] = self.compteurs.get(k, 0) + n
+
+    def observer(self, nom, secondes, **labels):
+        k = _cle(nom, labels)
+        with self._lock:
+            h = self.histos.get(k)
+            if h is None:
+                h = self.histos[k] = {"buckets": [0] * len(BUCKETS), "somme": 0.0, "nb": 0}
+            for i, b in enumerate(BUCKETS):
+                if secondes <= b:
+                    h["buckets"][i] += 1
+            h["somme"] += secondes
+            h["nb"] += 1
+
+    @contextmanager
+    def chrono(self, nom, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observer(nom, time.perf_counter() - t0, **labels)
+
+    def instantane(self, script):
+        with self._lock:
+            return {
+                "script": script,
+                "debut": self.debut,
+                "duree_s": round(time.time() - self.debut, 3),
+                "etapes_s": {k: round(v, 4) for k, v in self.etapes.items()},
+                "memoire_octets": {k: dict(v) for k, v in self.memoire.items()},
+                "pic_memoire_octets": pic_octets(),
+                "compteurs": [{"nom": n, "labels": dict(l), "valeur": v} for (n, l), v in self.compteurs.items()],
+                "histogrammes": [
+                    {"nom": n, "labels": dict(l), "bornes": list(BUCKETS), "buckets": list(h["buckets"]),
+                     "somme": round(h["somme"], 4), "nb": h["nb"]}
+                    for (n, l), h in self.histos.items()
+                ],
+            }
+
+    def prometheus(self, script):
+        """Format texte Prometheus (textfile collector), préfixe metabot_."""
+        s = self.instantane(script)
+        def lbl(d):
+            d = dict(d, script=script)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(d.items())) + "}"
+        out = ["# TYPE metabot_run_duree_secondes gauge",
+               f"metabot_run_duree_secondes{lbl({})} {s['duree_s']}",
+               "# TYPE metabot_run_timestamp_secondes gauge",
+               f"metabot_run_timestamp_secondes{lbl({})} {int(s['debut'])}",
+               "# TYPE metabot_etape_secondes gauge"]
+        out += [f"metabot_etape_secondes{lbl({'etape': k})} {v}" for k, v in s["etapes_s"].items()]
+        out.append("# TYPE metabot_etape_rss_octets gauge")
+        out += [f"metabot_etape_rss_octets{lbl({'etape': k})} {v['rss']}" for k, v in s["memoire_octets"].items()]
+        if s["pic_memoire_octets"] is not None:
+            out += ["# TYPE metabot_pic_memoire_octets gauge",
+                    f"metabot_pic_memoire_octets{lbl({})} {s['pic_memoire_octets']}"]
+        # une ligne # TYPE par famille, suivie de tous ses échantillons (toutes étiquettes)
+        types = set()
+        for c in sorted(s["compteurs"], key=lambda c: c["nom"]):
+            if c["nom"] not in types:
+                types.add(c["nom"])
+                out.append(f"# TYPE metabot_{c['nom']} counter")
+            out.append(f"metabot_{c['nom']}{lbl(c['labels'])} {c['valeur']}")
+        for h in sorted(s["histogrammes"], key=lambda h: h["nom"]):
+            nom = f"metabot_{h['nom']}"
+            if nom not in types:
+                types.add(nom)
+                out.append(f"# TYPE {nom} histogram")
+            for b, n in zip(h["bornes"], h["buckets"]):
+                out.append(f"{nom}_bucket{lbl(dict(h['labels'], le=b))} {n}")
+            out.append(f"{nom}_bucket{lbl(dict(h['labels'], le='+Inf'))} {h['nb']}")
+            out.append(f"{nom}_sum{lbl(h['labels'])} {h['somme']}")
+            out.append(f"{nom}_count{lbl(h['labels'])} {h['nb']}")
+        return "\n".join(out) + "\n"
+
+    def exporter(self, script):
+        """Écrit le rapport (JSON et/ou Prometheus) et affiche les durées et la mémoire par étape."""
+        s = self.instantane(script)
+        etapes = ", ".join(f"{k} {v:.2f}s" for k, v in s["etapes_s"].items())
+        print(f"⏱️ {script} : {s['duree_s']:.2f}s ({etapes})")
+        if s["memoire_octets"]:
+            memoire = ", ".join(f"{k} {_mo(v['rss'])}" for k, v in s["memoire_octets"].items())
+            pic = f" ; pic {_mo(s['pic_memoire_octets'])}" if s["pic_memoire_octets"] else ""
+            print(f"🧠 mémoire en fin d'étape : {memoire}{pic}")
+        if METRICS_JSON:
+            path = METRICS_JSON.format(script=script)
+            try:
+                write_json_atomic(path, s)
+            except Exception as e:
+                print(f"⚠️ Rapport de métriques non écrit ({path}) : {e}")
+        if METRICS_PROM:
+            path = METRICS_PROM.format(script=script)
+            try:
+                d = os.path.dirname(path)
+                if d:
+                    os.makedirs(d, exist_ok=True)
+                with open(path + ".tmp", "w", encoding="utf-8") as f:
+                    f.write(self.prometheus(script))
+                os.replace(path + ".tmp", path)
+            except Exception as e:
+                print(f"⚠️ Fichier Prometheus non écrit ({path}) : {e}")
+
+
+_registre = Metriques()
+
+etape = _registre.etape
+jalon = _registre.jalon
+incr = _registre.incr
+observer = _registre.observer
+chrono = _registre.chrono
+exporter = _registre.exporter
+reset = _registre.reset
+
+
+@contextmanager
+def profiler(script, actif=None):
+    """cProfile du bloc si actif (défaut : METRICS_PROFILE) ; .pstats dans CACHE_DIR + top 25 affiché."""
+    actif = METRICS_PROFILE if actif is None else actif
+    if not actif:
+        yield
+        return
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        path = os.path.join(CACHE_DIR, f"profile_{script}.pstats")
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            prof.dump_stats(path)
+        except Exception as e:
+            print(f"⚠️ Profil non écrit ({path}) : {e}")
+        buf = io.StringIO()
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(25)
+        print(f"🔬 Profil cProfile ({path}) :\n{buf.getvalue()}")
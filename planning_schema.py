@@ -0,0 +1,243 @@
+import zlib
+import config
+import lazy
+
+pd = lazy.module("pandas")  # importé au premier usage
+np = lazy.module("numpy")
+
+# ======================
+# Schéma de la feuille Planning (partagé par Script_Planning, Script_Bot et store)
+# ======================
+
+COLONNES = ["client","programme","saison","chat_id","date","heure","type","avancement","message","format","url","envoye"]
+
+DT_FORMAT = "%Y-%m-%d %H:%M:%S"  # date + heure telles qu'écrites par Script_Planning
+
+def parse_dt_naive(dates, heures):
+    """
+    date + heure -> datetime naïve (NaT si invalide), vectorisé au format connu,
+    avec repli élément par élément (format libre) sur les valeurs hors format.
+    """
+    s = (dates.astype(str).str.strip() + " " + heures.astype(str).str.strip()).str.strip()
+    dt = pd.to_datetime(s, format=DT_FORMAT, errors="coerce")
+    bad = dt.isna() & (s != "")
+    if bad.any():
+        dt[bad] = pd.to_datetime(s[bad], format="mixed", errors="coerce")
+    return dt
+
+def localize_safe(series_dt_naive, tz):
+    return (series_dt_naive
+            .dt.tz_localize(tz, ambiguous="infer", nonexistent="shift_forward"))
+
+def to_epoch(series_dt_aware):
+    """Datetime localisée -> secondes epoch (float, NaN si NaT)."""
+    return (series_dt_aware - pd.Timestamp("1970-01-01", tz="UTC")) / pd.Timedelta(seconds=1)
+
+# ======================
+# Représentation typée en mémoire
+# ======================
+# Colonnes répétitives en catégories (un code par cellule + une chaîne par valeur distincte), entiers
+# en petits entiers nullables, "scheduled_at" en secondes epoch (Int64). Sans perte : en_texte()
+# redonne exactement les chaînes de la feuille ; une colonne entière qui ne se relit pas à
+# l'identique ("007", "S1", " 3") reste en catégorie.
+
+CATEGORIES = ["client","programme","chat_id","date","heure","type","format","envoye"]
+ENTIERS = {"saison": "Int16", "avancement": "Int32", "_slot": "Int8"}
+
+BLOC_LIGNES = getattr(config, "PLANNING_BLOC_LIGNES", 5000)
+
+def texte(s):
+    """Colonne -> chaînes telles qu'écrites dans la feuille (NA -> "", entiers sans ".0")."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s.astype(object).where(s.notna(), "")
+    if pd.api.types.is_float_dtype(s.dtype):
+        if (s.isna() | (s % 1 == 0)).all():
+            s = s.astype("Int64")
+    if pd.api.types.is_extension_array_dtype(s.dtype) or pd.api.types.is_integer_dtype(s.dtype):
+        return s.astype("string").fillna("").astype(object)
+    return s.where(s.notna(), "").astype(str)
+
+def _entiers(t, dtype):
+    """Chaînes -> entiers nullables si chaque valeur non vide se relit à l'identique, sinon catégorie."""
+    pleins = t[t != ""]
+    n = pd.to_numeric(pleins, errors="coerce")
+    if n.isna().any() or (n % 1 != 0).any():
+        return t.astype("category")
+    n = n.astype("Int64")
+    if not (n.astype("string") == pleins).all():
+        return t.astype("category")
+    info = pd.api.types.pandas_dtype(dtype.lower())
+    if len(n) and (n.min() < np.iinfo(info).min or n.max() > np.iinfo(info).max):
+        dtype = "Int64"
+    out = pd.Series(pd.NA, index=t.index, dtype=dtype)
+    out[pleins.index] = n.astype(dtype)
+    return out
+
+def depuis_entiers(valeurs, colonne):
+    """Entiers numpy -> colonne compacte de ENTIERS (Int64 si une valeur sort des bornes du type)."""
+    dtype = ENTIERS[colonne]
+    valeurs = np.asarray(valeurs, dtype=np.int64)
+    info = np.iinfo(pd.api.types.pandas_dtype(dtype.lower()))
+    if len(valeurs) and (valeurs.min() < info.min or valeurs.max() > info.max):
+        dtype = "Int64"
+    return pd.array(valeurs, dtype=dtype)
+
+def scheduled_at(dates, heures, tz):
+    """Heure prévue (date + heure localisées) en secondes epoch, Int64 (NA si invalide) ; un parse par couple distinct."""
+    paires = pd.DataFrame({"d": texte(dates).values, "h": texte(heures).values}, index=dates.index)
+    uniques = paires.drop_duplicates()
+    naive = parse_dt_naive(uniques["d"], uniques["h"])
+    epoch = pd.Series(pd.NA, index=uniques.index, dtype="Int64")
+    ok = naive.notna()
+    if ok.any():
+        epoch[ok] = to_epoch(localize_safe(naive[ok].astype("datetime64[ns]"), tz)).round().astype("int64")
+    cle = pd.MultiIndex.from_frame(uniques)
+    pos = cle.get_indexer(pd.MultiIndex.from_frame(paires))
+    return pd.Series(epoch.array[pos], index=dates.index, dtype="Int64")
+
+def typer(df, tz=None):
+    """
+    DataFrame planning (chaînes, nombres ou déjà typé) -> représentation compacte, même index et colonnes
+    (+ "scheduled_at" si tz est donné). Les colonnes hors schéma (message, url...) restent en chaînes.
+    """
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if c in ENTIERS:
+            out[c] = s if pd.api.types.is_extension_array_dtype(s.dtype) and s.dtype.name.startswith("Int") \
+                else _entiers(texte(s), ENTIERS[c])
+        elif c in CATEGORIES:
+            out[c] = s if isinstance(s.dtype, pd.CategoricalDtype) else texte(s).astype("category")
+        else:
+            out[c] = texte(s)
+    res = pd.DataFrame(out, index=df.index)
+    if tz is not None and "date" in res.columns and "heure" in res.columns:
+        res["scheduled_at"] = scheduled_at(res["date"], res["heure"], tz)
+    return res
+
+def en_texte(df):
+    """Inverse de typer() : toutes les colonnes en chaînes (NA -> "")."""
+    return pd.DataFrame({c: texte(df[c]) for c in df.columns}, index=df.index)
+
+def concat(frames, **kwargs):
+    """
+    pd.concat qui garde la forme compacte : catégories réunies (au lieu de retomber en object) ;
+    une colonne de types différents d'un DataFrame à l'autre (entiers ici, catégorie là) est
+    ramenée partout en catégorie de chaînes, pour que les valeurs égales restent égales.
+    """
+    frames = [f.copy(deep=False) for f in frames if len(f.columns)]
+    if not frames:
+        return pd.DataFrame()
+    colonnes = dict.fromkeys(c for f in frames for c in f.columns)
+    for c in colonnes:
+        series = [f[c] for f in frames if c in f.columns]
+        if all(isinstance(x.dtype, pd.CategoricalDtype) for x in series):
+            if len(series) > 1:
+                cats = pd.api.types.union_categoricals(series).categories
+                for f in frames:
+                    if c in f.columns:
+                        f[c] = f[c].cat.set_categories(cats)
+        elif len({str(x.dtype) for x in series}) > 1 and (c in CATEGORIES or c in ENTIERS):
+            for f in frames:
+                if c in f.columns:
+                    f[c] = texte(f[c])
+            cats = pd.Index(sorted({v for f in frames if c in f.columns for v in f[c].unique()}))
+            for f in frames:
+                if c in f.columns:
+                    f[c] = f[c].astype(pd.CategoricalDtype(cats))
+    return pd.concat(frames, **kwargs)
+
+def lettre_colonne(n):
+    """Lettres A1 de la colonne n (1 -> A, 27 -> AA), partagé par les scripts."""
+    s = ""
+    while n > 0:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+def colonnes(ws, header, noms):
+    """Colonnes `noms` (lignes 2 à la fin) en une lecture groupée : listes de même longueur."""
+    lettres = [lettre_colonne(header.index(c) + 1) for c in noms]
+    cols = [[r[0] if r else "" for r in vr] for vr in ws.batch_get([f"{l}2:{l}" for l in lettres])]
+    n = max(len(c) for c in cols)
+    return [c + [""] * (n - len(c)) for c in cols]
+
+def lire_par_blocs(ws, header=None, taille=None, tz=None):
+    """
+    Lit la feuille par blocs de `taille` lignes (un batch_get par bloc), chaque bloc étant typé (typer)
+    dès sa réception : les listes brutes d'un bloc sont libérées avant le suivant.
+    Retourne (header, df) avec df.index = numéro de ligne dans la feuille (2, 3...) ; la lecture s'arrête
+    à la fin de la grille ou au premier bloc entièrement vide. En-tête avec doublons : GSpreadException,
+    comme get_all_records().
+    """
+    if header is None:
+        header = ws.row_values(1)
+    if not header:
+        return [], pd.DataFrame(columns=COLONNES)
+    if len(set(header)) != len(header):
+        import gspread
+        raise gspread.exceptions.GSpreadException("the header row in the worksheet is not unique")
+    taille = taille or BLOC_LIGNES
+    n = len(header)
+    derniere = lettre_colonne(n)
+    fin_grille = getattr(ws, "row_count", None) or float("inf")
+    blocs, a, fin_donnees = [], 2, 1
+    while a <= fin_grille:
+        b = int(min(a + taille - 1, fin_grille))
+        vals = ws.batch_get([f"A{a}:{derniere}{b}"])[0]
+        if not vals:
+            break
+        fin_donnees = a + len(vals) - 1
+        # bloc complété jusqu'à sa dernière ligne : les numéros de ligne restent contigus d'un bloc à l'autre
+        lignes = [list(r)[:n] + [""] * (n - len(r)) for r in vals] + [[""] * n] * (b - a + 1 - len(vals))
+        del vals
+        blocs.append(typer(pd.DataFrame(lignes, columns=header, index=pd.RangeIndex(a, b + 1)), tz))
+        del lignes
+        a = b + 1
+    if not blocs:
+        return header, typer(pd.DataFrame(columns=header), tz)
+    return header, concat(blocs).loc[:fin_donnees]
+
+# ======================
+# Baux (plusieurs workers Script_Bot) et répartition des chats
+# ======================
+# envoye = "non" | "oui" | "en_cours:<worker>:<expiration epoch>" (ligne réservée par un worker ;
+# au-delà de l'expiration, le bail est considéré abandonné et la ligne redevient disponible).
+
+BAIL_PREFIX = "en_cours:"
+
+def bail(worker, expiration):
+    return f"{BAIL_PREFIX}{worker}:{int(expiration)}"
+
+def expiration_bail(envoye):
+    """Expiration (epoch) d'un bail, None si la valeur n'est pas un bail lisible."""
+    v = str(envoye).strip()
+    if not v.startswith(BAIL_PREFIX):
+        return None
+    try:
+        return int(v.rsplit(":", 1)[1])
+    except ValueError:
+        return None
+
+def est_disponible(envoye, now_epoch):
+    """Ligne à envoyer : envoye == "non", ou bail expiré (un bail illisible est traité comme expiré)."""
+    v = str(envoye).strip()
+    if v.lower() == "non":
+        return True
+    if not v.startswith(BAIL_PREFIX):
+        return False
+    exp = expiration_bail(v)
+    return exp is None or exp < now_epoch
+
+def disponibles(envoyes, now_epoch):
+    """Version vectorisée de est_disponible (Series -> Series bool)."""
+    v = envoyes.astype(str).str.strip()
+    baux = v.str.startswith(BAIL_PREFIX)
+    exp = pd.to_numeric(v.str.rsplit(":", n=1).str[-1].where(baux), errors="coerce")
+    return (v.str.lower() == "non") | (baux & (exp.isna() | (exp < now_epoch)))
+
+def shard(chat_id, nb_shards):
+    """Shard (0..nb_shards-1) d'un chat : crc32 du chat_id normalisé, stable d'un run à l'autre."""
+    if nb_shards <= 1:
+        return 0
+    return zlib.crc32(str(chat_id).strip().encode("utf-8")) % nb_shards
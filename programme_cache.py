@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+import time
+import config
+from fichiers import CACHE_DIR, write_json_atomic
+
+# ======================
+# Cache persistant des onglets programmes (Script_Planning)
+# ======================
+# Les onglets du classeur programmes (et "Types") changent rarement : leurs records sont
+# conservés entre deux runs, par classeur et par onglet. Validité = modifiedTime Drive du
+# classeur ; s'il n'a pas bougé, un run ne fait qu'un appel de métadonnées au lieu de N lectures.
+
+PROG_CACHE_MAX_MO = getattr(config, "PROG_CACHE_MAX_MO", 20)   # taille max du fichier (LRU par onglet)
+
+
+class ProgrammeCache:
+    """
+    doc_id -> {"version": modifiedTime, "existants": [titres], "onglets": {titre: {"records", "used"}}}.
+    Un changement de version invalide tous les onglets du classeur.
+    """
+
+    def __init__(self, path=None, max_mo=PROG_CACHE_MAX_MO):
+        self.path = path or os.path.join(CACHE_DIR, "programmes.json")
+        self.max_bytes = int(float(max_mo) * 1024 * 1024)
+        self._docs = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._docs = {k: v for k, v in data.items() if isinstance(v, dict) and v.get("version")}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Cache programmes illisible ({self.path}) : {e}")
+
+    def _doc(self, doc_id, version):
+        d = self._docs.get(doc_id)
+        if d is None or d.get("version") != version:
+            d = self._docs[doc_id] = {"version": version, "existants": None, "onglets": {}}
+            self._dirty = True
+        return d
+
+    def existants(self, doc_id, version):
+        """Titres des onglets du classeur à cette version (None si inconnus)."""
+        with self._lock:
+            d = self._docs.get(doc_id)
+            if d is None or d.get("version") != version:
+                return None
+            return d.get("existants")
+
+    def get(self, doc_id, version, titre):
+        with self._lock:
+            d = self._docs.get(doc_id)
+            if d is None or d.get("version") != version:
+                return None
+            o = d["onglets"].get(titre)
+            if o is None:
+                return None
+            o["used"] = time.time()
+            self._dirty = True
+            return o["records"]
+
+    def put(self, doc_id, version, titre, records):
+        with self._lock:
+            self._doc(doc_id, version)["onglets"][titre] = {"records": records, "used": time.time()}
+            self._dirty = True
+
+    def set_existants(self, doc_id, version, titres):
+        with self._lock:
+            self._doc(doc_id, version)["existants"] = list(titres)
+            self._dirty = True
+
+    def _evict(self):
+        # taille estimée par onglet ; on retire les moins récemment utilisés jusqu'à passer sous le plafond
+        tailles = {(k, t): len(json.dumps(o["records"], ensure_ascii=False).encode("utf-8"))
+                   for k, d in self._docs.items() for t, o in d["onglets"].items()}
+        total = sum(tailles.values())
+        if total <= self.max_bytes:
+            return
+        for k, t in sorted(tailles, key=lambda kt: float(self._docs[kt[0]]["onglets"][kt[1]].get("used", 0))):
+            if total <= self.max_bytes:
+                break
+            del self._docs[k]["onglets"][t]
+            total -= tailles[(k, t)]
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._evict()
+            snapshot = {k: {**d, "onglets": dict(d["onglets"])} for k, d in self._docs.items()}
+            self._dirty = False
+        try:
+            write_json_atomic(self.path, snapshot)
+        except Exception as e:
+            print(f"⚠️ Cache programmes non sauvegardé : {e}")
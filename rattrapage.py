@@ -0,0 +1,120 @@
+import config
+
+# ======================
+# Rattrapage d'un retard d'envoi (Script_Bot)
+# ======================
+# Après une interruption (run raté, identifiants expirés) et sans SEND_WINDOW_MINUTES, un chat peut
+# avoir plusieurs jours de lignes en retard ; envoyées une à une, elles épuisent son ~1 msg/s.
+# Les lignes en retard d'un même chat sont regroupées, dans l'ordre date/heure :
+# - suites de lignes texte -> un seul sendMessage par tranche de LIMITE_TEXTE caractères
+# - suites d'images (file_id connu ou URL directe) -> un sendMediaGroup par ALBUM_MAX images
+# Le reste (ligne isolée, image à téléverser, texte trop long) part ligne à ligne, comme d'habitude.
+# Les destinataires reçoivent alors des messages fusionnés : désactivé par défaut (RATTRAPAGE = True pour l'activer),
+# et jamais actif avec SEND_WINDOW_MINUTES (les lignes trop anciennes ne sont de toute façon pas envoyées).
+
+RATTRAPAGE = getattr(config, "RATTRAPAGE", False)
+SEND_WINDOW_MINUTES = getattr(config, "SEND_WINDOW_MINUTES", None)
+RATTRAPAGE_MINUTES = getattr(config, "RATTRAPAGE_MINUTES", 60)  # retard à partir duquel une ligne est regroupée
+
+LIMITE_TEXTE = 4096   # caractères par message (Bot API)
+LEGENDE_MAX = 1024    # caractères par légende de photo
+ALBUM_MAX = 10        # photos par sendMediaGroup
+SEPARATEUR = "\n\n"
+
+
+class Paquet:
+    """Plusieurs lignes d'un chat envoyées en un appel : genre "texte" (texte fusionné) ou "album"."""
+    __slots__ = ("genre", "lignes", "texte", "faits", "repli")
+
+    def __init__(self, genre, lignes, texte=""):
+        self.genre = genre
+        self.lignes = lignes      # [(numéro de ligne, row)]
+        self.texte = texte
+        self.faits = set()        # numéros de ligne déjà envoyés (reprise après un 429 sans doublon)
+        self.repli = False        # appel groupé refusé : envoi ligne à ligne
+
+    def __len__(self):
+        return len(self.lignes)
+
+
+def est_image(row):
+    return str(row["format"]).strip().lower() == "image" and bool(str(row["url"]).strip())
+
+
+def texte_ligne(row):
+    """Texte envoyé pour une ligne texte (message + lien éventuel), comme Script_Bot.envoyer_ligne."""
+    texte = str(row["message"]).strip()
+    url = str(row["url"]).strip()
+    return f"{texte}\n{url}" if url else texte
+
+
+def grouper(lignes, album_possible, limite=LIMITE_TEXTE, album_max=ALBUM_MAX):
+    """
+    lignes : [(numéro de ligne, row)] d'un chat, dans l'ordre d'envoi.
+    Retourne les tâches dans le même ordre : Paquet pour chaque suite d'au moins deux lignes groupables,
+    (numéro de ligne, row) pour les autres. album_possible(row) : image envoyable en album.
+    """
+    jobs, texte, album = [], [], []
+
+    def fermer_texte():
+        if len(texte) > 1:
+            jobs.append(Paquet("texte", list(texte), SEPARATEUR.join(texte_ligne(r) for _, r in texte)))
+        else:
+            jobs.extend(texte)
+        texte.clear()
+
+    def fermer_album():
+        if len(album) > 1:
+            jobs.append(Paquet("album", list(album)))
+        else:
+            jobs.extend(album)
+        album.clear()
+
+    taille = 0
+    for ligne in lignes:
+        row = ligne[1]
+        if est_image(row):
+            fermer_texte()
+            if not album_possible(row):
+                fermer_album()
+                jobs.append(ligne)
+                continue
+            if len(album) >= album_max:
+                fermer_album()
+            album.append(ligne)
+            continue
+        fermer_album()
+        n = len(texte_ligne(row))
+        if n > limite:
+            fermer_texte()
+            jobs.append(ligne)
+            continue
+        if texte and taille + len(SEPARATEUR) + n > limite:
+            fermer_texte()
+        taille = n if not texte else taille + len(SEPARATEUR) + n
+        texte.append(ligne)
+    fermer_texte()
+    fermer_album()
+    return jobs
+
+
+def jobs_chat(lignes, seuil_epoch, album_possible):
+    """
+    Tâches d'un chat : lignes triées par heure prévue (_dt) ; celles prévues avant seuil_epoch
+    (retard) sont regroupées s'il y en a au moins deux, les suivantes restent ligne à ligne.
+    """
+    if not RATTRAPAGE or SEND_WINDOW_MINUTES is not None or seuil_epoch is None or len(lignes) < 2:
+        return lignes
+
+    def prevu(ligne):
+        dt = ligne[1].get("_dt")
+        try:
+            return dt.timestamp()
+        except (AttributeError, ValueError):   # NaT / absent : en fin
+            return float("inf")
+
+    tri = sorted(lignes, key=prevu)
+    retard = [l for l in tri if prevu(l) < seuil_epoch]
+    if len(retard) < 2:
+        return lignes
+    return grouper(retard, album_possible) + tri[len(retard):]
@@ -0,0 +1,364 @@
+import json
+import os
+import random
+import threading
+import time
+import requests
+import config
+import metrics
+from dispatcher import TokenBucket
+from fichiers import CACHE_DIR, write_json_atomic
+
+# ======================
+# Accès Google Sheets partagé (Script_Bot / Script_Planning)
+# ======================
+# Client HTTP gspread (gspread.authorize(..., http_client=QuotaHTTPClient)) qui :
+# - régule les appels Sheets par seaux à jetons (quotas lecture / écriture par minute)
+# - réessaie avec backoff exponentiel + jitter (GSHEETS_MAX_RETRIES, GSHEETS_RETRY_BASE) :
+#   lectures sur 429 / 5xx / timeouts ; écritures seulement si l'appel n'a pas été appliqué (429, 403 de quota,
+#   connexion jamais établie) : un timeout ou un 5xx après application rejouerait un batchUpdate structurel
+#   (deleteDimension / insertDimension) sur des lignes qui ont déjà bougé
+# - sert une lecture identique déjà faite dans le run depuis la mémoire (invalidé à chaque écriture)
+# - compte appels, octets et temps d'attente pour le rapport de fin de run
+# Un seul client authentifié par processus (client()), classeurs ouverts par clé (ouvrir()).
+# gspread et google-auth ne sont importés qu'à la création du client (QuotaHTTPClient défini à ce moment) :
+# importer sheets ne coûte rien à un run de Script_Bot qui s'arrête avant d'ouvrir la feuille.
+
+GSHEETS_MAX_RETRIES = getattr(config, "GSHEETS_MAX_RETRIES", 5)
+GSHEETS_RETRY_BASE = getattr(config, "GSHEETS_RETRY_BASE", 1.5)
+GSHEETS_RETRY_MAX_S = getattr(config, "GSHEETS_RETRY_MAX_S", 64)
+GSHEETS_READS_PAR_MIN = getattr(config, "GSHEETS_READS_PAR_MIN", 60)
+GSHEETS_WRITES_PAR_MIN = getattr(config, "GSHEETS_WRITES_PAR_MIN", 60)
+CLES_CACHE_TTL_H = getattr(config, "CLES_CACHE_TTL_H", 24)   # titre -> clé re-résolu au-delà
+
+SCOPES = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive",
+]
+
+RETRY_CODES = {408, 429, 500, 502, 503, 504}
+RETRY_RAISONS_403 = {"rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded"}
+READ_POST_SUFFIXES = (":batchGetByDataFilter", ":getByDataFilter")
+
+
+def _nature(method, url):
+    """'drive' (API Drive, quotas à part), 'read' ou 'write'."""
+    if "googleapis.com/drive" in url:
+        return "drive"
+    if method == "GET" or url.endswith(READ_POST_SUFFIXES):
+        return "read"
+    return "write"
+
+
+def _quota_depasse(err):
+    """429, ou 403 de dépassement de quota (Drive / Sheets) : appel refusé avant d'être appliqué."""
+    if err.code == 429:
+        return True
+    if err.code == 403:
+        details = err.error.get("errors") or err.error.get("details") or []
+        raisons = {str(d.get("reason", "")) for d in details if isinstance(d, dict)}
+        return bool(raisons & RETRY_RAISONS_403) or "RATE_LIMIT_EXCEEDED" in str(err.error)
+    return False
+
+
+def _a_reessayer(err, nature="read"):
+    """Écriture : seulement si elle n'a pas été appliquée (quota) ; lecture / Drive : aussi 408 et 5xx."""
+    if nature == "write":
+        return _quota_depasse(err)
+    return err.code in RETRY_CODES or _quota_depasse(err)
+
+
+def _reseau_a_reessayer(exc, nature="read"):
+    """Erreur réseau : une écriture n'est rejouée que si la connexion n'a jamais été établie."""
+    return nature != "write" or isinstance(exc, requests.exceptions.ConnectTimeout)
+
+
+def _retry_after(err):
+    try:
+        return float(err.response.headers.get("Retry-After", ""))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+_QuotaHTTPClient = None
+_classe_lock = threading.Lock()
+
+
+def quota_http_client():
+    """Classe QuotaHTTPClient (sous-classe de gspread HTTPClient), définie au premier appel : import de gspread différé."""
+    global _QuotaHTTPClient
+    with _classe_lock:
+        if _QuotaHTTPClient is None:
+            _QuotaHTTPClient = _definir_client()
+        return _QuotaHTTPClient
+
+
+def __getattr__(nom):
+    # sheets.QuotaHTTPClient reste accessible, sans importer gspread avant usage
+    if nom == "QuotaHTTPClient":
+        return quota_http_client()
+    raise AttributeError(nom)
+
+
+def _definir_client():
+    from gspread.exceptions import APIError
+    from gspread.http_client import HTTPClient
+
+    class QuotaHTTPClient(HTTPClient):
+        """HTTPClient gspread : quotas, retries, lectures dédoublonnées et métriques du run."""
+
+        def __init__(self, auth, session=None):
+            super().__init__(auth, session)
+            self.buckets = {
+                "read": TokenBucket(GSHEETS_READS_PAR_MIN / 60.0, capacity=GSHEETS_READS_PAR_MIN),
+                "write": TokenBucket(GSHEETS_WRITES_PAR_MIN / 60.0, capacity=GSHEETS_WRITES_PAR_MIN),
+            }
+            self._lock = threading.Lock()
+            self._lectures = {}   # (url, params) -> Response, vidé à chaque écriture
+            self.stats = {
+                "appels": {"read": 0, "write": 0, "drive": 0},
+                "dedoublonnes": 0,
+                "retries": 0,
+                "octets_envoyes": 0,
+                "octets_recus": 0,
+                "attente_quota_s": 0.0,
+                "attente_retry_s": 0.0,
+            }
+
+        def _compte(self, cle, n):
+            with self._lock:
+                self.stats[cle] += n
+
+        def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+            method = method.upper()
+            nature = _nature(method, endpoint)
+            cle = None
+            if nature == "read" and method == "GET" and files is None:
+                cle = (endpoint, repr(sorted(params.items()) if isinstance(params, dict) else params))
+                with self._lock:
+                    resp = self._lectures.get(cle)
+                    if resp is not None:
+                        self.stats["dedoublonnes"] += 1
+                        return resp
+            elif nature == "write":
+                with self._lock:
+                    self._lectures.clear()
+
+            if data is not None:
+                self._compte("octets_envoyes", len(data))
+            elif json is not None:
+                self._compte("octets_envoyes", len(_json_dumps(json)))
+
+            essai = 0
+            while True:
+                bucket = self.buckets.get(nature)
+                if bucket is not None:
+                    t0 = time.monotonic()
+                    bucket.acquire()
+                    attente = time.monotonic() - t0
+                    self._compte("attente_quota_s", attente)
+                    if attente > 0.001:
+                        metrics.observer("sheets_attente_quota_secondes", attente, nature=nature)
+                with self._lock:
+                    self.stats["appels"][nature] += 1
+                t0 = time.perf_counter()
+                try:
+                    resp = super().request(method, endpoint, params=params, data=data, json=json,
+                                           files=files, headers=headers)
+                    metrics.observer("http_latence_secondes", time.perf_counter() - t0, appel=f"sheets.{nature}")
+                    break
+                except APIError as e:
+                    metrics.observer("http_latence_secondes", time.perf_counter() - t0, appel=f"sheets.{nature}")
+                    metrics.incr("sheets_erreurs_total", code=e.code)
+                    if essai >= GSHEETS_MAX_RETRIES or not _a_reessayer(e, nature):
+                        raise
+                    wait = _retry_after(e)
+                    motif = f"HTTP {e.code}"
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    metrics.incr("sheets_erreurs_total", code=type(e).__name__)
+                    if essai >= GSHEETS_MAX_RETRIES or not _reseau_a_reessayer(e, nature):
+                        raise
+                    wait = None
+                    motif = type(e).__name__
+                if wait is None:
+                    wait = min(GSHEETS_RETRY_BASE ** essai, GSHEETS_RETRY_MAX_S) + random.uniform(0, 1)
+                essai += 1
+                print(f"⏳ Sheets {motif} -> nouvel essai {essai}/{GSHEETS_MAX_RETRIES} dans {wait:.1f}s")
+                metrics.incr("sheets_retries_total")
+                with self._lock:
+                    self.stats["retries"] += 1
+                    self.stats["attente_retry_s"] += wait
+                time.sleep(wait)
+
+            self._compte("octets_recus", len(resp.content or b""))
+            if cle is not None:
+                with self._lock:
+                    self._lectures[cle] = resp
+            return resp
+
+        def oublier_lectures(self):
+            """Nouveau cycle (mode résident) : les prochaines lectures repartent de l'API."""
+            with self._lock:
+                self._lectures.clear()
+
+        def rapport(self):
+            with self._lock:
+                s = dict(self.stats)
+                s["appels"] = dict(self.stats["appels"])
+            return s
+
+    return QuotaHTTPClient
+
+
+def _json_dumps(obj):
+    try:
+        return json.dumps(obj).encode("utf-8")
+    except (TypeError, ValueError):
+        return b""
+
+
+def authorize(creds):
+    """gspread.Client branché sur QuotaHTTPClient."""
+    import gspread
+    return gspread.authorize(creds, http_client=quota_http_client())
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def client():
+    """
+    Client gspread du processus : identifiants du compte de service lus une fois, session
+    authentifiée (jeton, connexions, quotas, lectures dédoublonnées) partagée par toutes les étapes.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from google.oauth2.service_account import Credentials
+            creds = Credentials.from_service_account_file(config.CHEMIN_CLE_JSON, scopes=SCOPES)
+            _client = authorize(creds)
+        return _client
+
+
+def oublier_client():
+    """Le prochain client() se ré-authentifie (tests, bench)."""
+    global _client
+    with _client_lock:
+        _client = None
+
+
+# ======================
+# Ouverture des classeurs par clé
+# ======================
+# client.open(titre) = recherche Drive (files.list) à chaque appel, ambiguë si des copies portent le même
+# titre. Ordre : clé configurée (CLE_*), sinon clé mémorisée dans CACHE_DIR/classeurs.json (titre
+# vérifié, re-résolue après CLES_CACHE_TTL_H heures), sinon une recherche par titre, mémorisée.
+
+class ClesClasseurs:
+    """Cache persistant titre -> {"cle", "t"}."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, "classeurs.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._cles = data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            self._cles = {}
+        except Exception as e:
+            print(f"⚠️ Cache des clés de classeurs illisible ({self.path}) : {e}")
+            self._cles = {}
+
+    def get(self, titre):
+        with self._lock:
+            e = self._cles.get(titre)
+        if not isinstance(e, dict) or not e.get("cle"):
+            return None
+        if CLES_CACHE_TTL_H is not None and time.time() - float(e.get("t", 0)) > CLES_CACHE_TTL_H * 3600:
+            return None
+        return e["cle"]
+
+    def put(self, titre, cle):
+        with self._lock:
+            self._cles[titre] = {"cle": cle, "t": int(time.time())}
+            snapshot = dict(self._cles)
+        self._save(snapshot)
+
+    def discard(self, titre):
+        with self._lock:
+            if self._cles.pop(titre, None) is None:
+                return
+            snapshot = dict(self._cles)
+        self._save(snapshot)
+
+    def _save(self, snapshot):
+        try:
+            write_json_atomic(self.path, snapshot)
+        except Exception as e:
+            print(f"⚠️ Cache des clés de classeurs non sauvegardé : {e}")
+
+
+_cles = None
+
+
+def _cache_cles():
+    global _cles
+    if _cles is None:
+        _cles = ClesClasseurs()
+    return _cles
+
+
+def _resoudre(gc, titre):
+    """Clé du classeur `titre` par recherche Drive ; s'il y a des copies, la plus récemment modifiée."""
+    from gspread.exceptions import SpreadsheetNotFound
+    fichiers = [f for f in gc.list_spreadsheet_files(titre) if f.get("name") == titre]
+    if not fichiers:
+        raise SpreadsheetNotFound(f"Classeur introuvable : {titre}")
+    fichiers.sort(key=lambda f: f.get("modifiedTime", ""), reverse=True)
+    if len(fichiers) > 1:
+        print(f"⚠️ {len(fichiers)} classeurs nommés \"{titre}\" : ouverture du plus récent ({fichiers[0]['id']}) ; "
+              f"renseigner sa clé dans config.py pour lever l'ambiguïté")
+    return fichiers[0]["id"]
+
+
+def ouvrir(gc, titre, cle=""):
+    """Classeur ouvert par clé (open_by_key) : clé configurée, mémorisée, ou résolue une fois par titre."""
+    from gspread.exceptions import SpreadsheetNotFound
+    if cle:
+        return gc.open_by_key(cle)
+    cache = _cache_cles()
+    cle = cache.get(titre)
+    if cle:
+        try:
+            doc = gc.open_by_key(cle)
+            if doc.title == titre:
+                return doc
+            print(f"[DEBUG] Classeur {cle} renommé (\"{doc.title}\") : nouvelle recherche de \"{titre}\"")
+        except (SpreadsheetNotFound, PermissionError):
+            print(f"[DEBUG] Clé mémorisée de \"{titre}\" invalide : nouvelle recherche")
+        cache.discard(titre)
+    cle = _resoudre(gc, titre)
+    doc = gc.open_by_key(cle)
+    cache.put(titre, cle)
+    return doc
+
+
+def oublier_lectures(client):
+    http = getattr(client, "http_client", None)
+    if _QuotaHTTPClient is not None and isinstance(http, _QuotaHTTPClient):
+        http.oublier_lectures()
+
+
+def afficher_rapport(client):
+    """Rapport de fin de run : appels Sheets/Drive, octets, temps d'attente."""
+    http = getattr(client, "http_client", None)
+    if _QuotaHTTPClient is None or not isinstance(http, _QuotaHTTPClient):
+        return
+    s = http.rapport()
+    a = s["appels"]
+    print(f"📊 Sheets : {a['read']} lecture(s), {a['write']} écriture(s), {a['drive']} appel(s) Drive, "
+          f"{s['dedoublonnes']} lecture(s) dédoublonnée(s), {s['retries']} retry(s) ; "
+          f"{s['octets_envoyes'] / 1024:.1f} Ko envoyés, {s['octets_recus'] / 1024:.1f} Ko reçus ; "
+          f"attente quota {s['attente_quota_s']:.1f}s, backoff {s['attente_retry_s']:.1f}s")
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import lazy
+import metrics
+import planning_schema
+
+pd = lazy.module("pandas")  # importé au premier usage
+
+# ======================
+# Store local du planning (SQLite), miroir de la feuille "Planning"
+# ======================
+# Optionnel (config.PLANNING_STORE) : les deux scripts lisent/écrivent ici, la feuille
+# reste une vue pour les opérateurs, mise à jour par l'étape de synchro.
+# - lignes dues  : range query sur l'index (lower(envoye), scheduled_at)
+# - par chat     : index (chat_id, date)
+# - sheet_row    : numéro de ligne de la feuille, pour pousser les 'envoye' modifiés (dirty)
+# - empreinte    : hash des clés chat_id|date|heure de toutes les lignes, dans l'ordre ; comparée à la feuille
+#   avant usage (verifier, par les deux scripts) : planning réécrit depuis -> store ré-amorcé, sheet_row n'est plus fiable
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS planning (
+    sheet_row    INTEGER PRIMARY KEY,
+    client       TEXT, programme TEXT, saison TEXT, chat_id TEXT, date TEXT, heure TEXT,
+    type         TEXT, avancement TEXT, message TEXT, format TEXT, url TEXT, envoye TEXT,
+    scheduled_at INTEGER,
+    dirty        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_planning_envoye_sched ON planning (lower(envoye), scheduled_at);
+CREATE INDEX IF NOT EXISTS idx_planning_chat_date ON planning (chat_id, date);
+CREATE INDEX IF NOT EXISTS idx_planning_dirty ON planning (dirty) WHERE dirty = 1;
+CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT);
+"""
+
+COLS = planning_schema.COLONNES
+
+
+def empreinte(cles):
+    """Empreinte d'une liste de clés de lignes (chat_id|date|heure, dans l'ordre de la feuille)."""
+    h = hashlib.sha1()
+    for k in cles:
+        h.update(k.encode("utf-8"))
+        h.update(b"\n")
+    return f"{len(cles)}:{h.hexdigest()}"
+
+
+class PlanningStore:
+    def __init__(self, path):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.conn.create_function("bail_disponible", 2, planning_schema.est_disponible, deterministic=True)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    def vide(self):
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM planning LIMIT 1").fetchone() is None
+
+    def nb_lignes(self):
+        with self._lock:
+            return self.conn.execute("SELECT count(*) FROM planning").fetchone()[0]
+
+    def header(self):
+        """En-tête de la feuille au moment de la dernière synchro (ordre des colonnes)."""
+        with self._lock:
+            row = self.conn.execute("SELECT v FROM meta WHERE k = 'header'").fetchone()
+        return json.loads(row[0]) if row else list(COLS)
+
+    def empreinte(self):
+        """Empreinte des clés de la feuille au moment de la dernière synchro (None si inconnue)."""
+        with self._lock:
+            row = self.conn.execute("SELECT v FROM meta WHERE k = 'empreinte'").fetchone()
+        return row[0] if row else None
+
+    def remplacer(self, header, df, tz):
+        """
+        Remplace tout le planning par df (dans l'ordre de la feuille : sheet_row = position + 2).
+        Les lignes 'dirty' sont considérées comme écrites dans la feuille avec df.
+        df peut être typé (planning_schema.typer) ; sa colonne scheduled_at est reprise si présente.
+        """
+        df = df.reset_index(drop=True)
+        vals = {c: (planning_schema.texte(df[c]) if c in df.columns else pd.Series("", index=df.index)) for c in COLS}
+        if "scheduled_at" in df.columns:
+            sched = df["scheduled_at"].astype("Int64")
+        else:
+            sched = planning_schema.scheduled_at(vals["date"], vals["heure"], tz)
+        sched = [None if pd.isna(x) else int(x) for x in sched]
+        cles = ["|".join(t) for t in zip(*(vals[c].str.strip().tolist() for c in ("chat_id", "date", "heure")))]
+        rows = zip(range(2, len(df) + 2), *[vals[c].tolist() for c in COLS], sched)
+
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM planning")
+            self.conn.executemany(
+                f"INSERT INTO planning (sheet_row, {', '.join(COLS)}, scheduled_at) "
+                f"VALUES ({', '.join('?' * (len(COLS) + 2))})",
+                rows,
+            )
+            self.conn.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('header', ?)",
+                              (json.dumps(list(header)),))
+            self.conn.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('empreinte', ?)", (empreinte(cles),))
+
+    def _frame(self, sql, params=()):
+        """Résultat typé (planning_schema.typer) + scheduled_at (Int64 epoch), index = sheet_row - 2."""
+        with self._lock:
+            cur = self.conn.execute(sql, params)
+            data = cur.fetchall()
+        df = pd.DataFrame(data, columns=["sheet_row"] + COLS + ["scheduled_at"])
+        df.index = df.pop("sheet_row") - 2
+        df.index.name = None
+        sched = df.pop("scheduled_at").astype("Int64")
+        df = planning_schema.typer(df.fillna(""))
+        df["scheduled_at"] = sched
+        return df
+
+    def dataframe(self):
+        """Tout le planning, dans l'ordre de la feuille (index = sheet_row - 2)."""
+        return self._frame(f"SELECT sheet_row, {', '.join(COLS)}, scheduled_at FROM planning ORDER BY sheet_row")
+
+    @staticmethod
+    def _sql_dues(colonnes, now_epoch, debut_epoch):
+        """(sql, params) des lignes envoye == "non" (ou bail expiré) avec scheduled_at dans [debut, now]."""
+        borne = "scheduled_at <= ?" + (" AND scheduled_at >= ?" if debut_epoch is not None else "")
+        bornes = [int(now_epoch)] + ([int(debut_epoch)] if debut_epoch is not None else [])
+        # deux branches sur l'index (lower(envoye), scheduled_at) : 'non', puis la plage des baux
+        sql = (f"SELECT {colonnes} FROM planning WHERE lower(envoye) = 'non' AND {borne} "
+               "UNION ALL "
+               f"SELECT {colonnes} FROM planning "
+               f"WHERE lower(envoye) >= 'en_cours:' AND lower(envoye) < 'en_cours;' AND {borne} "
+               "AND bail_disponible(envoye, ?)")
+        return sql, bornes + bornes + [int(time.time())]
+
+    def lignes_dues(self, now_epoch, debut_epoch=None):
+        """Lignes envoye == "non" (ou bail expiré) avec scheduled_at dans [debut, now] (index = sheet_row - 2)."""
+        sql, params = self._sql_dues(f"sheet_row, {', '.join(COLS)}, scheduled_at", now_epoch, debut_epoch)
+        return self._frame(sql + " ORDER BY sheet_row", params)
+
+    def a_envoyer(self, now_epoch, debut_epoch=None):
+        """Au moins une ligne due ? (mêmes critères que lignes_dues, sans DataFrame)"""
+        sql, params = self._sql_dues("1", now_epoch, debut_epoch)
+        with self._lock:
+            return self.conn.execute(f"SELECT EXISTS ({sql})", params).fetchone()[0] == 1
+
+    def marquer(self, updates):
+        """updates: [(sheet_row, envoye)] -> écrit en local, à pousser vers la feuille."""
+        with self._lock, self.conn:
+            self.conn.executemany("UPDATE planning SET envoye = ?, dirty = 1 WHERE sheet_row = ?",
+                                  [(v, r) for r, v in updates])
+
+    def a_pousser(self):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT sheet_row, envoye FROM planning WHERE dirty = 1 ORDER BY sheet_row").fetchall()
+
+    def cles(self, rows):
+        """{sheet_row: clé chat_id|date|heure} des lignes demandées."""
+        if not rows:
+            return {}
+        with self._lock:
+            out = {}
+            for k in range(0, len(rows), 500):
+                lot = rows[k:k + 500]
+                out.update((r, "|".join((v or "").strip() for v in t)) for r, *t in self.conn.execute(
+                    f"SELECT sheet_row, chat_id, date, heure FROM planning WHERE sheet_row IN ({', '.join('?' * len(lot))})",
+                    lot))
+        return out
+
+    def pousse(self, rows):
+        with self._lock, self.conn:
+            self.conn.executemany("UPDATE planning SET dirty = 0 WHERE sheet_row = ?", [(r,) for r in rows])
+
+
+def verifier(local_store, ws, tz):
+    """
+    Le store correspond-il encore à la feuille ? Empreinte des clés chat_id|date|heure (une lecture groupée)
+    comparée à celle de la dernière synchro : différente (planning modifié à la main, store restauré d'un run
+    plus ancien) ou store vide -> ré-amorcé depuis la feuille, avant toute lecture du store.
+    Les marques non poussées d'un store périmé sont abandonnées : le journal les rejoue, par clé.
+    Retourne False si la feuille ne permet pas la vérification (en-tête sans chat_id/date/heure) :
+    le store ne doit alors pas servir de référence.
+    """
+    header = ws.row_values(1)
+    if not header or any(c not in header for c in ("chat_id", "date", "heure")):
+        return False
+    if not local_store.vide():
+        cles = ["|".join(v.strip() for v in t) for t in zip(*planning_schema.colonnes(ws, header, ["chat_id", "date", "heure"]))]
+        while cles and cles[-1] == "||":   # lignes vides en fin de feuille
+            cles.pop()
+        if empreinte(cles) == local_store.empreinte():
+            return True
+        print("⚠️ Store local périmé (planning modifié depuis la dernière synchro) : ré-amorçage depuis la feuille")
+        metrics.incr("store_reamorcages_total")
+    header, df = planning_schema.lire_par_blocs(ws, header, tz=tz)   # par blocs, typé (scheduled_at compris)
+    local_store.remplacer(header, df, tz)
+    print(f"[DEBUG] Store amorcé depuis la feuille ({len(df)} ligne(s))")
+    return True
+
+
+def ouvrir(path):
+    """PlanningStore si path est renseigné (config.PLANNING_STORE), sinon None."""
+    return PlanningStore(path) if path else None
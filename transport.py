@@ -0,0 +1,114 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+import config
+import metrics
+
+# ======================
+# Transport HTTP partagé (Telegram + Drive)
+# ======================
+# Une seule Session requests avec connexions keep-alive en pool : chaque message
+# réutilise la connexion TCP/TLS déjà ouverte vers api.telegram.org.
+# Le backend est interchangeable (set_transport) pour pointer vers un serveur local de test.
+
+TELEGRAM_API_BASE = getattr(config, "TELEGRAM_API_BASE", "https://api.telegram.org")
+POOL_CONNECTIONS = getattr(config, "HTTP_POOL_CONNECTIONS", 4)
+POOL_MAXSIZE = getattr(config, "HTTP_POOL_MAXSIZE", 16)
+
+_CONNECT = getattr(config, "HTTP_TIMEOUT_CONNECT", 5)
+TIMEOUTS = {
+    # kind -> (connect, read) en secondes
+    "telegram": (_CONNECT, getattr(config, "HTTP_TIMEOUT_TELEGRAM", 10)),
+    "upload": (_CONNECT, getattr(config, "HTTP_TIMEOUT_UPLOAD", 20)),
+    "drive": (_CONNECT, getattr(config, "HTTP_TIMEOUT_DRIVE", 15)),
+    "probe": (_CONNECT, getattr(config, "HTTP_TIMEOUT_PROBE", 7)),
+}
+
+
+def _nom_appel(kind, url):
+    # Telegram : méthode Bot API (telegram.sendMessage…) ; sinon le type d'appel (drive, probe)
+    if kind in ("telegram", "upload"):
+        return "telegram." + url.rsplit("/", 1)[-1].split("?", 1)[0]
+    return kind
+
+
+def _default_session(pool_connections, pool_maxsize):
+    session = requests.Session()
+    # pas de retry urllib3 : les retries (429/5xx) sont gérés au niveau appel Telegram
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class Transport:
+    """
+    Session HTTP poolée + timeouts par type d'appel.
+
+    session_factory(pool_connections, pool_maxsize) -> objet avec .request(method, url, **kw)
+    (requests.Session par défaut).
+    """
+
+    def __init__(self, session_factory=None, pool_connections=POOL_CONNECTIONS,
+                 pool_maxsize=POOL_MAXSIZE, timeouts=None, telegram_base=TELEGRAM_API_BASE):
+        factory = session_factory or _default_session
+        self.session = factory(pool_connections, pool_maxsize)
+        self.timeouts = dict(TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.telegram_base = telegram_base.rstrip("/")
+
+    def request(self, method, url, kind="telegram", **kwargs):
+        kwargs.setdefault("timeout", self.timeouts.get(kind, self.timeouts["telegram"]))
+        appel = _nom_appel(kind, url)
+        t0 = time.perf_counter()
+        try:
+            r = self.session.request(method, url, **kwargs)
+        except Exception:
+            metrics.incr("http_erreurs_total", appel=appel)
+            raise
+        # durée jusqu'aux en-têtes (le corps des réponses stream=True est lu ensuite)
+        metrics.observer("http_latence_secondes", time.perf_counter() - t0, appel=appel)
+        return r
+
+    def get(self, url, kind="drive", **kwargs):
+        return self.request("get", url, kind=kind, **kwargs)
+
+    def head(self, url, kind="probe", **kwargs):
+        return self.request("head", url, kind=kind, **kwargs)
+
+    def post(self, url, kind="telegram", **kwargs):
+        return self.request("post", url, kind=kind, **kwargs)
+
+    def telegram_url(self, token, method):
+        return f"{self.telegram_base}/bot{token}/{method}"
+
+    def close(self):
+        try:
+            self.session.close()
+        except Exception:
+            pass
+
+
+_lock = threading.Lock()
+_transport = None
+
+
+def get_transport():
+    """Transport courant (créé à la première utilisation)."""
+    global _transport
+    with _lock:
+        if _transport is None:
+            _transport = Transport()
+        return _transport
+
+
+def set_transport(t):
+    """Remplace le transport courant (ex: Transport(telegram_base="http://127.0.0.1:8081"))."""
+    global _transport
+    with _lock:
+        old, _transport = _transport, t
+    if old is not None and old is not t:
+        old.close()
+    return t